@@ -0,0 +1,27 @@
+"""
+Cursors over the item_changes log, shared by everything that follows it
+(the market change feed in app/routers/market.py, the similar-items index).
+
+Postgres hands out change ids at INSERT but they become visible at COMMIT, so a
+slow transaction can land below a cursor we already handed out. A cursor is
+therefore held back before any change younger than CHANGES_SETTLE_SECONDS:
+those changes are read now AND again next time (applying them twice is harmless).
+"""
+from datetime import datetime, timedelta, timezone
+
+CHANGES_SETTLE_SECONDS = 5
+
+
+def settled_cursor(changes, cursor, floor=0):
+    """
+    `cursor`, held back to just before the first of `changes` ((id, created_at) pairs,
+    oldest first) that may still have older ids in flight; never below `floor`.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=CHANGES_SETTLE_SECONDS)
+    for change_id, created_at in changes:
+        if created_at is not None and created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone.utc)  # SQLite stores UTC without a zone
+        if created_at is None or created_at > cutoff:
+            cursor = min(cursor, change_id - 1)
+            break
+    return max(floor, cursor)
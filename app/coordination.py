@@ -0,0 +1,324 @@
+"""
+Cross-worker coordination.
+
+Once we run more than one uvicorn worker (or more than one Render instance),
+anything kept in memory needs a way to hear about changes made elsewhere.
+This module gives every worker the same three tools:
+
+1. publish()/subscribe()   -> event fan-out to every worker (including this one)
+2. invalidate()/register_cache() -> cache invalidation on top of (1)
+3. is_leader()/run_as_leader()   -> one worker runs the schedulers
+4. exclusive()                   -> a short mutex around one-off work (schema setup, manual runs)
+
+Backends:
+- Postgres (DATABASE_URL set): LISTEN/NOTIFY + session advisory locks (leaders), transaction locks (mutex).
+- SQLite file (laptop mode): an events table polled by each worker + leases with expiry.
+"""
+import json
+import logging
+import os
+import select
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import closing, contextmanager
+
+from app.database import DATABASE_URL, engine
+from app.logs import get_logger, log_event
+
+logger = get_logger(__name__)
+
+# --- 1. SETTINGS ---
+CHANNEL = "fliptrybe_events"
+COORDINATION_DB = os.getenv("COORDINATION_DB", "./fliptrybe_coord.db")
+POLL_SECONDS = float(os.getenv("COORDINATION_POLL_SECONDS", "0.1"))
+LEASE_SECONDS = float(os.getenv("COORDINATION_LEASE_SECONDS", "15"))
+# Postgres NOTIFY payloads are capped at 8000 bytes; keep events small (IDs, not rows).
+MAX_PAYLOAD_BYTES = 7900
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class _Base:
+    def __init__(self):
+        self._handlers = {}
+        self._caches = {}
+        self._leading = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    # --- FAN-OUT ---
+    def subscribe(self, channel: str, callback):
+        """callback(payload: dict) runs on the coordinator thread for events from ANY worker."""
+        with self._lock:
+            self._handlers.setdefault(channel, []).append(callback)
+
+    def publish(self, channel: str, payload: dict):
+        message = json.dumps({"c": channel, "p": payload, "w": WORKER_ID}, separators=(",", ":"))
+        if len(message.encode()) > MAX_PAYLOAD_BYTES:
+            raise ValueError(f"Event for '{channel}' is too large; publish IDs, not rows")
+        self._send(message)
+
+    def _dispatch(self, message: str):
+        try:
+            event = json.loads(message)
+        except ValueError:
+            return
+        for callback in list(self._handlers.get(event.get("c"), ())):
+            try:
+                callback(event.get("p") or {})
+            except Exception as e:
+                log_event(logger, "coordination.handler_failed", logging.ERROR, channel=event.get("c"), error=str(e))
+
+    # --- CACHE INVALIDATION ---
+    def register_cache(self, name: str, invalidate):
+        """invalidate(key or None) is called on every worker when anyone calls invalidate(name, key)."""
+        self._caches[name] = invalidate
+
+    def invalidate(self, name: str, key=None):
+        self.publish("cache.invalidate", {"name": name, "key": key})
+
+    def _on_invalidate(self, payload):
+        handler = self._caches.get(payload.get("name"))
+        if handler:
+            handler(payload.get("key"))
+
+    # --- LEADER ELECTION ---
+    def is_leader(self, role: str) -> bool:
+        return role in self._leading
+
+    def try_lead(self, role: str) -> bool:
+        """Claims (or keeps) leadership of `role`. Only one worker across the deployment wins."""
+        return self._try_lead(role)
+
+    def run_as_leader(self, role: str, fn, interval: float):
+        """Runs fn() every `interval` seconds, but only on whichever worker currently leads `role`."""
+
+        def loop():
+            while not self._stop.is_set():
+                if self._try_lead(role):
+                    try:
+                        fn()
+                    except Exception as e:
+                        log_event(logger, "coordination.job_failed", logging.ERROR, role=role, error=str(e))
+                self._stop.wait(interval)
+
+        self._spawn(loop, f"leader-{role}")
+
+    # --- MUTEX ---
+    @contextmanager
+    def exclusive(self, name: str, wait: bool = True):
+        """
+        Holds a deployment-wide lock on `name` for the duration of the block, then lets it go.
+        Yields True when held; with wait=False yields False instead of waiting for the current holder.
+        Unlike try_lead(), nothing is kept afterwards, so don't use it to pick a scheduler.
+        """
+        with self._exclusive(name, wait) as held:
+            yield held
+
+    # --- LIFECYCLE ---
+    def start(self):
+        self.subscribe("cache.invalidate", self._on_invalidate)
+        self._spawn(self._listen, "coordination-listener")
+        log_event(logger, "coordination.started", backend=type(self).__name__, worker=WORKER_ID)
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=2)
+        self._threads.clear()
+
+    def _spawn(self, target, name):
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+
+# --- 2. POSTGRES (LISTEN/NOTIFY + advisory locks) ---
+class PostgresCoordinator(_Base):
+    def __init__(self):
+        super().__init__()
+        self._conn = None
+        self._conn_lock = threading.Lock()
+
+    def _connection(self):
+        # One dedicated autocommit connection per worker: it LISTENs and it owns the advisory locks,
+        # so a worker that dies releases its leadership with its connection.
+        if self._conn is None:
+            raw = engine.raw_connection()
+            raw.detach()
+            raw.driver_connection.autocommit = True
+            with raw.cursor() as cur:
+                cur.execute(f"LISTEN {CHANNEL}")
+            self._conn = raw
+        return self._conn
+
+    def _send(self, message):
+        with engine.connect() as conn:
+            conn.exec_driver_sql("SELECT pg_notify(%s, %s)", (CHANNEL, message))
+            conn.commit()
+
+    def _try_lead(self, role):
+        if role in self._leading:
+            return True
+        with self._conn_lock:
+            with self._connection().cursor() as cur:
+                cur.execute("SELECT pg_try_advisory_lock(%s)", (zlib.crc32(role.encode()),))
+                won = cur.fetchone()[0]
+        if won:
+            self._leading.add(role)
+            log_event(logger, "coordination.leader", role=role, worker=WORKER_ID)
+        return won
+
+    @contextmanager
+    def _exclusive(self, name, wait):
+        # Transaction-scoped: released at commit/rollback, or when the connection dies.
+        key = zlib.crc32(f"lock:{name}".encode())
+        with engine.connect() as conn, conn.begin():
+            if wait:
+                conn.exec_driver_sql("SELECT pg_advisory_xact_lock(%s)", (key,))
+                held = True
+            else:
+                held = conn.exec_driver_sql("SELECT pg_try_advisory_xact_lock(%s)", (key,)).scalar()
+            yield held
+
+    def _listen(self):
+        while not self._stop.is_set():
+            try:
+                with self._conn_lock:
+                    pg = self._connection().driver_connection
+                if select.select([pg], [], [], 1.0) == ([], [], []):
+                    continue
+                with self._conn_lock:
+                    pg.poll()
+                    notifies = list(pg.notifies)
+                    pg.notifies.clear()
+            except Exception as e:
+                # Connection dropped: our advisory locks went with it, so give up leadership and reconnect.
+                log_event(logger, "coordination.reconnect", logging.WARNING, error=str(e))
+                with self._conn_lock:
+                    self._conn = None
+                    self._leading.clear()
+                self._stop.wait(1.0)
+                continue
+            for note in notifies:
+                self._dispatch(note.payload)
+
+    def stop(self):
+        super().stop()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+# --- 3. SQLITE FILE FALLBACK (Polling + expiring leases) ---
+class SQLiteCoordinator(_Base):
+    def __init__(self, path=COORDINATION_DB):
+        super().__init__()
+        self._path = path
+        self._cursor = None
+
+    def _connect(self):
+        db = sqlite3.connect(self._path, timeout=5, isolation_level=None)
+        if self._cursor is None:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS events (id INTEGER PRIMARY KEY AUTOINCREMENT, body TEXT, created REAL)")
+            db.execute("CREATE TABLE IF NOT EXISTS leases (role TEXT PRIMARY KEY, holder TEXT, expires REAL)")
+            # Start after whatever is already there; old events were for workers that no longer exist.
+            self._cursor = db.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+        return db
+
+    def _send(self, message):
+        with closing(self._connect()) as db:
+            db.execute("INSERT INTO events (body, created) VALUES (?, ?)", (message, time.time()))
+
+    def _try_lead(self, role):
+        now = time.time()
+        with closing(self._connect()) as db:
+            db.execute("INSERT OR IGNORE INTO leases (role, holder, expires) VALUES (?, '', 0)", (role,))
+            won = db.execute(
+                "UPDATE leases SET holder = ?, expires = ? WHERE role = ? AND (holder = ? OR expires < ?)",
+                (WORKER_ID, now + LEASE_SECONDS, role, WORKER_ID, now),
+            ).rowcount == 1
+        if won and role not in self._leading:
+            log_event(logger, "coordination.leader", role=role, worker=WORKER_ID)
+        if won:
+            self._leading.add(role)
+        else:
+            self._leading.discard(role)
+        return won
+
+    @contextmanager
+    def _exclusive(self, name, wait):
+        role, holder = f"lock:{name}", f"{WORKER_ID}:{threading.get_ident()}"
+
+        def claim():
+            now = time.time()
+            with closing(self._connect()) as db:
+                db.execute("INSERT OR IGNORE INTO leases (role, holder, expires) VALUES (?, '', 0)", (role,))
+                return db.execute(
+                    "UPDATE leases SET holder = ?, expires = ? WHERE role = ? AND (holder = ? OR expires < ?)",
+                    (holder, now + LEASE_SECONDS, role, holder, now),
+                ).rowcount == 1
+
+        held = claim()
+        while not held and wait:
+            time.sleep(POLL_SECONDS)
+            held = claim()
+        if not held:
+            yield False
+            return
+
+        # Keep the lease alive while the block runs; a worker that dies lets it lapse.
+        done = threading.Event()
+
+        def renew():
+            while not done.wait(LEASE_SECONDS / 3):
+                claim()
+
+        renewer = threading.Thread(target=renew, name=f"lock-{name}", daemon=True)
+        renewer.start()
+        try:
+            yield True
+        finally:
+            done.set()
+            renewer.join(timeout=2)
+            with closing(self._connect()) as db:
+                db.execute("UPDATE leases SET expires = 0 WHERE role = ? AND holder = ?", (role, holder))
+
+    def _listen(self):
+        db = self._connect()
+        last_prune = last_renew = time.monotonic()
+        try:
+            while not self._stop.is_set():
+                rows = db.execute("SELECT id, body FROM events WHERE id > ? ORDER BY id", (self._cursor,)).fetchall()
+                for event_id, body in rows:
+                    self._cursor = event_id
+                    self._dispatch(body)
+
+                now = time.monotonic()
+                # Renew leases well before they lapse so leadership doesn't flap.
+                if now - last_renew > LEASE_SECONDS / 3:
+                    for role in list(self._leading):
+                        self._try_lead(role)
+                    last_renew = now
+                if now - last_prune > 60:
+                    db.execute("DELETE FROM events WHERE created < ?", (time.time() - 300,))
+                    last_prune = now
+
+                self._stop.wait(POLL_SECONDS)
+        finally:
+            db.close()
+
+    def stop(self):
+        super().stop()
+        if self._leading:
+            with closing(self._connect()) as db:
+                db.execute("UPDATE leases SET expires = 0 WHERE holder = ?", (WORKER_ID,))
+            self._leading.clear()
+
+
+coordinator = PostgresCoordinator() if DATABASE_URL.startswith("postgresql") else SQLiteCoordinator()
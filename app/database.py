@@ -1,21 +1,38 @@
+import itertools
 import os
-from sqlalchemy import create_engine
+import threading
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import sessionmaker, declarative_base
 
+
+def _normalise(url):
+    # Fix for Render's URL format (postgres:// -> postgresql://)
+    if url.startswith("postgres://"):
+        return url.replace("postgres://", "postgresql://", 1)
+    return url
+
+
+def _make_engine(url):
+    if url.startswith("sqlite"):
+        return create_engine(url, connect_args={"check_same_thread": False})
+    return create_engine(url, pool_pre_ping=True)
+
+
 # 1. GET THE URL FROM RENDER (OR USE LOCAL FILE IF ON LAPTOP)
 DATABASE_URL = os.getenv("DATABASE_URL")
 
 if DATABASE_URL:
     # 🌍 CLOUD MODE (PostgreSQL)
-    # Fix for Render's URL format (postgres:// -> postgresql://)
-    if DATABASE_URL.startswith("postgres://"):
-        DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
-        
-    engine = create_engine(DATABASE_URL)
+    DATABASE_URL = _normalise(DATABASE_URL)
+    engine = _make_engine(DATABASE_URL)
 else:
     # 💻 LAPTOP MODE (SQLite)
     DATABASE_URL = "sqlite:///./fliptrybe_v5.db"
-    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+    engine = _make_engine(DATABASE_URL)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
@@ -26,4 +43,143 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+# 2. READ REPLICAS (Optional)
+# DATABASE_REPLICA_URLS="postgres://replica-1/...,postgres://replica-2/..." sends the
+# read-only handlers (feed, dashboards, driver status) to replicas. Writes always hit the primary.
+REPLICA_URLS = [_normalise(u.strip()) for u in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if u.strip()]
+# After a client writes, its reads stay on the primary this long (covers replication lag).
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+REPLICA_HEALTH_SECONDS = float(os.getenv("REPLICA_HEALTH_SECONDS", "5"))
+STICKY_COOKIE = "ft_rw"
+
+# Per-request read-your-writes state, set by ReadYourWritesMiddleware.
+_rw_state = ContextVar("fliptrybe_rw_state", default=None)
+
+
+class ReplicaRouter:
+    def __init__(self, urls):
+        self.engines = [_make_engine(url) for url in urls]
+        self.sessions = [sessionmaker(autocommit=False, autoflush=False, bind=e) for e in self.engines]
+        self.healthy = set(range(len(self.engines)))
+        self._turn = itertools.count()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def pick(self):
+        """Round-robin over healthy replicas. None means 'use the primary'."""
+        healthy = sorted(self.healthy)
+        if not healthy:
+            return None
+        return healthy[next(self._turn) % len(healthy)]
+
+    def mark_down(self, index):
+        self.healthy.discard(index)
+
+    def check(self):
+        for index, replica in enumerate(self.engines):
+            try:
+                with replica.connect() as conn:
+                    conn.execute(text("SELECT 1"))
+                self.healthy.add(index)
+            except Exception:
+                self.healthy.discard(index)
+
+    def start(self):
+        if not self.engines or self._thread:
+            return
+
+        def loop():
+            while not self._stop.wait(REPLICA_HEALTH_SECONDS):
+                self.check()
+
+        self.check()
+        self._thread = threading.Thread(target=loop, name="replica-health", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+
+replicas = ReplicaRouter(REPLICA_URLS)
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _remember_write(session, flush_context):
+    state = _rw_state.get()
+    if state is not None:
+        state["wrote"] = True
+
+
+def open_read_session():
+    """
+    (session, replica index or None) for READ-ONLY work.
+    Goes to a healthy replica unless this client wrote recently (read-your-writes) or none are up.
+    """
+    state = _rw_state.get()
+    sticky = state is not None and state["sticky"]
+    target = None if sticky else replicas.pick()
+    return (SessionLocal() if target is None else replicas.sessions[target]()), target
+
+
+def get_read_db():
+    """Session for READ-ONLY handlers (see open_read_session)."""
+    db, target = open_read_session()
+    try:
+        yield db
+    except OperationalError:
+        # Failover: drop the replica until the health check sees it again.
+        if target is not None:
+            replicas.mark_down(target)
+        raise
+    finally:
+        db.close()
+
+
+class ReadYourWritesMiddleware:
+    """
+    After any request that flushed to the primary, sets a short-lived cookie.
+    While it is valid, get_read_db() keeps that client on the primary.
+    Cookie-based, so it works across workers and instances without shared state.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not replicas.engines:
+            return await self.app(scope, receive, send)
+
+        state = {"sticky": _sticky_from_cookie(scope["headers"]), "wrote": False}
+        token = _rw_state.set(state)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and state["wrote"]:
+                until = time.time() + REPLICA_STICKY_SECONDS
+                cookie = f"{STICKY_COOKIE}={until:.0f}; Max-Age={int(REPLICA_STICKY_SECONDS) + 1}; Path=/; SameSite=Lax"
+                message["headers"] = list(message.get("headers", [])) + [(b"set-cookie", cookie.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _rw_state.reset(token)
+
+
+def _sticky_from_cookie(headers):
+    for key, value in headers:
+        if key != b"cookie":
+            continue
+        for part in value.decode("latin-1").split(";"):
+            name, _, raw = part.strip().partition("=")
+            if name == STICKY_COOKIE:
+                try:
+                    return float(raw) > time.time()
+                except ValueError:
+                    return False
+    return False
@@ -0,0 +1,168 @@
+"""
+Multi-drop dispatcher.
+
+initiate_payment only queues a Delivery. Every DISPATCH_WINDOW_SECONDS the
+worker that leads "dispatcher" collects the queued deliveries, builds
+multi-stop routes (app/routing.py) in a separate process so the solver never
+holds the GIL of a worker serving requests, and gives each route to one
+AVAILABLE driver. Drivers hear about it through the "route.assigned" event.
+"""
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy import update
+
+from app import quotes, routing
+from app.coordination import coordinator
+from app.database import SessionLocal
+from app.logs import get_logger, log_event
+from app.models import Delivery, DeliveryStatus, Driver, Route
+
+logger = get_logger(__name__)
+
+# --- 1. SETTINGS ---
+DISPATCH_WINDOW_SECONDS = float(os.getenv("DISPATCH_WINDOW_SECONDS", "15"))
+# Deliveries one driver carries per trip
+VEHICLE_CAPACITY = {"Bike": 3, "Van": 12}
+# Oldest first; anything beyond this waits for the next window
+MAX_BATCH = int(os.getenv("DISPATCH_MAX_BATCH", "5000"))
+SOLVER_TIMEOUT_SECONDS = 60
+
+_pool = None
+
+
+def _solver():
+    global _pool
+    if _pool is None:
+        # spawn: the child imports app.routing (NumPy only), not the app, its engines or threads.
+        _pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+# --- 2. ONE DISPATCH WINDOW ---
+def _stops(plan, deliveries):
+    stops = [{"kind": "PICKUP", "place": quotes.PLACES[p], "delivery_ids": ids} for p, ids in plan["pickups"]]
+    for place, delivery_id in plan["drops"]:
+        stops.append({"kind": "DROP", "place": quotes.PLACES[place], "delivery_ids": [delivery_id],
+                      "buyer_email": deliveries[delivery_id].buyer_email})
+    return stops
+
+
+def _single_stop_plan(delivery):
+    # Legacy orders priced from a client distance have no places to route between.
+    return {
+        "stops": [
+            {"kind": "PICKUP", "place": delivery.origin, "delivery_ids": [delivery.id]},
+            {"kind": "DROP", "place": delivery.destination, "delivery_ids": [delivery.id],
+             "buyer_email": delivery.buyer_email},
+        ],
+        "drop_ids": [delivery.id],
+        "distance_km": delivery.distance_km,
+    }
+
+
+def _plan(vehicle_type, deliveries):
+    """Routes for one vehicle type, biggest first. Solved in the worker process."""
+    routable, plans = [], []
+    for d in deliveries.values():
+        o, t = quotes.place_index(d.origin), quotes.place_index(d.destination)
+        if o < 0 or t < 0:
+            plans.append(_single_stop_plan(d))
+        else:
+            routable.append((d.id, o, t))
+
+    if routable:
+        solved = _solver().submit(
+            routing.solve, routable, quotes.DISTANCE_KM, VEHICLE_CAPACITY[vehicle_type]
+        ).result(timeout=SOLVER_TIMEOUT_SECONDS)
+        for plan in solved:
+            plans.append({
+                "stops": _stops(plan, deliveries),
+                "drop_ids": [delivery_id for _, delivery_id in plan["drops"]],
+                "distance_km": plan["distance_km"],
+            })
+    plans.sort(key=lambda p: len(p["drop_ids"]), reverse=True)
+    return plans
+
+
+def dispatch_once():
+    """Assigns as many queued deliveries as there are free drivers. Returns the number of routes created."""
+    started = time.perf_counter()
+    assigned = []
+    db = SessionLocal()
+    try:
+        for vehicle_type in VEHICLE_CAPACITY:
+            drivers = db.query(Driver.id).filter(
+                Driver.vehicle_type == vehicle_type, Driver.status == "AVAILABLE"
+            ).order_by(Driver.id).all()
+            if not drivers:
+                continue
+            queued = db.query(Delivery).filter(
+                Delivery.vehicle_type == vehicle_type, Delivery.status == DeliveryStatus.QUEUED
+            ).order_by(Delivery.id).limit(MAX_BATCH).all()
+            if not queued:
+                continue
+
+            plans = _plan(vehicle_type, {d.id: d for d in queued})
+            updates = []
+            free = [row.id for row in drivers]
+            for plan in plans:
+                # Claim the driver atomically: they may have gone offline since we looked.
+                while free:
+                    driver_id = free.pop(0)
+                    claimed = db.query(Driver).filter(
+                        Driver.id == driver_id, Driver.status == "AVAILABLE"
+                    ).update({"status": "BUSY"}, synchronize_session=False)
+                    if claimed:
+                        break
+                else:
+                    break
+                route = Route(
+                    driver_id=driver_id,
+                    vehicle_type=vehicle_type,
+                    stops=json.dumps(plan["stops"], separators=(",", ":")),
+                    distance_km=plan["distance_km"],
+                    status="ACTIVE",
+                )
+                db.add(route)
+                db.flush()
+                updates += [
+                    {"id": delivery_id, "status": DeliveryStatus.ASSIGNED, "route_id": route.id, "stop_seq": seq}
+                    for seq, delivery_id in enumerate(plan["drop_ids"])
+                ]
+                assigned.append((driver_id, route.id, len(plan["drop_ids"])))
+            if updates:
+                # One executemany (bulk UPDATE by primary key) instead of a round trip per delivery
+                db.execute(update(Delivery), updates)
+            db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    for driver_id, route_id, drops in assigned:
+        coordinator.publish("route.assigned", {"driver_id": driver_id, "route_id": route_id})
+    if assigned:
+        log_event(
+            logger, "dispatch.assigned",
+            routes=len(assigned),
+            deliveries=sum(drops for _, _, drops in assigned),
+            ms=round((time.perf_counter() - started) * 1000, 1),
+        )
+    return len(assigned)
+
+
+# --- 3. LIFECYCLE ---
+def start():
+    coordinator.run_as_leader("dispatcher", dispatch_once, DISPATCH_WINDOW_SECONDS)
+
+
+def stop():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -0,0 +1,159 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# --- 1. SETTINGS ---
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Records waiting for the writer thread. When full we DROP (and count) instead of blocking a request.
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# Noisy diagnostic INFO events are sampled: 0.1 = keep roughly 1 in 10.
+# Never sample events that carry something a person needs (e.g. whatsapp.sent is how links get delivered).
+# Override with LOG_SAMPLE_RATES="driver.login=0.5,route.completed=0.25"
+SAMPLE_RATES = {
+    "driver.login": 0.1,
+}
+for pair in filter(None, os.getenv("LOG_SAMPLE_RATES", "").split(",")):
+    name, _, rate = pair.partition("=")
+    SAMPLE_RATES[name.strip()] = float(rate)
+
+# The request ID of the request being served (set by RequestIdMiddleware).
+request_id_var = ContextVar("fliptrybe_request_id", default=None)
+
+
+# --- 2. FORMATTING (One JSON object per line) ---
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.msg,
+        }
+        if getattr(record, "request_id", None):
+            payload["request_id"] = record.request_id
+        payload.update(getattr(record, "fields", None) or {})
+        if record.exc_text:
+            payload["exc"] = record.exc_text
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+# --- 3. THE REQUEST-THREAD SIDE (Cheap: tag, sample, enqueue) ---
+class _ContextFilter(logging.Filter):
+    def filter(self, record):
+        # Runs on the CALLING thread, so the request's context vars are still visible here.
+        rate = SAMPLE_RATES.get(record.msg) if record.levelno <= logging.INFO else None
+        if rate is not None:
+            if random.random() >= rate:
+                return False
+            record.fields = dict(getattr(record, "fields", None) or {}, sample_rate=rate)
+        record.request_id = request_id_var.get()
+        return True
+
+
+class _DroppingQueueHandler(QueueHandler):
+    dropped = 0
+
+    def prepare(self, record):
+        # Only render what the writer thread can't: the message and any traceback.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _DroppingQueueHandler.dropped += 1
+
+
+# --- 4. WIRING ---
+_listener = None
+
+
+def _configure():
+    global _listener
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter())
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    handler = _DroppingQueueHandler(log_queue)
+    handler.addFilter(_ContextFilter())
+
+    root = logging.getLogger("fliptrybe")
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(handler)
+    root.propagate = False
+
+    _listener = QueueListener(log_queue, stream, respect_handler_level=False)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Flushes everything still queued (call on server shutdown)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"fliptrybe.{name.rsplit('.', 1)[-1]}")
+
+
+def log_event(logger: logging.Logger, event: str, level: int = logging.INFO, **fields):
+    """
+    Structured log line: log_event(logger, "order.received", vehicle="Bike", km=4.2)
+    becomes {"event": "order.received", "vehicle": "Bike", "km": 4.2, "request_id": ...}
+    """
+    if logger.isEnabledFor(level):
+        # makeRecord + handle skips Logger.findCaller's stack walk, the slowest part of a log call.
+        record = logger.makeRecord(logger.name, level, "", 0, event, None, None, extra={"fields": fields})
+        logger.handle(record)
+
+
+_configure()
+
+
+# --- 5. REQUEST IDS (Pure ASGI middleware) ---
+class RequestIdMiddleware:
+    """Reuses the caller's X-Request-ID (or makes one) and echoes it back on the response."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        incoming = None
+        for key, value in scope["headers"]:
+            if key == b"x-request-id":
+                incoming = value.decode("latin-1")[:64]
+                break
+        rid = incoming or uuid.uuid4().hex[:16]
+        token = request_id_var.set(rid)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-request-id", rid.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id_var.reset(token)
@@ -1,71 +1,132 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import FileResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles  # 🆕 IMPORT THIS
 from contextlib import asynccontextmanager
+import logging
 import os
+import socket
+import uuid
+from sqlalchemy import inspect
 
-from app.database import engine, Base, SessionLocal
+from app.database import engine, Base, SessionLocal, ReadYourWritesMiddleware, replicas
 from app.models import Driver, SystemSetting, User, UserRole
 from app.routers import payment, driver, admin, market, agent_office
+from app.profiling import MetricsMiddleware, instrument_engine, registry
+from app.logs import RequestIdMiddleware, get_logger, log_event, shutdown_logging
+from app.coordination import coordinator
+from app import dispatch, ratings, recommendations, telemetry, tiering, webhooks
+
+logger = get_logger("main")
+
+# One token per launch, shared by that launch's workers: the first one to reset records it here.
+# uvicorn --workers can't hand workers anything, so multi-worker start commands set FLIPTRYBE_LAUNCH_ID
+# (see render.yaml). Without it every process is its own launch, i.e. a single worker resets on each start.
+LAUNCH_ID = os.getenv("FLIPTRYBE_LAUNCH_ID") or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}"
+RESET_MARKER = "schema_reset_by"
+
+def _reset_this_launch() -> bool:
+    if not inspect(engine).has_table(SystemSetting.__tablename__):
+        return False
+    db = SessionLocal()
+    try:
+        marker = db.get(SystemSetting, RESET_MARKER)
+        return marker is not None and marker.value == LAUNCH_ID
+    finally:
+        db.close()
 
 # --- 1. SYSTEM STARTUP ---
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    print("🚀 Flip Trybe Server Starting Up...")
+    log_event(logger, "server.starting")
+    coordinator.start()
+    replicas.start()
     
     # ⚠️ DATABASE RESET (Only for Development)
-    Base.metadata.drop_all(bind=engine)
-    Base.metadata.create_all(bind=engine)
-    
-    # SEED DATA
-    db = SessionLocal()
-    try:
-        # 1. Create Default Logistics Drivers
-        team = [
-            {"name": "Musa (Bike)", "phone": "08011111111", "vehicle": "Bike"},
-            {"name": "Chinedu (Van)", "phone": "08022222222", "vehicle": "Van"},
-        ]
-        for member in team:
-            db.add(Driver(name=member["name"], phone=member["phone"], vehicle_type=member["vehicle"], status="AVAILABLE"))
-
-        # 2. Create Agent Chidi
-        agent = User(
-            full_name="Agent Chidi", 
-            phone="080AGENT001", 
-            role=UserRole.AGENT, 
-            email="agent@fliptrybe.com",
-            state="Lagos",
-            city="Ikorodu",
-            rating=5.0,
-            wallet_balance=0.0
-        )
-        db.add(agent)
+    # RESET_DB_ON_STARTUP=0 keeps existing data (benchmarks, staging).
+    # Every worker runs create_all (it's idempotent) so none starts serving before the schema exists;
+    # the lock only stops them racing. The reset happens once per launch, not once per worker.
+    with coordinator.exclusive("db-schema"):
+        reset = os.getenv("RESET_DB_ON_STARTUP", "1") == "1" and not _reset_this_launch()
+        if reset:
+            Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+
+        # SEED DATA (Only on a fresh database)
+        if reset:
+            db = SessionLocal()
+            try:
+                # 1. Create Default Logistics Drivers
+                team = [
+                    {"name": "Musa (Bike)", "phone": "08011111111", "vehicle": "Bike"},
+                    {"name": "Chinedu (Van)", "phone": "08022222222", "vehicle": "Van"},
+                ]
+                for member in team:
+                    db.add(Driver(name=member["name"], phone=member["phone"], vehicle_type=member["vehicle"], status="AVAILABLE"))
+
+                # 2. Create Agent Chidi
+                agent = User(
+                    full_name="Agent Chidi", 
+                    phone="080AGENT001", 
+                    role=UserRole.AGENT, 
+                    email="agent@fliptrybe.com",
+                    state="Lagos",
+                    city="Ikorodu",
+                    rating=5.0,
+                    wallet_balance=0.0
+                )
+                db.add(agent)
         
-        # 3. Create User Tunde
-        buyer = User(
-            full_name="Tunde Buyer", 
-            phone="080BUYER001", 
-            role=UserRole.USER, 
-            email="tunde@fliptrybe.com",
-            state="Lagos",
-            city="Ikeja",
-            rating=3.0
-        )
-        db.add(buyer)
+                # 3. Create User Tunde
+                buyer = User(
+                    full_name="Tunde Buyer", 
+                    phone="080BUYER001", 
+                    role=UserRole.USER, 
+                    email="tunde@fliptrybe.com",
+                    state="Lagos",
+                    city="Ikeja",
+                    rating=3.0
+                )
+                db.add(buyer)
         
-        db.add(SystemSetting(key="payment_mode", value="MANUAL"))
-        db.commit()
-        print("✅ Database Reset & Seeded")
-    except Exception as e:
-        print(f"❌ Startup Error: {e}")
-    finally:
-        db.close()
+                db.add(SystemSetting(key="payment_mode", value="MANUAL"))
+                db.add(SystemSetting(key=RESET_MARKER, value=LAUNCH_ID))
+                db.commit()
+                log_event(logger, "server.seeded")
+            except Exception as e:
+                log_event(logger, "server.seed_failed", logging.ERROR, error=str(e))
+            finally:
+                db.close()
+
+    # Multi-drop dispatcher (runs on whichever worker leads "dispatcher")
+    dispatch.start()
+    # Hot/cold archiver (leader "archiver")
+    tiering.start()
+    # Paystack webhook ingest + worker (every worker runs one; claims keep them apart)
+    webhooks.start()
+    # "Similar items" index (per worker, in memory)
+    recommendations.start()
+    # Lister ratings: events folded in memory, written back every RATING_FLUSH_SECONDS
+    ratings.start()
+    # Driver GPS pings: buffered per trip, written as packed segments
+    telemetry.start()
     
     yield 
-    print("🛑 Server Shutting Down...")
+    log_event(logger, "server.stopping")
+    ratings.stop()  # final flush publishes, so before the coordinator goes
+    replicas.stop()
+    coordinator.stop()
+    dispatch.stop()
+    tiering.stop()
+    webhooks.stop()
+    recommendations.stop()
+    telemetry.stop()
+    shutdown_logging()
 
 app = FastAPI(lifespan=lifespan)
+for db_engine in [engine, *replicas.engines]:
+    instrument_engine(db_engine)
 
 # --- 2. SECURITY ---
 app.add_middleware(
@@ -76,6 +137,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Feed snapshots and deltas are mostly repeated field values; compress them for mobile data.
+# (Starlette skips text/event-stream, so the driver route stream is unaffected.)
+app.add_middleware(GZipMiddleware, minimum_size=1000)
+
+# --- 2b. OBSERVABILITY (Latency, SQL counts, N+1) ---
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(RequestIdMiddleware)
+app.add_middleware(ReadYourWritesMiddleware)
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 # --- 3. CONNECT ROUTERS ---
 app.include_router(payment.router, prefix="/api/payment", tags=["Payment"])
 app.include_router(driver.router, prefix="/api/driver", tags=["Driver"])
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, DateTime, Enum, Text
+from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, DateTime, Enum, Text, Table, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -22,7 +22,9 @@ class OrderStatus(str, enum.Enum):
 
 class WithdrawalStatus(str, enum.Enum):
     PENDING = "PENDING"
+    PROCESSING = "PROCESSING"  # Claimed by a payout run / sent to the provider
     PROCESSED = "PROCESSED"
+    FAILED = "FAILED"          # Provider rejected it; amount returned to the wallet
 
 # --- USERS ---
 class User(Base):
@@ -31,6 +33,7 @@ class User(Base):
     id = Column(Integer, primary_key=True, index=True)
     full_name = Column(String, nullable=False)
     phone = Column(String, unique=True, index=True)
+    email = Column(String, nullable=True)
     role = Column(Enum(UserRole), default=UserRole.USER)
     
     # 📍 LOCATION & RANK
@@ -58,8 +61,19 @@ class Withdrawal(Base):
     fee_platform = Column(Float)     # 5% = 5,000
     amount_net = Column(Float)       # Sent = 95,000
     
-    status = Column(Enum(WithdrawalStatus), default=WithdrawalStatus.PENDING)
+    status = Column(Enum(WithdrawalStatus), default=WithdrawalStatus.PENDING, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    # Destination, as entered on the request (the profile may change later)
+    bank_name = Column(String, nullable=True)
+    account_number = Column(String, nullable=True)
+
+    # Payout tracking (app/payouts.py)
+    batch_id = Column(String, nullable=True, index=True)
+    claimed_at = Column(DateTime(timezone=True), nullable=True)  # Last time a run took (or re-checked) it
+    transfer_code = Column(String, nullable=True)
+    failure_reason = Column(String, nullable=True)
+    processed_at = Column(DateTime(timezone=True), nullable=True)
     
     agent = relationship("User", back_populates="withdrawals")
 
@@ -70,7 +84,7 @@ class Item(Base):
     id = Column(Integer, primary_key=True, index=True)
     type = Column(Enum(ItemCategory), default=ItemCategory.DECLUTTER)
     title = Column(String, index=True)
-    description = Text()
+    description = Column(Text)
     price = Column(Float)
     
     # Location
@@ -89,9 +103,35 @@ class Item(Base):
     payout_amount = Column(Float, default=0.0)
     
     is_sold = Column(Boolean, default=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
     lister_id = Column(Integer, ForeignKey("users.id"))
     lister = relationship("User", back_populates="items")
 
+# --- ITEM CHANGE LOG (Cursor for GET /api/market/changes) ---
+class ItemChangeKind(str, enum.Enum):
+    CREATED = "CREATED"
+    UPDATED = "UPDATED"
+    SOLD = "SOLD"
+
+class ItemChange(Base):
+    __tablename__ = "item_changes"
+    id = Column(Integer, primary_key=True, index=True)  # Monotonic: this IS the client's cursor
+    item_id = Column(Integer, ForeignKey("items.id"), index=True)
+    kind = Column(Enum(ItemChangeKind))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+# --- LISTER REPUTATION (app/ratings.py keeps these; User.rating is derived from them) ---
+class ListerStats(Base):
+    __tablename__ = "lister_stats"
+    lister_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    # Exponentially decayed counts, all as of decayed_at
+    confirmed = Column(Float, default=0.0)
+    cancelled = Column(Float, default=0.0)
+    completed = Column(Float, default=0.0)
+    responses = Column(Float, default=0.0)
+    response_hours = Column(Float, default=0.0)  # Sum over `responses`
+    decayed_at = Column(DateTime(timezone=True))
+
 # --- ORDERS ---
 class Order(Base):
     __tablename__ = "orders"
@@ -111,8 +151,111 @@ class Driver(Base):
     __tablename__ = "drivers"
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String)
+    phone = Column(String, unique=True, index=True)
+    vehicle_type = Column(String, index=True)  # "Bike" or "Van"
     status = Column(String)
+
 class SystemSetting(Base):
     __tablename__ = "settings"
     key = Column(String, primary_key=True)
-    value = Column(String)
\ No newline at end of file
+    value = Column(String)
+
+# --- DELIVERIES & ROUTES (Multi-drop dispatch) ---
+class DeliveryStatus(str, enum.Enum):
+    AWAITING_PAYMENT = "AWAITING_PAYMENT"  # Gateway mode, until Paystack confirms
+    QUEUED = "QUEUED"                      # Waiting for the next dispatch window
+    ASSIGNED = "ASSIGNED"                  # On a driver's route
+    DELIVERED = "DELIVERED"
+
+class Delivery(Base):
+    __tablename__ = "deliveries"
+    id = Column(Integer, primary_key=True, index=True)
+    reference = Column(String, unique=True, index=True)
+    buyer_email = Column(String)
+    vehicle_type = Column(String, index=True)
+    origin = Column(String)
+    destination = Column(String)
+    distance_km = Column(Float)
+    amount_ngn = Column(Integer)
+    status = Column(Enum(DeliveryStatus), default=DeliveryStatus.QUEUED, index=True)
+    route_id = Column(Integer, ForeignKey("routes.id"), nullable=True, index=True)
+    stop_seq = Column(Integer, nullable=True)  # Position of this drop on its route
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    route = relationship("Route", back_populates="deliveries")
+
+class Route(Base):
+    __tablename__ = "routes"
+    id = Column(Integer, primary_key=True, index=True)
+    driver_id = Column(Integer, ForeignKey("drivers.id"), index=True)
+    vehicle_type = Column(String)
+    stops = Column(Text)  # JSON list: [{"kind": "PICKUP"|"DROP", "place": ..., "delivery_ids": [...]}]
+    distance_km = Column(Float)
+    status = Column(String, default="ACTIVE", index=True)  # ACTIVE -> COMPLETED
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    deliveries = relationship("Delivery", back_populates="route")
+
+# --- TRIP TELEMETRY (app/telemetry.py) ---
+class TelemetrySegment(Base):
+    """A run of GPS pings from one driver on one route, delta-encoded into `data`."""
+    __tablename__ = "telemetry_segments"
+    id = Column(Integer, primary_key=True, index=True)
+    driver_id = Column(Integer, ForeignKey("drivers.id"))
+    route_id = Column(Integer, ForeignKey("routes.id"), index=True)
+    started_at = Column(DateTime(timezone=True))  # First ping; offsets in `data` are from here
+    ended_at = Column(DateTime(timezone=True))
+    points = Column(Integer)
+    last_lat = Column(Float)  # Last ping, readable without decoding
+    last_lon = Column(Float)
+    data = Column(LargeBinary)
+
+    __table_args__ = (Index("ix_telemetry_segments_driver_ended", "driver_id", "ended_at"),)
+
+# --- PAYSTACK WEBHOOK EVENTS (app/webhooks.py) ---
+class PaymentEventStatus(str, enum.Enum):
+    RECEIVED = "RECEIVED"      # Stored and acknowledged, not yet applied
+    PROCESSING = "PROCESSING"  # Claimed by a worker
+    PROCESSED = "PROCESSED"
+    IGNORED = "IGNORED"        # Unknown reference / already applied / event we don't handle
+    FAILED = "FAILED"          # e.g. amount paid doesn't match the delivery
+
+class PaymentEvent(Base):
+    __tablename__ = "payment_events"
+    id = Column(Integer, primary_key=True, index=True)
+    event = Column(String)      # "charge.success", "transfer.failed", ...
+    reference = Column(String)
+    payload = Column(Text)      # Raw signed body, as received
+    status = Column(Enum(PaymentEventStatus), default=PaymentEventStatus.RECEIVED, index=True)
+    note = Column(String, nullable=True)
+    claimed_at = Column(DateTime(timezone=True), nullable=True)
+    batch_id = Column(String, nullable=True, index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    processed_at = Column(DateTime(timezone=True), nullable=True)
+
+    # Paystack retries until it gets a 2xx: a redelivery hits this index and is dropped.
+    __table_args__ = (Index("uq_payment_events_event_reference", "event", "reference", unique=True),)
+
+
+# --- COLD TIER (app/tiering.py moves finished rows here) ---
+def _archive_table(model):
+    """Same columns as the hot table, no foreign keys (parents may be archived separately)."""
+    name = f"{model.__tablename__}_archive"
+    columns = [Column(c.name, c.type, primary_key=c.primary_key) for c in model.__table__.columns]
+    return Table(
+        name, Base.metadata, *columns,
+        Column("archived_at", DateTime(timezone=True), server_default=func.now()),
+        Index(f"ix_{name}_created_at", "created_at"),
+    )
+
+OrderArchive = _archive_table(Order)
+WithdrawalArchive = _archive_table(Withdrawal)
+ItemArchive = _archive_table(Item)
+
+class ArchiveRollup(Base):
+    """Running totals of everything archived, so dashboards never have to scan the cold tables."""
+    __tablename__ = "archive_rollups"
+    metric = Column(String, primary_key=True)                # e.g. "orders.CONFIRMED", "items.sold"
+    subject_id = Column(Integer, primary_key=True, default=0)  # 0 = platform-wide, else agent/lister id
+    total = Column(Float, default=0.0)
+    count = Column(Integer, default=0)
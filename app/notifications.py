@@ -1,15 +1,14 @@
-import logging
+from app.logs import get_logger, log_event
 
-# Setup logging to see messages in Render Dashboard
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+# JSON lines on stdout (Render Dashboard picks them up), written by the log thread
+logger = get_logger(__name__)
 
 def send_whatsapp(phone: str, message: str):
     """
     Simulates sending a WhatsApp message.
-    In V2, we will replace this print statement with the Twilio/InfoBip API.
+    In V2, we will replace this log line with the Twilio/InfoBip API.
     """
-    logger.info(f"🟢 [WHATSAPP to {phone}]: {message}")
+    log_event(logger, "whatsapp.sent", phone=phone, message=message)
 
 def notify_parties_of_sale(buyer_phone, buyer_name, seller_phone, seller_name, item_title, pickup_details):
     """
@@ -0,0 +1,377 @@
+"""
+Batched payouts for agent withdrawals.
+
+One run settles every PENDING withdrawal:
+
+1. CLAIM:     a batch of rows moves PENDING -> PROCESSING in one UPDATE whose
+              subquery uses FOR UPDATE SKIP LOCKED, so parallel runners (threads,
+              workers, instances) never claim the same row.
+2. TRANSFER:  the batch goes to the provider in bulk calls (Paystack: 100 per call).
+3. RECONCILE: statuses are written back in bulk; failed transfers refund the wallet.
+4. SWEEP:     before each run, rows PROCESSING for longer than PAYOUT_CLAIM_TIMEOUT_SECONDS
+              (provider error, crashed run, webhook that never came) are looked up with the
+              provider by reference: settled if it knows them, re-queued as PENDING if not.
+
+Providers are pluggable (PAYOUT_PROVIDER): "stub" settles in-process and never
+moves money (default); "paystack" uses Paystack's bulk recipient + bulk transfer APIs.
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import requests
+from sqlalchemy import bindparam, or_, select, update
+
+from app.database import SessionLocal
+from app.logs import get_logger, log_event
+from app.models import User, Withdrawal, WithdrawalStatus
+from app.routers.payment import PAYSTACK_BASE_URL, PAYSTACK_SECRET_KEY
+
+logger = get_logger(__name__)
+
+# --- 1. SETTINGS ---
+PAYOUT_PROVIDER = os.getenv("PAYOUT_PROVIDER", "stub")
+CLAIM_BATCH = int(os.getenv("PAYOUT_CLAIM_BATCH", "500"))
+# A PROCESSING row older than this is checked with the provider on the next run
+PAYOUT_CLAIM_TIMEOUT_SECONDS = float(os.getenv("PAYOUT_CLAIM_TIMEOUT_SECONDS", "900"))
+
+
+def transfer_reference(withdrawal_id):
+    # Deterministic, so a retried transfer is rejected by the provider as a duplicate instead of paid twice.
+    return f"fliptrybe-wd-{withdrawal_id}"
+
+
+# --- 2. PROVIDERS ---
+# transfer: {"reference", "amount_kobo", "name", "bank_name", "account_number", "reason"}
+# result:   {"reference", "status": "success" | "pending" | "failed", "transfer_code"?, "message"?}
+# verify(reference) -> result, or None if the provider never received that transfer
+class StubProvider:
+    """Answers like Paystack's bulk transfer API without calling it. Invalid NUBANs (not 10 digits) fail."""
+
+    max_batch = 100
+
+    def bulk_transfer(self, transfers):
+        results = []
+        for t in transfers:
+            account = t["account_number"] or ""
+            if len(account) == 10 and account.isdigit():
+                results.append({"reference": t["reference"], "status": "success", "transfer_code": f"TRF_stub_{t['reference']}"})
+            else:
+                results.append({"reference": t["reference"], "status": "failed", "message": "Invalid account number"})
+        return results
+
+    def verify(self, reference):
+        # Keeps no ledger and settles within bulk_transfer, so a row still PROCESSING never reached it.
+        return None
+
+
+class PaystackProvider:
+    """
+    POST /transferrecipient/bulk then POST /transfer/bulk (max 100 per call).
+    "pending" results stay PROCESSING until Paystack's transfer.success / transfer.failed event.
+    """
+
+    max_batch = 100
+
+    def __init__(self, base_url=PAYSTACK_BASE_URL, secret_key=PAYSTACK_SECRET_KEY):
+        self.base_url = base_url
+        self.session = requests.Session()
+        self.session.headers.update({"Authorization": f"Bearer {secret_key}", "Content-Type": "application/json"})
+        self._bank_codes = None
+        self._recipients = {}  # (bank_code, account_number) -> recipient_code
+        self._lock = threading.Lock()
+
+    def _call(self, method, path, **kwargs):
+        res = self.session.request(method, f"{self.base_url}{path}", timeout=30, **kwargs)
+        body = res.json()
+        if not body.get("status"):
+            raise RuntimeError(f"Paystack {path}: {body.get('message')}")
+        return body["data"]
+
+    def _bank_code(self, bank_name):
+        with self._lock:
+            if self._bank_codes is None:
+                banks = self._call("GET", "/bank", params={"country": "nigeria", "perPage": 500})
+                self._bank_codes = {b["name"].lower(): b["code"] for b in banks}
+        return self._bank_codes.get((bank_name or "").strip().lower())
+
+    def _ensure_recipients(self, transfers):
+        missing = {}
+        for t in transfers:
+            key = (t["bank_code"], t["account_number"])
+            if key not in self._recipients:
+                missing[key] = {"type": "nuban", "name": t["name"], "account_number": t["account_number"],
+                                "bank_code": t["bank_code"], "currency": "NGN"}
+        if missing:
+            data = self._call("POST", "/transferrecipient/bulk", json={"batch": list(missing.values())})
+            for r in data.get("success", []):
+                self._recipients[(r["details"]["bank_code"], r["details"]["account_number"])] = r["recipient_code"]
+
+    def bulk_transfer(self, transfers):
+        results, payable = [], []
+        for t in transfers:
+            code = self._bank_code(t["bank_name"])
+            if code is None:
+                results.append({"reference": t["reference"], "status": "failed", "message": f"Unknown bank '{t['bank_name']}'"})
+            else:
+                payable.append(dict(t, bank_code=code))
+        if not payable:
+            return results
+
+        self._ensure_recipients(payable)
+        batch = []
+        for t in payable:
+            recipient = self._recipients.get((t["bank_code"], t["account_number"]))
+            if recipient is None:
+                results.append({"reference": t["reference"], "status": "failed", "message": "Account could not be resolved"})
+            else:
+                batch.append({"amount": t["amount_kobo"], "recipient": recipient, "reference": t["reference"], "reason": t["reason"]})
+        if batch:
+            data = self._call("POST", "/transfer/bulk", json={"currency": "NGN", "source": "balance", "transfers": batch})
+            for sent, row in zip(batch, data):
+                status = row.get("status")
+                results.append({
+                    "reference": row.get("reference") or sent["reference"],
+                    "status": status if status in ("success", "failed") else "pending",
+                    "transfer_code": row.get("transfer_code"),
+                    "message": row.get("message"),
+                })
+        return results
+
+    def verify(self, reference):
+        """GET /transfer/verify/:reference"""
+        res = self.session.get(f"{self.base_url}/transfer/verify/{reference}", timeout=30)
+        body = res.json()
+        if not body.get("status"):
+            if res.status_code == 404 or "not found" in (body.get("message") or "").lower():
+                return None
+            raise RuntimeError(f"Paystack /transfer/verify: {body.get('message')}")
+        data = body["data"]
+        status = {"success": "success", "failed": "failed", "reversed": "failed"}.get(data.get("status"), "pending")
+        return {"reference": reference, "status": status, "transfer_code": data.get("transfer_code"),
+                "message": data.get("reason") or data.get("status")}
+
+
+PROVIDERS = {"stub": StubProvider, "paystack": PaystackProvider}
+
+
+def get_provider(name=None):
+    return PROVIDERS[name or PAYOUT_PROVIDER]()
+
+
+# --- 3. CLAIM ---
+def claim_batch(db, size=CLAIM_BATCH):
+    """PENDING -> PROCESSING for up to `size` rows nobody else holds. Returns the claimed rows."""
+    batch_id = uuid.uuid4().hex
+    # SQLite has no row locks (FOR UPDATE is dropped) but serialises writers, which gives the same guarantee.
+    pending = select(Withdrawal.id).where(
+        Withdrawal.status == WithdrawalStatus.PENDING
+    ).order_by(Withdrawal.id).limit(size).with_for_update(skip_locked=True).scalar_subquery()
+    db.execute(
+        update(Withdrawal)
+        .where(Withdrawal.id.in_(pending), Withdrawal.status == WithdrawalStatus.PENDING)
+        .values(status=WithdrawalStatus.PROCESSING, batch_id=batch_id, claimed_at=datetime.now(timezone.utc))
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return _claimed_rows(db, batch_id)
+
+
+def claim_stale(db, size=CLAIM_BATCH):
+    """Re-claims up to `size` rows PROCESSING for longer than PAYOUT_CLAIM_TIMEOUT_SECONDS. Returns them."""
+    batch_id = uuid.uuid4().hex
+    now = datetime.now(timezone.utc)
+    stale = select(Withdrawal.id).where(
+        Withdrawal.status == WithdrawalStatus.PROCESSING,
+        # claimed_at is NULL for rows claimed before the column existed
+        or_(Withdrawal.claimed_at.is_(None), Withdrawal.claimed_at < now - timedelta(seconds=PAYOUT_CLAIM_TIMEOUT_SECONDS)),
+    ).order_by(Withdrawal.id).limit(size).with_for_update(skip_locked=True).scalar_subquery()
+    db.execute(
+        update(Withdrawal)
+        .where(Withdrawal.id.in_(stale), Withdrawal.status == WithdrawalStatus.PROCESSING)
+        .values(batch_id=batch_id, claimed_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return _claimed_rows(db, batch_id)
+
+
+def _claimed_rows(db, batch_id):
+    return db.execute(
+        select(Withdrawal.id, Withdrawal.agent_id, Withdrawal.amount_requested, Withdrawal.amount_net,
+               Withdrawal.bank_name, Withdrawal.account_number, User.full_name)
+        .join(User, Withdrawal.agent_id == User.id)
+        .where(Withdrawal.batch_id == batch_id)
+        .order_by(Withdrawal.id)
+    ).all()
+
+
+# --- 4. RECONCILE ---
+_refund = (
+    update(User)
+    .where(User.id == bindparam("agent"))
+    .values(wallet_balance=User.wallet_balance + bindparam("amount"))
+)
+
+
+_settle = (
+    update(Withdrawal.__table__)
+    .where(Withdrawal.id == bindparam("b_id"), Withdrawal.status == WithdrawalStatus.PROCESSING)
+    .values(status=bindparam("b_status"), transfer_code=bindparam("b_code"),
+            processed_at=bindparam("b_at"), failure_reason=bindparam("b_reason"))
+)
+
+
+def reconcile(db, results, claimed):
+    """
+    Writes provider results back in bulk. `claimed` maps reference -> claimed row. Returns status counts.
+    Only rows still PROCESSING are touched: a transfer webhook may have settled (and refunded) some already.
+    """
+    ids = [row.id for row in claimed.values()]
+    # Row locks: whoever settles a withdrawal second waits here, then sees it's no longer PROCESSING
+    still_open = set(db.execute(
+        select(Withdrawal.id)
+        .where(Withdrawal.id.in_(ids), Withdrawal.status == WithdrawalStatus.PROCESSING)
+        .with_for_update()
+    ).scalars()) if ids else set()
+
+    now = datetime.now(timezone.utc)
+    updates, refunds = [], []
+    counts = {"success": 0, "pending": 0, "failed": 0}
+    for r in results:
+        row = claimed.get(r["reference"])
+        if row is None or row.id not in still_open:
+            continue
+        still_open.discard(row.id)  # one result per withdrawal
+        counts[r["status"]] += 1
+        if r["status"] == "success":
+            updates.append({"b_id": row.id, "b_status": WithdrawalStatus.PROCESSED, "b_code": r.get("transfer_code"),
+                            "b_at": now, "b_reason": None})
+        elif r["status"] == "failed":
+            updates.append({"b_id": row.id, "b_status": WithdrawalStatus.FAILED, "b_code": r.get("transfer_code"),
+                            "b_at": now, "b_reason": (r.get("message") or "Transfer failed")[:200]})
+            refunds.append({"agent": row.agent_id, "amount": row.amount_requested})
+        else:
+            updates.append({"b_id": row.id, "b_status": WithdrawalStatus.PROCESSING, "b_code": r.get("transfer_code"),
+                            "b_at": None, "b_reason": None})
+    # Core executemany: one round trip per statement, not per withdrawal
+    # (the ORM would try to treat a multi-row UPDATE ... WHERE as bulk-by-primary-key)
+    if updates:
+        db.connection().execute(_settle, updates)
+    if refunds:
+        db.connection().execute(_refund, refunds)
+    db.commit()
+    return counts
+
+
+# --- 5. SWEEP (Stuck PROCESSING rows) ---
+def sweep_stale(db, provider):
+    """Settles or re-queues rows whose claim timed out. Returns {"checked", "requeued", "errors"}."""
+    summary = {"checked": 0, "requeued": 0, "errors": 0}
+    # Each pass refreshes claimed_at on what it took, so the loop ends once everything stale was seen.
+    while True:
+        rows = claim_stale(db)
+        if not rows:
+            return summary
+        results, requeue = [], []
+        claimed = {transfer_reference(row.id): row for row in rows}
+        for reference, row in claimed.items():
+            try:
+                result = provider.verify(reference)
+            except Exception as e:
+                # Provider still unreachable: claimed_at was refreshed, so it's tried again after another timeout.
+                log_event(logger, "payout.verify_failed", logging.WARNING, withdrawal_id=row.id, error=str(e))
+                summary["errors"] += 1
+                continue
+            if result is None:
+                requeue.append(row.id)
+            else:
+                results.append(result)
+        if requeue:
+            # Never reached the provider: safe to send again, the reference is deterministic anyway.
+            db.execute(
+                update(Withdrawal)
+                .where(Withdrawal.id.in_(requeue), Withdrawal.status == WithdrawalStatus.PROCESSING)
+                .values(status=WithdrawalStatus.PENDING, batch_id=None, claimed_at=None)
+                .execution_options(synchronize_session=False)
+            )
+        reconcile(db, results, claimed)  # skips rows a webhook settled meanwhile; commits the re-queue too
+        summary["checked"] += len(rows)
+        summary["requeued"] += len(requeue)
+
+
+# --- 6. RUN ---
+def _run_worker(provider, totals, lock):
+    db = SessionLocal()
+    try:
+        _drain(db, provider, totals, lock)
+    except Exception as e:
+        log_event(logger, "payout.worker_failed", logging.ERROR, error=str(e))
+    finally:
+        db.close()
+
+
+def _drain(db, provider, totals, lock):
+    while True:
+        rows = claim_batch(db)
+        if not rows:
+            return
+        claimed = {transfer_reference(row.id): row for row in rows}
+        transfers = [{
+            "reference": ref,
+            "amount_kobo": int(round(row.amount_net * 100)),
+            "name": row.full_name,
+            "bank_name": row.bank_name,
+            "account_number": row.account_number,
+            "reason": "FlipTrybe agent withdrawal",
+        } for ref, row in claimed.items()]
+
+        for start in range(0, len(transfers), provider.max_batch):
+            chunk = transfers[start:start + provider.max_batch]
+            try:
+                results = provider.bulk_transfer(chunk)
+            except Exception as e:
+                # We can't know what the provider did: leave these PROCESSING (never refund blindly);
+                # sweep_stale asks the provider about them once PAYOUT_CLAIM_TIMEOUT_SECONDS has passed.
+                log_event(logger, "payout.provider_error", logging.ERROR, error=str(e), transfers=len(chunk))
+                with lock:
+                    totals["errors"] += len(chunk)
+                continue
+            counts = reconcile(db, results, claimed)
+            with lock:
+                totals["provider_calls"] += 1
+                for status, n in counts.items():
+                    totals[status] += n
+
+
+def process_payouts(parallel=1, provider=None):
+    """
+    Sweeps stale PROCESSING rows, then settles every PENDING withdrawal.
+    `parallel` runners claim disjoint batches. Returns a summary.
+    """
+    provider = provider or get_provider()
+    totals = {"success": 0, "pending": 0, "failed": 0, "errors": 0, "provider_calls": 0}
+    lock = threading.Lock()
+    started = time.perf_counter()
+
+    db = SessionLocal()
+    try:
+        totals["stale"] = sweep_stale(db, provider)
+    except Exception as e:
+        log_event(logger, "payout.sweep_failed", logging.ERROR, error=str(e))
+    finally:
+        db.close()
+
+    threads = [threading.Thread(target=_run_worker, args=(provider, totals, lock), name=f"payout-{n}")
+               for n in range(max(1, parallel))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    totals["seconds"] = round(time.perf_counter() - started, 3)
+    log_event(logger, "payout.run", provider=type(provider).__name__, parallel=parallel, **totals)
+    return totals
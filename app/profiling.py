@@ -0,0 +1,191 @@
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+# --- 1. SETTINGS ---
+# Latency buckets (seconds) for the per-handler histograms.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Same SQL shape repeated this many times in ONE request = probable N+1.
+N_PLUS_ONE_THRESHOLD = 5
+
+# Numbers and quoted strings are stripped so "WHERE id = 3" and "WHERE id = 7" count as one shape.
+_LITERALS = re.compile(r"'[^']*'|\b\d+\b")
+
+# The stats for the request currently being served (None outside of a request).
+_current = ContextVar("fliptrybe_request_stats", default=None)
+
+
+class RequestStats:
+    __slots__ = ("queries", "sql_seconds", "shapes", "started")
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.shapes = Counter()
+        self.started = {}
+
+
+# --- 2. THE REGISTRY (Everything /metrics prints) ---
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = defaultdict(lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+        self.latency_sum = defaultdict(float)
+        self.requests = Counter()
+        self.sql_queries = Counter()
+        self.sql_seconds = defaultdict(float)
+        self.n_plus_one = Counter()
+
+    def observe(self, method, handler, status, seconds, stats):
+        key = (method, handler)
+        with self._lock:
+            counts = self.latency[key]
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self.latency_sum[key] += seconds
+            self.requests[(method, handler, str(status))] += 1
+            self.sql_queries[key] += stats.queries
+            self.sql_seconds[key] += stats.sql_seconds
+            for shape, hits in stats.shapes.items():
+                if hits >= N_PLUS_ONE_THRESHOLD:
+                    self.n_plus_one[(method, handler, shape)] += 1
+
+    def render(self):
+        """Prometheus text exposition format (v0.0.4)."""
+        lines = []
+        with self._lock:
+            lines.append("# HELP fliptrybe_http_request_duration_seconds Request latency per handler.")
+            lines.append("# TYPE fliptrybe_http_request_duration_seconds histogram")
+            for (method, handler), counts in sorted(self.latency.items()):
+                labels = f'method="{method}",handler="{_escape(handler)}"'
+                running = 0
+                for bound, hits in zip(LATENCY_BUCKETS, counts):
+                    running += hits
+                    lines.append(f'fliptrybe_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {running}')
+                running += counts[-1]
+                lines.append(f'fliptrybe_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {running}')
+                lines.append(f"fliptrybe_http_request_duration_seconds_sum{{{labels}}} {self.latency_sum[(method, handler)]:.6f}")
+                lines.append(f"fliptrybe_http_request_duration_seconds_count{{{labels}}} {running}")
+
+            lines.append("# HELP fliptrybe_http_requests_total Requests served per handler and status.")
+            lines.append("# TYPE fliptrybe_http_requests_total counter")
+            for (method, handler, status), hits in sorted(self.requests.items()):
+                lines.append(f'fliptrybe_http_requests_total{{method="{method}",handler="{_escape(handler)}",status="{status}"}} {hits}')
+
+            lines.append("# HELP fliptrybe_sql_queries_total SQL statements executed per handler.")
+            lines.append("# TYPE fliptrybe_sql_queries_total counter")
+            for (method, handler), hits in sorted(self.sql_queries.items()):
+                lines.append(f'fliptrybe_sql_queries_total{{method="{method}",handler="{_escape(handler)}"}} {hits}')
+
+            lines.append("# HELP fliptrybe_sql_seconds_total Time spent inside SQL per handler.")
+            lines.append("# TYPE fliptrybe_sql_seconds_total counter")
+            for (method, handler), seconds in sorted(self.sql_seconds.items()):
+                lines.append(f'fliptrybe_sql_seconds_total{{method="{method}",handler="{_escape(handler)}"}} {seconds:.6f}')
+
+            lines.append("# HELP fliptrybe_n_plus_one_total Requests that repeated one SQL shape past the N+1 threshold.")
+            lines.append("# TYPE fliptrybe_n_plus_one_total counter")
+            for (method, handler, shape), hits in sorted(self.n_plus_one.items()):
+                lines.append(
+                    f'fliptrybe_n_plus_one_total{{method="{method}",handler="{_escape(handler)}",query="{_escape(shape)}"}} {hits}'
+                )
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+registry = MetricsRegistry()
+
+
+# --- 3. REQUEST MIDDLEWARE (Pure ASGI, no per-request task spawning) ---
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        status_holder = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder[0] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            _current.reset(token)
+            # Label by HANDLER name ("get_driver_status"), not the raw path, so IDs don't explode the label set.
+            route = scope.get("route")
+            handler = getattr(route, "name", None) or "unmatched"
+            registry.observe(scope["method"], handler, status_holder[0], elapsed, stats)
+
+
+# --- 4. SQLALCHEMY HOOKS (Query count, SQL time, N+1 shapes) ---
+def instrument_engine(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        stats = _current.get()
+        if stats is not None:
+            stats.started[id(context)] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        stats = _current.get()
+        if stats is None:
+            return
+        began = stats.started.pop(id(context), None)
+        if began is not None:
+            stats.sql_seconds += time.perf_counter() - began
+        stats.queries += 1
+        stats.shapes[_LITERALS.sub("?", " ".join(statement.split()))[:200]] += 1
+
+
+# --- 5. ON-DEMAND SAMPLING PROFILER ---
+_profile_lock = threading.Lock()
+
+
+def sample_stacks(seconds: float, interval: float = 0.005, limit: int = 200):
+    """
+    Samples every thread's stack for `seconds` and returns collapsed stacks
+    ("frame;frame;frame count"), ready for flamegraph.pl or speedscope.
+    Nothing runs until this is called, so the cost when idle is zero.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        return None
+
+    try:
+        me = threading.get_ident()
+        stacks = Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                parts = []
+                while frame is not None:
+                    code = frame.f_code
+                    parts.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stacks[";".join(reversed(parts))] += 1
+            time.sleep(interval)
+    finally:
+        _profile_lock.release()
+
+    return "\n".join(f"{stack} {hits}" for stack, hits in stacks.most_common(limit)) + "\n"
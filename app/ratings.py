@@ -0,0 +1,228 @@
+"""
+Lister ratings from order outcomes.
+
+Each lister has running, exponentially decayed aggregates (half-life
+RATING_HALF_LIFE_DAYS): confirmations, cancellations, completed orders and how
+long they take to answer the magic link. An event costs O(1): decay the
+aggregate to "now", add one. Events are folded in memory and written back every
+RATING_FLUSH_SECONDS in one transaction:
+
+- lister_stats rows are merged (decay both sides to the same instant, add);
+- User.rating is recomputed for those listers only;
+- when a rating moves by RATING_PUBLISH_DELTA or more, each of that lister's
+  unsold listings gets an UPDATED item_change (market.html's cache re-syncs just
+  those rows) and "rating.changed" is published for server-side caches.
+
+With no history a lister scores 3.0 (the column default); evidence moves them
+from there, so one cancellation doesn't sink a new seller.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import insert, literal, select, update
+
+from app.coordination import coordinator
+from app.database import SessionLocal
+from app.logs import get_logger, log_event
+from app.models import Item, ItemChange, ItemChangeKind, ListerStats, User
+
+logger = get_logger(__name__)
+
+# --- 1. SETTINGS ---
+RATING_HALF_LIFE_DAYS = float(os.getenv("RATING_HALF_LIFE_DAYS", "90"))
+RATING_FLUSH_SECONDS = float(os.getenv("RATING_FLUSH_SECONDS", "5"))
+RATING_PUBLISH_DELTA = float(os.getenv("RATING_PUBLISH_DELTA", "0.05"))
+# Pseudo-events at the neutral score: how much evidence it takes to move a rating
+PRIOR_WEIGHT = 5.0
+# Answering the magic link within this many hours scores 0.5 on speed; faster scores higher
+RESPONSE_TARGET_HOURS = 2.0
+# The link expires after 10 hours; anything slower counts as 10
+MAX_RESPONSE_HOURS = 10.0
+COMPLETED_WEIGHT = 0.5  # A completed order adds to a confirmation already counted
+RELIABILITY_SHARE = 0.75
+
+_HALF_LIFE_SECONDS = RATING_HALF_LIFE_DAYS * 86400
+KINDS = ("confirmed", "cancelled", "completed")
+# Max listers per "rating.changed" message (NOTIFY payloads are capped at 8000 bytes)
+PUBLISH_CHUNK = 300
+
+
+# --- 2. AGGREGATE ---
+class Aggregate:
+    __slots__ = ("confirmed", "cancelled", "completed", "responses", "response_hours", "at")
+
+    def __init__(self, at, confirmed=0.0, cancelled=0.0, completed=0.0, responses=0.0, response_hours=0.0):
+        self.at = at  # epoch seconds the counts are valid for
+        self.confirmed, self.cancelled, self.completed = confirmed, cancelled, completed
+        self.responses, self.response_hours = responses, response_hours
+
+    def decay_to(self, at):
+        if at > self.at:
+            factor = 0.5 ** ((at - self.at) / _HALF_LIFE_SECONDS)
+            self.confirmed *= factor
+            self.cancelled *= factor
+            self.completed *= factor
+            self.responses *= factor
+            self.response_hours *= factor
+            self.at = at
+
+    def add(self, kind, response_hours=None, at=None):
+        self.decay_to(at if at is not None else time.time())
+        setattr(self, kind, getattr(self, kind) + 1.0)
+        if response_hours is not None:
+            self.responses += 1.0
+            self.response_hours += min(max(response_hours, 0.0), MAX_RESPONSE_HOURS)
+
+    def merge(self, other):
+        at = max(self.at, other.at)
+        self.decay_to(at)
+        other.decay_to(at)
+        self.confirmed += other.confirmed
+        self.cancelled += other.cancelled
+        self.completed += other.completed
+        self.responses += other.responses
+        self.response_hours += other.response_hours
+
+    def rating(self):
+        """1.0 - 5.0. Reliability (kept vs. cancelled sales) and speed, each shrunk towards 0.5."""
+        kept = self.confirmed + COMPLETED_WEIGHT * self.completed
+        reliability = (kept + PRIOR_WEIGHT * 0.5) / (kept + self.cancelled + PRIOR_WEIGHT)
+        speed = 0.5
+        if self.responses > 0:
+            mean_hours = self.response_hours / self.responses
+            observed = RESPONSE_TARGET_HOURS / (RESPONSE_TARGET_HOURS + mean_hours)
+            speed = (self.responses * observed + PRIOR_WEIGHT * 0.5) / (self.responses + PRIOR_WEIGHT)
+        return round(1.0 + 4.0 * (RELIABILITY_SHARE * reliability + (1 - RELIABILITY_SHARE) * speed), 2)
+
+
+def _epoch(value):
+    if value is None:
+        return 0.0
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)  # SQLite stores UTC without a zone
+    return value.timestamp()
+
+
+# --- 3. ENGINE ---
+class RatingEngine:
+    def __init__(self):
+        self._pending = {}  # lister id -> Aggregate of events not yet written
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def record(self, lister_id, kind, response_hours=None, at=None):
+        """One order outcome ("confirmed" / "cancelled" / "completed"). O(1), no I/O."""
+        if kind not in KINDS:
+            raise ValueError(f"Unknown rating event {kind!r}")
+        at = at if at is not None else time.time()
+        with self._lock:
+            aggregate = self._pending.get(lister_id)
+            if aggregate is None:
+                aggregate = self._pending[lister_id] = Aggregate(at)
+            aggregate.add(kind, response_hours, at)
+
+    def flush(self):
+        """Writes pending events back. Returns {lister_id: new rating} for ratings that changed."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return {}
+            db = SessionLocal()
+            try:
+                changed, published = self._write(db, pending)
+            except Exception as e:
+                db.rollback()
+                # Put the events back (merged with anything recorded meanwhile) for the next flush
+                with self._lock:
+                    for lister_id, aggregate in pending.items():
+                        if lister_id in self._pending:
+                            aggregate.merge(self._pending[lister_id])
+                        self._pending[lister_id] = aggregate
+                log_event(logger, "rating.flush_failed", logging.ERROR, error=str(e), listers=len(pending))
+                return {}
+            finally:
+                db.close()
+
+        ids = sorted(published)
+        for start in range(0, len(ids), PUBLISH_CHUNK):
+            coordinator.publish("rating.changed", {"ratings": {str(i): published[i] for i in ids[start:start + PUBLISH_CHUNK]}})
+        log_event(logger, "rating.flushed", listers=len(pending), changed=len(changed), published=len(published))
+        return changed
+
+    def _write(self, db, pending):
+        ids = sorted(pending)
+        # Row locks (taken in id order, so concurrent flushes can't deadlock): two workers
+        # flushing the same lister merge one after the other
+        stats = {s.lister_id: s for s in db.query(ListerStats).filter(
+            ListerStats.lister_id.in_(ids)).order_by(ListerStats.lister_id).with_for_update()}
+        ratings = dict(db.execute(select(User.id, User.rating).where(User.id.in_(ids))).all())
+
+        changed, published = {}, {}
+        for lister_id in ids:
+            events = pending[lister_id]
+            if lister_id not in ratings:
+                continue  # lister deleted since
+            row = stats.get(lister_id)
+            if row is None:
+                row = ListerStats(lister_id=lister_id)
+                db.add(row)
+                aggregate = Aggregate(events.at)
+            else:
+                aggregate = Aggregate(_epoch(row.decayed_at), row.confirmed or 0.0, row.cancelled or 0.0,
+                                      row.completed or 0.0, row.responses or 0.0, row.response_hours or 0.0)
+            aggregate.merge(events)
+            row.confirmed, row.cancelled, row.completed = aggregate.confirmed, aggregate.cancelled, aggregate.completed
+            row.responses, row.response_hours = aggregate.responses, aggregate.response_hours
+            row.decayed_at = datetime.fromtimestamp(aggregate.at, timezone.utc)
+
+            rating, old = aggregate.rating(), ratings[lister_id]
+            if old is None or abs(rating - old) >= 0.005:
+                changed[lister_id] = rating
+            if old is None or abs(rating - old) >= RATING_PUBLISH_DELTA:
+                published[lister_id] = rating
+
+        if changed:
+            db.execute(update(User), [{"id": i, "rating": changed[i]} for i in sorted(changed)])
+        if published:
+            # Only these listers' unsold listings re-sync (their lister_rating changed)
+            db.execute(insert(ItemChange).from_select(
+                ["item_id", "kind"],
+                select(Item.id, literal(ItemChangeKind.UPDATED, ItemChange.kind.type)).where(
+                    Item.lister_id.in_(list(published)), Item.is_sold == False
+                ),
+            ))
+        db.commit()
+        return changed, published
+
+    # --- lifecycle ---
+    def _run(self):
+        while not self._stop.wait(RATING_FLUSH_SECONDS):
+            self.flush()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="rating-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self.flush()  # don't lose the last few seconds of events
+
+
+tracker = RatingEngine()
+
+
+def start():
+    tracker.start()
+
+
+def stop():
+    tracker.stop()
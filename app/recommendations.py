@@ -0,0 +1,297 @@
+"""
+"Similar items": cosine similarity over hashed n-gram TF-IDF vectors of each
+listing's title + description, kept in memory as NumPy arrays.
+
+- Features (words, word bigrams, character trigrams) are hashed into
+  SIMILAR_DIM columns, so there is no vocabulary to maintain and a new
+  listing can be vectorised the moment it appears.
+- Rows are L2-normalised, so cosine similarity is a plain sparse dot product.
+  The bulk of the catalogue sits in an inverted (CSC) matrix, feature -> rows;
+  a query touches only the postings of its own ~30 features (one np.bincount).
+- Listings added since the last full build go to a small delta, kept sorted by feature.
+  Sold / edited rows are masked, not removed. Past SIMILAR_DELTA_ROWS the next
+  refresh rebuilds everything while the old snapshot keeps serving.
+- Only unsold listings are indexed. Changes come from the item_changes log
+  (the one market.html syncs from), polled every SIMILAR_REFRESH_SECONDS.
+- The first build runs on that same background thread, started from the app's
+  lifespan; until it finishes, queries answer with no matches.
+"""
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+from sqlalchemy import func
+
+from app.changes import settled_cursor
+from app.database import SessionLocal
+from app.logs import get_logger, log_event
+from app.models import Item, ItemChange
+
+logger = get_logger(__name__)
+
+# --- 1. SETTINGS ---
+SIMILAR_DIM = 1 << 18
+# A feature found in more than this share of listings ("used", "clean") says nothing about similarity
+SIMILAR_MAX_DF = float(os.getenv("SIMILAR_MAX_DF", "0.2"))
+SIMILAR_DELTA_ROWS = int(os.getenv("SIMILAR_DELTA_ROWS", "5000"))
+SIMILAR_REFRESH_SECONDS = float(os.getenv("SIMILAR_REFRESH_SECONDS", "5"))
+# Title terms count this many times: titles are short and say what the thing is
+TITLE_WEIGHT = 2
+MAX_DESCRIPTION_CHARS = 2000
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+# --- 2. VECTORISING ---
+def _grams(text):
+    words = _WORD.findall(text.lower())
+    grams = [f"w:{w}" for w in words]
+    grams += [f"b:{a} {b}" for a, b in zip(words, words[1:])]
+    for w in words:
+        padded = f"#{w}#"
+        grams += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+    return grams
+
+
+def features(title, description):
+    """(hashed columns, log-scaled term frequencies) for one listing, columns sorted and unique."""
+    grams = _grams(title or "") * TITLE_WEIGHT + _grams((description or "")[:MAX_DESCRIPTION_CHARS])
+    hashes = np.fromiter((zlib.crc32(g.encode()) for g in grams), dtype=np.int64, count=len(grams))
+    cols, counts = np.unique(hashes & (SIMILAR_DIM - 1), return_counts=True)
+    return cols.astype(np.int32), np.log1p(counts).astype(np.float32)
+
+
+def _weigh(cols, tf, idf):
+    data = tf * idf[cols]
+    norm = np.sqrt(np.dot(data, data))
+    keep = data > 0
+    return cols[keep], (data[keep] / norm if norm else data[keep])
+
+
+def _text_key(title, description):
+    return zlib.crc32(f"{title}\x00{description}".encode())
+
+
+# --- 3. INDEX ---
+class _Snapshot:
+    """Immutable once published: refreshes build a new one and swap the reference."""
+
+    def __init__(self, idf, term_ptr, term_rows, term_data, delta_rows, delta_cols, delta_data,
+                 row_item, alive, region, regions, item_row, text_keys, cursor, base_rows):
+        self.idf = idf
+        self.term_ptr, self.term_rows, self.term_data = term_ptr, term_rows, term_data
+        self.delta_rows, self.delta_cols, self.delta_data = delta_rows, delta_cols, delta_data  # sorted by column
+        self.row_item, self.alive, self.region = row_item, alive, region
+        self.regions = regions        # region name -> code
+        self.item_row = item_row      # item id -> live row
+        self.text_keys = text_keys    # item id -> crc of the text it was indexed with
+        self.cursor = cursor          # item_changes id applied up to
+        self.base_rows = base_rows
+
+    @property
+    def delta_size(self):
+        return len(self.row_item) - self.base_rows
+
+
+class SimilarityIndex:
+    def __init__(self):
+        self._snapshot = None
+        self._lock = threading.Lock()  # one builder / refresher at a time
+        self._stop = threading.Event()
+        self._thread = None
+
+    # --- building ---
+    def build(self, db):
+        started = time.perf_counter()
+        # Read first (later changes get replayed), held back past changes that may still be in flight
+        recent = db.query(ItemChange.id, ItemChange.created_at).order_by(ItemChange.id.desc()).limit(50).all()[::-1]
+        cursor = settled_cursor([(c.id, c.created_at) for c in recent], recent[-1].id) if recent else 0
+        rows = db.query(Item.id, Item.title, Item.description, Item.region).filter(
+            Item.is_sold == False
+        ).order_by(Item.id).all()
+
+        vectors = [features(r.title, r.description) for r in rows]
+        lengths = np.array([len(c) for c, _ in vectors], dtype=np.int64)
+        cols = np.concatenate([c for c, _ in vectors]) if rows else np.zeros(0, np.int32)
+        tf = np.concatenate([t for _, t in vectors]) if rows else np.zeros(0, np.float32)
+        row_of = np.repeat(np.arange(len(rows), dtype=np.int32), lengths)
+
+        n = max(len(rows), 1)
+        df = np.bincount(cols, minlength=SIMILAR_DIM)
+        idf = (np.log((1 + n) / (1 + df)) + 1).astype(np.float32)
+        idf[df > max(SIMILAR_MAX_DF * n, 2)] = 0
+
+        data = tf * idf[cols]
+        norms = np.sqrt(np.bincount(row_of, weights=data.astype(np.float64) ** 2, minlength=len(rows)))
+        data = (data / np.where(norms > 0, norms, 1)[row_of]).astype(np.float32)
+        keep = data > 0
+        cols, row_of, data = cols[keep], row_of[keep], data[keep]
+
+        order = np.argsort(cols, kind="stable")
+        term_ptr = np.zeros(SIMILAR_DIM + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cols, minlength=SIMILAR_DIM), out=term_ptr[1:])
+
+        regions = {}
+        region = np.array([regions.setdefault(r.region, len(regions)) for r in rows], dtype=np.int32)
+        self._snapshot = _Snapshot(
+            idf=idf, term_ptr=term_ptr, term_rows=row_of[order], term_data=data[order],
+            delta_rows=np.zeros(0, np.int32), delta_cols=np.zeros(0, np.int32), delta_data=np.zeros(0, np.float32),
+            row_item=np.array([r.id for r in rows], dtype=np.int64), alive=np.ones(len(rows), dtype=bool),
+            region=region, regions=regions,
+            item_row={r.id: i for i, r in enumerate(rows)},
+            text_keys={r.id: _text_key(r.title, r.description) for r in rows},
+            cursor=cursor, base_rows=len(rows),
+        )
+        log_event(logger, "similar.built", items=len(rows), postings=len(data),
+                  seconds=round(time.perf_counter() - started, 3))
+
+    def refresh(self, db):
+        """Applies item_changes since the last build/refresh. Rebuilds when the delta gets big."""
+        with self._lock:
+            snap = self._snapshot
+            oldest = db.query(func.min(ItemChange.id)).scalar() or 0
+            # Never built, the log was pruned past us (app/tiering.py), or the delta outgrew its budget
+            if snap is None or snap.cursor < oldest - 1 or snap.delta_size > SIMILAR_DELTA_ROWS:
+                self.build(db)
+                return
+            changes = db.query(ItemChange.id, ItemChange.item_id, ItemChange.created_at).filter(
+                ItemChange.id > snap.cursor
+            ).order_by(ItemChange.id).all()
+            if changes:
+                self._apply(db, snap, changes)
+
+    def _apply(self, db, snap, changes):
+        touched = {c.item_id for c in changes}
+        current = {r.id: r for r in db.query(
+            Item.id, Item.title, Item.description, Item.region, Item.is_sold
+        ).filter(Item.id.in_(touched)).all()}
+
+        alive = snap.alive.copy()
+        regions, item_row, text_keys = dict(snap.regions), dict(snap.item_row), dict(snap.text_keys)
+        new_rows, new_items, new_regions, new_keys = [], [], [], {}
+        for item_id in touched:
+            row = current.get(item_id)
+            old = item_row.get(item_id)
+            if row is None or row.is_sold:  # sold, or gone to the archive
+                if old is not None:
+                    alive[old] = False
+                    del item_row[item_id]
+                continue
+            key = _text_key(row.title, row.description)
+            if old is not None and text_keys.get(item_id) == key and snap.region[old] == regions.get(row.region):
+                continue  # replayed change, nothing new
+            if old is not None:
+                alive[old] = False
+            new_rows.append(_weigh(*features(row.title, row.description), snap.idf))
+            new_items.append(item_id)
+            new_regions.append(regions.setdefault(row.region, len(regions)))
+            new_keys[item_id] = key
+
+        first = len(snap.row_item)
+        for offset, item_id in enumerate(new_items):
+            item_row[item_id] = first + offset
+        text_keys.update(new_keys)
+        if new_rows:
+            lengths = [len(c) for c, _ in new_rows]
+            delta_rows = np.concatenate([snap.delta_rows, np.repeat(np.arange(first, first + len(new_rows), dtype=np.int32), lengths)])
+            delta_cols = np.concatenate([snap.delta_cols, *[c for c, _ in new_rows]])
+            delta_data = np.concatenate([snap.delta_data, *[d for _, d in new_rows]])
+            # Kept sorted by feature, so queries find their postings with a binary search
+            order = np.argsort(delta_cols, kind="stable")
+            delta_rows, delta_cols, delta_data = delta_rows[order], delta_cols[order], delta_data[order]
+        else:
+            delta_rows, delta_cols, delta_data = snap.delta_rows, snap.delta_cols, snap.delta_data
+
+        self._snapshot = _Snapshot(
+            idf=snap.idf, term_ptr=snap.term_ptr, term_rows=snap.term_rows, term_data=snap.term_data,
+            delta_rows=delta_rows, delta_cols=delta_cols, delta_data=delta_data,
+            row_item=np.concatenate([snap.row_item, np.array(new_items, dtype=np.int64)]),
+            alive=np.concatenate([alive, np.ones(len(new_items), dtype=bool)]),
+            region=np.concatenate([snap.region, np.array(new_regions, dtype=np.int32)]),
+            regions=regions, item_row=item_row, text_keys=text_keys,
+            cursor=settled_cursor([(c.id, c.created_at) for c in changes], changes[-1].id, floor=snap.cursor),
+            base_rows=snap.base_rows,
+        )
+        log_event(logger, "similar.refreshed", changes=len(changes), added=len(new_items), delta=self._snapshot.delta_size)
+
+    # --- querying ---
+    @property
+    def ready(self):
+        return self._snapshot is not None
+
+    def similar(self, title, description, region=None, exclude=None, k=10):
+        """
+        [(item_id, cosine)] of the k most similar indexed listings, best first.
+        Empty until the background thread's first build lands: requests never build the index.
+        """
+        snap = self._snapshot
+        if snap is None:
+            return []
+        cols, weights = _weigh(*features(title, description), snap.idf)
+        scores = np.zeros(len(snap.row_item), dtype=np.float32)
+        if len(cols):
+            # Postings of the query's own features: base (CSC pointers) + delta (sorted by feature)
+            starts, ends = snap.term_ptr[cols], snap.term_ptr[cols + 1]
+            delta_starts = np.searchsorted(snap.delta_cols, cols, side="left")
+            delta_ends = np.searchsorted(snap.delta_cols, cols, side="right")
+            hit_rows = np.concatenate(
+                [snap.term_rows[s:e] for s, e in zip(starts, ends)]
+                + [snap.delta_rows[s:e] for s, e in zip(delta_starts, delta_ends)]
+            )
+            hit_weights = np.concatenate(
+                [snap.term_data[s:e] * w for s, e, w in zip(starts, ends, weights)]
+                + [snap.delta_data[s:e] * w for s, e, w in zip(delta_starts, delta_ends, weights)]
+            )
+            scores = np.bincount(hit_rows, weights=hit_weights, minlength=len(scores)).astype(np.float32)
+
+        mask = snap.alive & (scores > 0)
+        if region is not None:
+            code = snap.regions.get(region)
+            if code is None:
+                return []
+            mask &= snap.region == code
+        if exclude is not None and exclude in snap.item_row:
+            mask[snap.item_row[exclude]] = False
+        candidates = np.flatnonzero(mask)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        # Best first; among equals, the newest listing
+        ranked = sorted(candidates, key=lambda r: (-scores[r], -snap.row_item[r]))
+        return [(int(snap.row_item[r]), float(scores[r])) for r in ranked]
+
+    # --- lifecycle ---
+    def _run(self):
+        while not self._stop.is_set():
+            db = SessionLocal()
+            try:
+                self.refresh(db)
+            except Exception as e:
+                log_event(logger, "similar.refresh_failed", logging.ERROR, error=str(e))
+            finally:
+                db.close()
+            self._stop.wait(SIMILAR_REFRESH_SECONDS)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="similar-index", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+
+index = SimilarityIndex()
+
+
+def start():
+    index.start()
+
+
+def stop():
+    index.stop()
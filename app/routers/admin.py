@@ -1,23 +1,32 @@
+from datetime import datetime
+from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from app.database import get_db
-from app.models import User, Order, Item, UserRole, OrderStatus, Driver
+from app.database import get_db, get_read_db
+from app.models import User, Order, Item, UserRole, OrderStatus, Driver, SystemSetting
+from app.coordination import coordinator
+from app.profiling import sample_stacks
+from app import exports, payouts, tiering
+from app.logs import get_logger, log_event
 
 router = APIRouter()
+logger = get_logger(__name__)
 
 @router.get("/dashboard-stats")
-def get_dashboard_stats(db: Session = Depends(get_db)):
+def get_dashboard_stats(db: Session = Depends(get_read_db)):
     """
     The Brain of the Admin Panel. 
     Calculates Real-Time Financials and Operations data.
     """
     
     # 1. FINANCIALS (The Money)
-    # Sum of all CONFIRMED orders
+    # Sum of all CONFIRMED orders (hot table + what the archiver already rolled up)
     total_sales = db.query(func.sum(Order.amount_paid)).filter(
         Order.status == OrderStatus.CONFIRMED
     ).scalar() or 0.0
+    total_sales += tiering.rollup(db, f"orders.{OrderStatus.CONFIRMED.value}")[0]
     
     # Revenue Split
     platform_revenue = total_sales * 0.05  # Your 5%
@@ -66,6 +75,94 @@ def get_dashboard_stats(db: Session = Depends(get_db)):
         "feed": activity_feed
     }
 
+# --- FINANCE EXPORTS (Streamed; constant memory at any size) ---
+@router.get("/export/{dataset}")
+def export_dataset(
+    dataset: str,
+    format: str = "csv",
+    start: Optional[datetime] = None,  # inclusive, on created_at
+    end: Optional[datetime] = None,    # exclusive
+):
+    """
+    orders / withdrawals / listings with the commission split (commission_agent,
+    commission_platform, payout_amount) as CSV or Parquet.
+    e.g. /api/admin/export/orders?format=parquet&start=2026-01-01&end=2026-02-01
+    """
+    if dataset not in exports.DATASETS:
+        raise HTTPException(status_code=404, detail=f"Unknown export. Available: {list(exports.DATASETS)}")
+    if format not in exports.FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format. Available: {list(exports.FORMATS)}")
+    if format == "parquet" and exports.pq is None:
+        raise HTTPException(status_code=501, detail="Parquet export needs pyarrow installed; use format=csv")
+
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    return StreamingResponse(
+        exports.stream_export(dataset, format, start, end),
+        media_type=exports.FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="fliptrybe-{dataset}-{stamp}.{format}"'},
+    )
+
+# --- PAYOUTS (Settle every pending withdrawal in one run) ---
+@router.post("/payouts/run")
+def run_payouts(parallel: int = 1):
+    """
+    Claims PENDING withdrawals in batches, pays them through the configured provider
+    (PAYOUT_PROVIDER) in bulk calls and writes the results back. Safe to run from
+    several workers at once: each runner claims different rows.
+    """
+    if not 1 <= parallel <= 8:
+        raise HTTPException(status_code=400, detail="parallel must be between 1 and 8")
+    log_event(logger, "payout.requested", parallel=parallel)
+    return payouts.process_payouts(parallel=parallel)
+
+# --- ARCHIVE (Move finished rows to the cold tier now) ---
+@router.post("/archive/run")
+def run_archive(days: Optional[int] = None):
+    """
+    One tiering pass: finished orders, settled withdrawals and sold items older than
+    `days` (default ARCHIVE_AFTER_DAYS) move to the archive tables in throttled batches.
+    Normally the "archiver" leader does this every TIERING_INTERVAL_SECONDS.
+    """
+    if days is not None and days < 1:
+        raise HTTPException(status_code=400, detail="days must be at least 1")
+    # Only one pass at a time (rollups are written without row locks); doesn't touch "archiver" leadership.
+    log_event(logger, "tiering.requested", days=days)
+    summary = tiering.run_archival(days=days, wait=False)
+    if summary is None:
+        raise HTTPException(status_code=409, detail="An archive pass is already running; try again when it finishes")
+    return summary
+
+# --- PROFILER (On-demand CPU sampling) ---
+@router.post("/profile")
+def capture_profile(seconds: float = 5.0, interval_ms: float = 5.0):
+    """
+    Samples all server threads for a few seconds.
+    Returns collapsed stacks (paste into speedscope.app or flamegraph.pl).
+    """
+    if not 0 < seconds <= 60:
+        raise HTTPException(status_code=400, detail="seconds must be between 0 and 60")
+
+    log_event(logger, "profile.capture", seconds=seconds, interval_ms=interval_ms)
+    collapsed = sample_stacks(seconds, interval=max(interval_ms, 1.0) / 1000)
+    if collapsed is None:
+        raise HTTPException(status_code=409, detail="A profile capture is already running")
+    return PlainTextResponse(collapsed)
+
+# --- SYSTEM SETTINGS (payment_mode, surge_multiplier, vehicle_multiplier_Bike, ...) ---
+@router.post("/settings/{key}")
+def update_setting(key: str, value: str, db: Session = Depends(get_db)):
+    setting = db.query(SystemSetting).filter(SystemSetting.key == key).first()
+    if setting:
+        setting.value = value
+    else:
+        db.add(SystemSetting(key=key, value=value))
+    db.commit()
+
+    # Every worker drops its cached copy (quote multipliers etc.)
+    coordinator.invalidate("settings", key)
+    log_event(logger, "setting.updated", key=key, value=value)
+    return {"status": "success", "key": key, "value": value}
+
 # --- LEGACY DRIVER MANAGEMENT ---
 @router.get("/drivers")
 def get_drivers(db: Session = Depends(get_db)):
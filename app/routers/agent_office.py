@@ -2,11 +2,14 @@ from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 from pydantic import BaseModel
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.models import User, Item, Order, Withdrawal, ItemCategory, OrderStatus, UserRole
+from app import tiering
 from app.notifications import send_whatsapp
+from app.logs import get_logger, log_event
 
 router = APIRouter()
+logger = get_logger(__name__)
 
 class WithdrawalRequest(BaseModel):
     agent_id: int
@@ -15,7 +18,7 @@ class WithdrawalRequest(BaseModel):
     account_number: str
 
 @router.get("/dashboard/{agent_id}")
-def get_agent_dashboard(agent_id: int, db: Session = Depends(get_db)):
+def get_agent_dashboard(agent_id: int, db: Session = Depends(get_read_db)):
     """
     The Agent's Brain: Analytics, Wallet, and Listings.
     """
@@ -26,6 +29,11 @@ def get_agent_dashboard(agent_id: int, db: Session = Depends(get_db)):
     total_listings = db.query(Item).filter(Item.lister_id == agent_id).count()
     sold_items = db.query(Item).filter(Item.lister_id == agent_id, Item.is_sold == True).count()
     total_earnings = db.query(func.sum(Item.commission_agent)).filter(Item.lister_id == agent_id, Item.is_sold == True).scalar() or 0.0
+    # Archived listings are all sold; their totals live in the rollups
+    archived_earnings, archived_sold = tiering.rollup(db, "items.sold", agent_id)
+    total_listings += archived_sold
+    sold_items += archived_sold
+    total_earnings += archived_earnings
     
     # 2. SEPARATE LISTINGS (Declutter vs Shortlet)
     declutter_listings = db.query(Item).filter(Item.lister_id == agent_id, Item.type == ItemCategory.DECLUTTER).all()
@@ -70,10 +78,13 @@ def request_withdrawal(req: WithdrawalRequest, bg_tasks: BackgroundTasks, db: Se
         amount_requested=req.amount,
         fee_platform=fee,
         amount_net=net_amount,
-        status="PENDING" # Admin must approve actual transfer
+        bank_name=req.bank_name,
+        account_number=req.account_number,
+        status="PENDING" # Paid out in bulk by the next payout run (app/payouts.py)
     )
     db.add(txn)
     db.commit()
+    log_event(logger, "withdrawal.requested", withdrawal_id=txn.id, agent_id=agent.id, amount_net=net_amount)
     
     # NOTIFY ADMIN (Simulated)
     msg = f"💸 Withdrawal Alert: {agent.full_name} wants ₦{net_amount:,.2f} (Fee: ₦{fee:,.2f})."
@@ -1,9 +1,50 @@
+import asyncio
+import json
+import logging
+from datetime import datetime, timezone
+from typing import List, Tuple
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from app.database import get_db
-from app.models import Driver
+from app.database import SessionLocal, get_db, get_read_db
+from app.models import Delivery, DeliveryStatus, Driver, Route
+from app.logs import get_logger, log_event
+from app.coordination import coordinator
+from app import telemetry
 
 router = APIRouter()
+logger = get_logger(__name__)
+
+# SSE keep-alive, so proxies don't close a quiet stream
+STREAM_HEARTBEAT_SECONDS = 15
+
+# driver_id -> queues of the open route streams on THIS worker
+_listeners = {}
+
+
+def _on_route_assigned(payload):
+    # Runs on the coordinator thread; hand the event to each stream's event loop.
+    for loop, queue in list(_listeners.get(payload.get("driver_id"), ())):
+        loop.call_soon_threadsafe(queue.put_nowait, payload)
+
+
+coordinator.subscribe("route.assigned", _on_route_assigned)
+
+
+def _active_route(db: Session, driver_id: int):
+    route = db.query(Route).filter(Route.driver_id == driver_id, Route.status == "ACTIVE").first()
+    if not route:
+        return {"route": None}
+    return {
+        "route": {
+            "id": route.id,
+            "vehicle_type": route.vehicle_type,
+            "distance_km": route.distance_km,
+            "stops": json.loads(route.stops),
+        }
+    }
 
 # 1. LOGIN (Fixes "Login Failed")
 @router.post("/login")
@@ -14,11 +55,11 @@ def driver_login(phone: str, db: Session = Depends(get_db)):
     driver = db.query(Driver).filter(Driver.phone == clean_phone).first()
     
     if not driver:
-        # If not found, print to terminal so you can see why
-        print(f"❌ Login Failed for: {clean_phone}")
+        # If not found, log it so you can see why
+        log_event(logger, "driver.login_failed", logging.WARNING, phone=clean_phone)
         raise HTTPException(status_code=401, detail="Driver not found")
     
-    print(f"✅ Driver Logged In: {driver.name}")
+    log_event(logger, "driver.login", driver_id=driver.id)
     return {
         "success": True,
         "driver_id": driver.id,
@@ -28,7 +69,7 @@ def driver_login(phone: str, db: Session = Depends(get_db)):
 
 # 2. STATUS CHECK (For the Driver App "Online/Offline" circle)
 @router.get("/status/{driver_id}")
-def get_driver_status(driver_id: int, db: Session = Depends(get_db)):
+def get_driver_status(driver_id: int, db: Session = Depends(get_read_db)):
     driver = db.query(Driver).filter(Driver.id == driver_id).first()
     if not driver:
         raise HTTPException(status_code=404, detail="Driver not found")
@@ -40,5 +81,111 @@ def update_driver_status(driver_id: int, status: str, db: Session = Depends(get_
     driver = db.query(Driver).filter(Driver.id == driver_id).first()
     if driver:
         driver.status = status
+        # Going AVAILABLE again means the whole route is done.
+        if status == "AVAILABLE":
+            route = db.query(Route).filter(Route.driver_id == driver_id, Route.status == "ACTIVE").first()
+            if route:
+                route.status = "COMPLETED"
+                db.query(Delivery).filter(Delivery.route_id == route.id).update(
+                    {"status": DeliveryStatus.DELIVERED}, synchronize_session=False
+                )
+                log_event(logger, "route.completed", driver_id=driver_id, route_id=route.id)
         db.commit()
-    return {"success": True}
\ No newline at end of file
+        if status == "AVAILABLE":
+            # Every worker stops filing this driver's pings under the finished route
+            coordinator.invalidate("telemetry.routes", driver_id)
+    return {"success": True}
+
+# 4. CURRENT ROUTE (Pickups first, then drops in driving order)
+@router.get("/{driver_id}/route")
+def get_driver_route(driver_id: int, db: Session = Depends(get_read_db)):
+    return _active_route(db, driver_id)
+
+# 5. ROUTE PUSH (Server-Sent Events: the app hears about a new route the moment it is assigned)
+def _load_route(driver_id: int):
+    # Straight from the primary: the event can beat replication to a replica.
+    db = SessionLocal()
+    try:
+        return _active_route(db, driver_id)
+    finally:
+        db.close()
+
+@router.get("/{driver_id}/route/stream")
+async def stream_driver_route(driver_id: int):
+    listener = (asyncio.get_running_loop(), asyncio.Queue())
+    _listeners.setdefault(driver_id, set()).add(listener)
+
+    async def events():
+        try:
+            yield f"data: {json.dumps(await run_in_threadpool(_load_route, driver_id))}\n\n"
+            while True:
+                try:
+                    await asyncio.wait_for(listener[1].get(), timeout=STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield f"data: {json.dumps(await run_in_threadpool(_load_route, driver_id))}\n\n"
+        finally:
+            _listeners[driver_id].discard(listener)
+            if not _listeners[driver_id]:
+                del _listeners[driver_id]
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+# 6. TELEMETRY (Batched GPS pings while on a trip; see app/telemetry.py)
+class TelemetryBatch(BaseModel):
+    # [epoch seconds, lat, lon], as many as the app collected since its last post
+    points: List[Tuple[float, float, float]] = Field(..., max_length=telemetry.MAX_BATCH_POINTS)
+
+def _query(lookup, *args):
+    # Cache misses only, straight from the primary (like _load_route)
+    db = SessionLocal()
+    try:
+        return lookup(db, *args)
+    finally:
+        db.close()
+
+# async: with the route cached, a batch is buffered without leaving the event loop
+@router.post("/{driver_id}/telemetry")
+async def post_telemetry(driver_id: int, batch: TelemetryBatch):
+    route_id = telemetry.cached_route(driver_id)
+    if route_id is telemetry.MISS:
+        try:
+            route_id = await run_in_threadpool(_query, telemetry.load_route, driver_id)
+        except LookupError:
+            raise HTTPException(status_code=404, detail="Driver not found")
+    try:
+        accepted = telemetry.recorder.ingest(driver_id, route_id, batch.points)
+    except telemetry.Full:
+        log_event(logger, "telemetry.backpressure", logging.WARNING, buffered=telemetry.recorder.buffered)
+        raise HTTPException(status_code=503, detail="Busy, retry shortly", headers={"Retry-After": "5"})
+    return {"accepted": accepted, "route_id": route_id}
+
+def _position(position):
+    if position is None:
+        return None
+    at, lat, lon = position
+    return {"lat": round(lat, 5), "lon": round(lon, 5),
+            "at": datetime.fromtimestamp(at, timezone.utc).isoformat(timespec="seconds")}
+
+# 7. WHERE IS MY DELIVERY (Buyer's read; from memory on the worker that got the driver's pings)
+@router.get("/track/{reference}")
+async def track_delivery(reference: str):
+    found = telemetry.cached_delivery(reference)
+    if found is telemetry.MISS:
+        try:
+            found = await run_in_threadpool(_query, telemetry.load_delivery, reference)
+        except LookupError:
+            raise HTTPException(status_code=404, detail="Delivery not found")
+    status, driver_id = found
+    position = None
+    if driver_id is not None:
+        position = telemetry.recorder.position(driver_id)
+        if position is None:
+            position = await run_in_threadpool(_query, telemetry.stored_position, driver_id)
+    return {"reference": reference, "status": status, "position": _position(position)}
+
+# 8. TRIP TRAIL (Every ping of a route, decoded)
+@router.get("/routes/{route_id}/trail")
+def route_trail(route_id: int, db: Session = Depends(get_read_db)):
+    return {"route_id": route_id, **telemetry.trail(db, route_id)}
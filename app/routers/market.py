@@ -1,13 +1,25 @@
+from datetime import datetime, timezone
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from typing import Optional
 
-from app.database import get_db
-from app.models import Item, User, Order, ItemCategory, OrderStatus, UserRole
+from app.database import get_db, get_read_db
+from app.models import Item, ItemChange, ItemChangeKind, User, Order, ItemCategory, OrderStatus, UserRole
 from app.notifications import send_whatsapp
+from app.logs import get_logger, log_event
+from app import ratings, recommendations
+from app.changes import settled_cursor
 
 router = APIRouter()
+logger = get_logger(__name__)
+
+# --- CHANGE FEED SETTINGS ---
+CHANGES_PAGE = 500
+# Young changes are sent now AND again on the next sync: see app/changes.py
+# Column order of each row in `items` (sent once per response, not once per item)
+FEED_FIELDS = ["id", "type", "title", "description", "price", "region", "city", "lister_rating"]
 
 # --- INPUT SCHEMAS ---
 class UnifiedListing(BaseModel):
@@ -36,7 +48,7 @@ def get_smart_feed(
     user_state: str = "Lagos", 
     user_city: str = "Ikeja", 
     view_mode: str = "LOCAL", # LOCAL or NATIONWIDE
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     THE SMART ALGORITHM:
@@ -73,6 +85,94 @@ def get_smart_feed(
     
     return sorted_items
 
+def _record_change(db: Session, item_id: int, kind: ItemChangeKind):
+    # Same transaction as the item write: the log can never disagree with the items table.
+    db.add(ItemChange(item_id=item_id, kind=kind))
+
+def _feed_row(item: Item, rating):
+    return [item.id, item.type, item.title, item.description, item.price, item.region, item.city, rating]
+
+@router.get("/changes")
+def get_feed_changes(since: int = 0, user_state: Optional[str] = None, db: Session = Depends(get_read_db)):
+    """
+    INCREMENTAL SYNC for market.html's local cache.
+    - since=0, a cursor from before a database reset, or one older than the log the
+      archiver kept (app/tiering.py prunes it): full snapshot, `reset: true`.
+    - otherwise: only items changed after `since` (upserted rows + removed ids), O(changes).
+    Keep calling with the returned `cursor` while `more` is true.
+    """
+    query = db.query(Item, User.rating).join(User, Item.lister_id == User.id)
+    if user_state:
+        query = query.filter(Item.region == user_state)
+
+    oldest, latest = db.query(func.min(ItemChange.id), func.max(ItemChange.id)).one()
+    oldest, latest = oldest or 0, latest or 0
+    if since <= 0 or since > latest or since < oldest - 1:
+        recent = db.query(ItemChange.id, ItemChange.created_at).order_by(ItemChange.id.desc()).limit(50).all()
+        rows = query.filter(Item.is_sold == False).all()
+        return {
+            "reset": True,
+            "cursor": settled_cursor(reversed(recent), latest),
+            "more": False,
+            "fields": FEED_FIELDS,
+            "items": [_feed_row(item, rating) for item, rating in rows],
+            "removed": [],
+        }
+
+    changes = db.query(ItemChange.id, ItemChange.item_id, ItemChange.created_at).filter(
+        ItemChange.id > since
+    ).order_by(ItemChange.id).limit(CHANGES_PAGE + 1).all()
+    more = len(changes) > CHANGES_PAGE
+    changes = changes[:CHANGES_PAGE]
+    cursor = changes[-1].id if changes else since
+    cursor = settled_cursor([(c.id, c.created_at) for c in changes], cursor, floor=since)
+    # A held-back cursor would hand the client this same page again; let it wait for the next sync.
+    more = more and cursor == changes[-1].id
+
+    # Current state decides the delta (several changes to one item collapse into one row)
+    changed_ids = {c.item_id for c in changes}
+    current = {item.id: (item, rating) for item, rating in query.filter(Item.id.in_(changed_ids)).all()} if changed_ids else {}
+    items, removed = [], []
+    for item_id in sorted(changed_ids):
+        if item_id not in current:
+            if not user_state:
+                removed.append(item_id)
+            continue
+        item, rating = current[item_id]
+        if item.is_sold:
+            removed.append(item_id)
+        else:
+            items.append(_feed_row(item, rating))
+
+    return {"reset": False, "cursor": cursor, "more": more, "fields": FEED_FIELDS, "items": items, "removed": removed}
+
+@router.get("/items/{item_id}/similar")
+def get_similar_items(item_id: int, user_state: Optional[str] = None, limit: int = 10, db: Session = Depends(get_read_db)):
+    """
+    "YOU MAY ALSO LIKE": unsold listings whose title/description read most like this one,
+    in the buyer's state (default: the listing's own). Rows use FEED_FIELDS + a cosine score.
+    """
+    if not 1 <= limit <= 50:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 50")
+    item = db.query(Item.id, Item.title, Item.description, Item.region).filter(Item.id == item_id).first()
+    if not item:
+        raise HTTPException(status_code=404, detail="Item not found")
+
+    matches = recommendations.index.similar(
+        item.title, item.description, region=user_state or item.region, exclude=item.id, k=limit
+    )
+    scores = dict(matches)
+    rank = {match_id: n for n, (match_id, _) in enumerate(matches)}
+    # The index trails the database by a few seconds: drop anything sold since
+    rows = db.query(Item, User.rating).join(User, Item.lister_id == User.id).filter(
+        Item.id.in_(list(scores)), Item.is_sold == False
+    ).all() if scores else []
+    rows.sort(key=lambda r: rank[r[0].id])
+    return {
+        "fields": FEED_FIELDS + ["score"],
+        "items": [_feed_row(match, rating) + [round(scores[match.id], 4)] for match, rating in rows],
+    }
+
 @router.post("/list-item")
 def unified_list_item(data: UnifiedListing, db: Session = Depends(get_db)):
     """
@@ -130,7 +230,10 @@ def unified_list_item(data: UnifiedListing, db: Session = Depends(get_db)):
         lister_id=data.lister_id
     )
     db.add(new_item)
+    db.flush()
+    _record_change(db, new_item.id, ItemChangeKind.CREATED)
     db.commit()
+    log_event(logger, "item.listed", item_id=new_item.id, lister_id=user.id, region=final_region, city=final_city)
     return {"status": "success", "msg": f"Listed in {final_city}, {final_region}"}
 
 @router.post("/buy-item")
@@ -152,6 +255,7 @@ def request_purchase(req: PurchaseRequest, bg_tasks: BackgroundTasks, db: Sessio
     db.add(order)
     db.commit()
     db.refresh(order)
+    log_event(logger, "order.placed", order_id=order.id, item_id=item.id, buyer_id=req.buyer_id)
     
     # Send Magic Link to Lister
     lister = db.query(User).filter(User.id == item.lister_id).first()
@@ -187,6 +291,7 @@ def verify_availability(order_id: int, action: str, bg_tasks: BackgroundTasks, d
         # --- SCENARIO A: AVAILABLE (YES) ---
         order.status = OrderStatus.CONFIRMED
         item.is_sold = True
+        _record_change(db, item.id, ItemChangeKind.SOLD)
         
         # 💰 CREDIT AGENT WALLET
         if lister.role == UserRole.AGENT:
@@ -208,4 +313,14 @@ def verify_availability(order_id: int, action: str, bg_tasks: BackgroundTasks, d
         bg_tasks.add_task(send_whatsapp, buyer.phone, buyer_msg)
         
     db.commit()
+    log_event(logger, "order.verified", order_id=order.id, action=action, status=order.status)
+
+    # ⭐ REPUTATION: kept vs. cancelled, and how fast the lister answered the link
+    if action in ("confirm", "cancel"):
+        placed_at = order.created_at.replace(tzinfo=order.created_at.tzinfo or timezone.utc)
+        ratings.tracker.record(
+            lister.id,
+            "confirmed" if action == "confirm" else "cancelled",
+            response_hours=(datetime.now(timezone.utc) - placed_at).total_seconds() / 3600,
+        )
     return {"status": "success", "action": action}
\ No newline at end of file
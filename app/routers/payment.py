@@ -1,85 +1,177 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
+from typing import List, Optional
+import asyncio
+import json
+import logging
+import os
+import queue
 import requests
 import uuid
 
 from app.database import get_db
-from app.models import SystemSetting, Driver
+from app.models import SystemSetting, Driver, Delivery, DeliveryStatus
+from app.logs import get_logger, log_event
+from app import quotes, webhooks
 
 router = APIRouter()
+logger = get_logger(__name__)
 
 # 🔐 YOUR PAYSTACK SECRET KEY
 # In production, this would be loaded from an environment variable (.env)
 PAYSTACK_SECRET_KEY = "sk_test_34d39847e8d590a6967487d95f60f421409e0b08"
+# Point this at a local stub for benchmarks (see bench/run.py)
+PAYSTACK_BASE_URL = os.getenv("PAYSTACK_BASE_URL", "https://api.paystack.co")
 
 # 1. THE DATA CONTRACT
 class OrderRequest(BaseModel):
     buyer_email: str
     vehicle_type: str  # "Bike" or "Van"
-    distance_km: float
+    # Preferred: place names (LGA / town) so the server measures the trip itself
+    origin: Optional[str] = None
+    destination: Optional[str] = None
+    # Legacy: client-measured distance, only used when origin/destination are missing
+    distance_km: Optional[float] = None
+
+class QuotePair(BaseModel):
+    origin: str
+    destination: str
+    vehicle_type: Optional[str] = None  # Defaults to the batch's vehicle_type
+
+class QuoteBatchRequest(BaseModel):
+    vehicle_type: str = "Bike"
+    pairs: Optional[List[QuotePair]] = None
+    # Compact form for big batches (much cheaper to parse): two equal-length lists
+    origins: Optional[List[str]] = None
+    destinations: Optional[List[str]] = None
+
+MAX_QUOTE_PAIRS = 20000
+
+@router.post("/quotes")
+def batch_quotes(req: QuoteBatchRequest):
+    """
+    Prices many origin/destination pairs in one call (e.g. every pickup option on the market page).
+    Results are column arrays in request order; unknown places get null and are listed in `unknown`.
+    """
+    if req.vehicle_type not in quotes.RATES:
+        raise HTTPException(status_code=400, detail=f"Invalid vehicle. Available: {quotes.VEHICLES}")
+
+    default_vehicle = quotes.VEHICLE_INDEX[req.vehicle_type]
+    if req.pairs is not None:
+        origin_names = [p.origin for p in req.pairs]
+        destination_names = [p.destination for p in req.pairs]
+        vehicles = [
+            default_vehicle if p.vehicle_type is None else quotes.VEHICLE_INDEX.get(p.vehicle_type, -1)
+            for p in req.pairs
+        ]
+    elif req.origins is not None and req.destinations is not None and len(req.origins) == len(req.destinations):
+        origin_names, destination_names = req.origins, req.destinations
+        vehicles = [default_vehicle] * len(origin_names)
+    else:
+        raise HTTPException(status_code=400, detail="Send `pairs`, or `origins` and `destinations` of equal length")
+    if len(origin_names) > MAX_QUOTE_PAIRS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_QUOTE_PAIRS} pairs per request")
+
+    # Resolve each distinct name once; big batches repeat the same few areas.
+    lookup = {name: quotes.place_index(name) for name in {*origin_names, *destination_names}}
+    origins = [lookup[name] for name in origin_names]
+    destinations = [lookup[name] for name in destination_names]
+
+    km, eta, amount, valid = quotes.price_batch(origins, destinations, vehicles)
+    unknown = [int(i) for i in (~valid).nonzero()[0]]
+    amounts = amount.astype(int).tolist()
+    distances = km.astype(float).round(1).tolist()
+    etas = eta.round().astype(int).tolist()
+    for i in unknown:
+        amounts[i] = distances[i] = etas[i] = None
+
+    return {
+        "count": len(origins),
+        "distance_km": distances,
+        "eta_minutes": etas,
+        "amount_ngn": amounts,
+        "unknown": unknown,
+    }
 
 @router.post("/initiate")
 def initiate_payment(order: OrderRequest, db: Session = Depends(get_db)):
-    print(f"🚀 NEW ORDER RECEIVED: {order.vehicle_type} for {order.distance_km}km")
+    log_event(
+        logger, "order.received",
+        vehicle_type=order.vehicle_type, origin=order.origin, destination=order.destination, distance_km=order.distance_km,
+    )
 
     # 2. SERVER-SIDE PRICING
-    RATES = {"Bike": 100, "Van": 500}
-    
-    if order.vehicle_type not in RATES:
-        raise HTTPException(status_code=400, detail=f"Invalid vehicle. Available: {list(RATES.keys())}")
-        
-    amount_ngn = int(order.distance_km * RATES[order.vehicle_type])
-    amount_kobo = amount_ngn * 100 
+    if order.vehicle_type not in quotes.RATES:
+        raise HTTPException(status_code=400, detail=f"Invalid vehicle. Available: {quotes.VEHICLES}")
 
-    # 3. CHECK DRIVER AVAILABILITY
-    driver = db.query(Driver).filter(
-        Driver.vehicle_type == order.vehicle_type,
-        Driver.status == "AVAILABLE"
-    ).first()
+    if order.origin and order.destination:
+        trip = quotes.quote(order.origin, order.destination, order.vehicle_type)
+        if trip is None:
+            raise HTTPException(status_code=400, detail="Unknown pickup or delivery area")
+        amount_ngn = trip["amount_ngn"]
+        distance_km = trip["distance_km"]
+    elif order.distance_km is not None:
+        amount_ngn = quotes.price_distance(order.distance_km, order.vehicle_type)
+        distance_km = order.distance_km
+    else:
+        raise HTTPException(status_code=400, detail="Send origin and destination (or distance_km)")
+    amount_kobo = amount_ngn * 100 
 
-    if not driver:
-        print("❌ ORDER REJECTED: No drivers available.")
+    # 3. CHECK WE RUN THIS VEHICLE AT ALL (Drivers are assigned later, in batches)
+    if not db.query(Driver.id).filter(Driver.vehicle_type == order.vehicle_type).first():
+        log_event(logger, "order.rejected", logging.WARNING, reason="no_driver", vehicle_type=order.vehicle_type)
         return {"success": False, "message": "No drivers available right now."}
 
     # 4. CHECK SYSTEM MODE
     mode_setting = db.query(SystemSetting).filter(SystemSetting.key == "payment_mode").first()
     mode = mode_setting.value if mode_setting else "MANUAL"
 
+    # 5. QUEUE THE DELIVERY (app/dispatch.py groups queued deliveries into multi-drop routes)
+    delivery = Delivery(
+        reference=str(uuid.uuid4()),
+        buyer_email=order.buyer_email,
+        vehicle_type=order.vehicle_type,
+        origin=order.origin,
+        destination=order.destination,
+        distance_km=distance_km,
+        amount_ngn=amount_ngn,
+        status=DeliveryStatus.QUEUED if mode == "MANUAL" else DeliveryStatus.AWAITING_PAYMENT,
+    )
+    db.add(delivery)
+    db.commit()
+
     # ==========================================
     # 🅰️ MANUAL MODE (Cash)
     # ==========================================
     if mode == "MANUAL":
-        print(f"✅ MANUAL MODE: Skipping Gateway. Collect ₦{amount_ngn:,.2f}")
-        
-        # Dispatch Logic
-        print(f"🎯 MATCHED DRIVER: {driver.name}")
-        
-        # 🧾 PRINT RECEIPT
-        print("\n" + "="*50)
-        print(f"📧 EMAIL RECEIPT TO: {order.buyer_email}")
-        print("SUBJECT: Your FlipTrybe Receipt")
-        print("-" * 50)
-        print(f"Vehicle: {order.vehicle_type}")
-        print(f"Distance: {order.distance_km}km")
-        print(f"Driver: {driver.name} ({driver.phone})")
-        print(f"TOTAL DUE: ₦{amount_ngn:,.2f}")
-        print("=" * 50 + "\n")
-        
-        # Lock driver
-        driver.status = "BUSY"
-        db.commit()
+        # 🧾 RECEIPT (One structured line, written off the request thread)
+        log_event(
+            logger, "receipt.issued",
+            mode="MANUAL",
+            buyer_email=order.buyer_email,
+            vehicle_type=order.vehicle_type,
+            distance_km=distance_km,
+            delivery_id=delivery.id,
+            reference=delivery.reference,
+            amount_ngn=amount_ngn,
+        )
         
         # ✅ THE FIX: Redirect to local success page, not Google
-        return {"success": True, "payment_mode": "/success", "message": "Driver dispatched"}
+        return {
+            "success": True,
+            "payment_mode": "/success",
+            "message": "Order received. A driver will be assigned shortly",
+            "reference": delivery.reference,
+        }
 
     # ==========================================
     # 🅱️ GATEWAY MODE (Paystack)
     # ==========================================
     else:
-        print(f"💳 GATEWAY MODE: Initializing Paystack for ₦{amount_ngn}...")
+        log_event(logger, "gateway.initialize", amount_ngn=amount_ngn, delivery_id=delivery.id)
         
-        url = "https://api.paystack.co/transaction/initialize"
+        url = f"{PAYSTACK_BASE_URL}/transaction/initialize"
         headers = {
             "Authorization": f"Bearer {PAYSTACK_SECRET_KEY}",
             "Content-Type": "application/json"
@@ -87,11 +179,11 @@ def initiate_payment(order: OrderRequest, db: Session = Depends(get_db)):
         data = {
             "email": order.buyer_email,
             "amount": amount_kobo,
-            "reference": str(uuid.uuid4()),
+            "reference": delivery.reference,
             "callback_url": "https://fliptrybe-app.onrender.com/success", # Redirects here after paying
             "metadata": {
                 "vehicle_type": order.vehicle_type,
-                "driver_id": driver.id
+                "delivery_id": delivery.id
             }
         }
         
@@ -101,12 +193,49 @@ def initiate_payment(order: OrderRequest, db: Session = Depends(get_db)):
             
             if res_data["status"]:
                 auth_url = res_data["data"]["authorization_url"]
-                print(f"🔗 PAYSTACK URL: {auth_url}")
+                log_event(logger, "gateway.initialized", reference=data["reference"])
                 return {"success": True, "payment_mode": auth_url}
             else:
-                print(f"❌ PAYSTACK ERROR: {res_data['message']}")
+                log_event(logger, "gateway.rejected", logging.ERROR, message=res_data.get("message"))
                 raise HTTPException(status_code=400, detail="Payment initialization failed")
                 
         except Exception as e:
-            print(f"❌ NETWORK ERROR: {e}")
-            raise HTTPException(status_code=500, detail="Could not connect to payment gateway")
\ No newline at end of file
+            log_event(logger, "gateway.error", logging.ERROR, error=str(e))
+            raise HTTPException(status_code=500, detail="Could not connect to payment gateway")
+
+# ==========================================
+# 🔔 PAYSTACK WEBHOOK (Server-side confirmation)
+# ==========================================
+@router.post("/webhook")
+async def paystack_webhook(request: Request):
+    """
+    Paystack calls this for charge.success and transfer.* events. We check the
+    signature, store the event (deduplicated on event + reference) and answer 200;
+    app/webhooks.py applies it in the background. Paystack keeps retrying until
+    it gets a 2xx, so a 503 here just means "send it again later".
+    """
+    body = await request.body()
+    if not webhooks.verify_signature(body, request.headers.get("x-paystack-signature"), PAYSTACK_SECRET_KEY):
+        log_event(logger, "webhook.bad_signature", logging.WARNING)
+        raise HTTPException(status_code=401, detail="Invalid signature")
+
+    try:
+        text = body.decode()
+        payload = json.loads(text)
+    except ValueError:  # includes UnicodeDecodeError
+        raise HTTPException(status_code=400, detail="Body is not JSON")
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=400, detail="Body is not a JSON object")
+    # Signed but not something we act on: a 2xx stops Paystack retrying it
+    data = payload.get("data")
+    event = payload.get("event")
+    reference = data.get("reference") if isinstance(data, dict) else None
+    if not isinstance(event, str) or not event or reference in (None, ""):
+        return {"status": "ignored"}
+
+    try:
+        await asyncio.wrap_future(webhooks.ingester.submit(event, str(reference), text))
+    except queue.Full:
+        log_event(logger, "webhook.overloaded", logging.WARNING, event=event)
+        raise HTTPException(status_code=503, detail="Busy, retry later")
+    return {"status": "ok"}
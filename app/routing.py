@@ -0,0 +1,138 @@
+"""
+Multi-drop route building (pure functions: no DB, no app state).
+
+Runs inside the dispatcher's worker process, so everything here takes and
+returns plain lists/arrays that pickle cheaply.
+
+1. Cluster pending deliveries by PICKUP area (greedy, radius-based).
+2. Inside a cluster: Clarke-Wright savings merges drops into routes up to capacity.
+3. Polish each route's drop order with 2-opt.
+"""
+import numpy as np
+
+PICKUP_RADIUS_KM = 6.0
+# Each merge candidate only looks at its nearest drops; keeps savings O(n*k) instead of O(n^2).
+NEIGHBOURS = 25
+
+
+def _cluster_by_pickup(origins, dist, radius):
+    """Greedy: the oldest unclustered delivery seeds a cluster; pickups within `radius` of the seed join it."""
+    clusters = []
+    unassigned = np.ones(len(origins), dtype=bool)
+    origins = np.asarray(origins)
+    for seed in range(len(origins)):
+        if not unassigned[seed]:
+            continue
+        members = np.nonzero(unassigned & (dist[origins[seed], origins] <= radius))[0]
+        unassigned[members] = False
+        clusters.append(members)
+    return clusters
+
+
+def _savings_routes(depot, drops, dist, capacity):
+    """Clarke-Wright (parallel). `drops` are matrix indexes; returns routes as lists of positions into `drops`."""
+    n = len(drops)
+    if n == 1:
+        return [[0]]
+
+    d0 = dist[depot, drops]
+    dd = dist[np.ix_(drops, drops)]
+    k = min(NEIGHBOURS, n - 1)
+    # Candidate pairs: each drop with its k nearest drops
+    near = np.argpartition(dd + np.eye(n) * 1e9, k - 1, axis=1)[:, :k]
+    i = np.repeat(np.arange(n), k)
+    j = near.ravel()
+    keep = i < j
+    i, j = i[keep], j[keep]
+    saving = d0[i] + d0[j] - dd[i, j]
+    order = np.argsort(-saving, kind="stable")
+
+    route_of = list(range(n))
+    routes = {r: [r] for r in range(n)}
+    for a, b in zip(i[order].tolist(), j[order].tolist()):
+        ra, rb = route_of[a], route_of[b]
+        if ra == rb or len(routes[ra]) + len(routes[rb]) > capacity:
+            continue
+        left, right = routes[ra], routes[rb]
+        # Only join at route ends (a at one end, b at the other)
+        if left[-1] == a and right[0] == b:
+            merged = left + right
+        elif right[-1] == b and left[0] == a:
+            merged = right + left
+        elif left[-1] == a and right[-1] == b:
+            merged = left + right[::-1]
+        elif left[0] == a and right[0] == b:
+            merged = left[::-1] + right
+        else:
+            continue
+        routes[ra] = merged
+        del routes[rb]
+        for node in right:
+            route_of[node] = ra
+    return list(routes.values())
+
+
+def _route_length(start, stops, dist):
+    path = [start] + stops
+    return float(sum(dist[path[x], path[x + 1]] for x in range(len(path) - 1)))
+
+
+def two_opt(start, stops, dist):
+    """Open-path 2-opt: reverse segments while it shortens the trip from `start` through `stops`."""
+    best = list(stops)
+    improved = True
+    while improved and len(best) > 2:
+        improved = False
+        for x in range(len(best) - 1):
+            prev = start if x == 0 else best[x - 1]
+            for y in range(x + 1, len(best)):
+                after = best[y + 1] if y + 1 < len(best) else None
+                old = dist[prev, best[x]] + (dist[best[y], after] if after is not None else 0.0)
+                new = dist[prev, best[y]] + (dist[best[x], after] if after is not None else 0.0)
+                if new < old - 1e-9:
+                    best[x:y + 1] = reversed(best[x:y + 1])
+                    improved = True
+    return best
+
+
+def solve(deliveries, dist, capacity, radius=PICKUP_RADIUS_KM):
+    """
+    deliveries: list of (delivery_id, origin_index, destination_index), oldest first.
+    Returns routes: [{"pickups": [(place, [ids])...], "drops": [(place, id)...], "distance_km": float}]
+    """
+    if not deliveries:
+        return []
+    dist = np.asarray(dist)
+    ids = [d[0] for d in deliveries]
+    origins = np.array([d[1] for d in deliveries])
+    dests = np.array([d[2] for d in deliveries])
+
+    routes = []
+    for members in _cluster_by_pickup(origins, dist, radius):
+        depot = int(origins[members[0]])
+        for group in _savings_routes(depot, dests[members], dist, capacity):
+            picked = members[group]
+
+            # Pickups: nearest-neighbour walk over the distinct pickup places, starting at the seed
+            pickup_places = list(dict.fromkeys(int(origins[m]) for m in picked))
+            walk = [pickup_places.pop(0)]
+            while pickup_places:
+                nxt = min(pickup_places, key=lambda p: dist[walk[-1], p])
+                pickup_places.remove(nxt)
+                walk.append(nxt)
+
+            drop_order = two_opt(walk[-1], [int(dests[m]) for m in picked], dist)
+            # Map places back to deliveries (several deliveries may share a drop place)
+            by_place = {}
+            for m in picked:
+                by_place.setdefault(int(dests[m]), []).append(ids[m])
+            drops = [(place, by_place[place].pop(0)) for place in drop_order]
+
+            routes.append({
+                "pickups": [(p, [ids[m] for m in picked if int(origins[m]) == p]) for p in walk],
+                "drops": drops,
+                "distance_km": round(
+                    _route_length(walk[0], walk[1:], dist) + _route_length(walk[-1], drop_order, dist), 2
+                ),
+            })
+    return routes
@@ -0,0 +1,370 @@
+"""
+Trip telemetry: GPS pings from the driver app.
+
+The app posts pings in batches (POST /api/driver/{id}/telemetry). Nothing is
+written per ping:
+
+1. BUFFER:  each driver's pings for its ACTIVE route collect in memory as packed
+            integer arrays (ms since epoch, 1e-5 degree lat/lon; ~1 m). A driver's
+            latest ping is also kept for the buyer's "where is my delivery" read.
+2. FLUSH:   every TELEMETRY_FLUSH_SECONDS the runs that are TELEMETRY_SEGMENT_SECONDS
+            old (or whose route changed) become telemetry_segments rows, written in
+            one executemany. A segment stores the first point, then the deltas as
+            int8/16/32 columns (whichever is the narrowest that fits), so a ping every
+            5 s costs ~6 bytes instead of a row.
+
+Memory is bounded: past TELEMETRY_MAX_POINTS buffered pings (e.g. the database is
+down) the endpoint answers 503 and the app keeps its batch for the next try.
+Pings outside a route only move the driver's last position; they aren't stored.
+
+The last position lives on the worker that received the ping; the other workers
+answer from the driver's newest stored segment (at most a segment old).
+"""
+import logging
+import math
+import os
+import struct
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import numpy as np
+from sqlalchemy import insert, select
+
+from app.coordination import coordinator
+from app.database import engine
+from app.logs import get_logger, log_event
+from app.models import Delivery, DeliveryStatus, Driver, Route, TelemetrySegment
+
+logger = get_logger(__name__)
+
+# --- 1. SETTINGS ---
+TELEMETRY_FLUSH_SECONDS = float(os.getenv("TELEMETRY_FLUSH_SECONDS", "5"))
+TELEMETRY_SEGMENT_SECONDS = float(os.getenv("TELEMETRY_SEGMENT_SECONDS", "60"))
+# Buffered pings across all drivers (~16 bytes each); beyond this the endpoint answers 503
+TELEMETRY_MAX_POINTS = int(os.getenv("TELEMETRY_MAX_POINTS", "500000"))
+# A last position older than this is no longer shown
+POSITION_TTL_SECONDS = float(os.getenv("POSITION_TTL_SECONDS", "900"))
+# Driver -> active route, and delivery reference -> driver, are re-read after this
+ROUTE_CACHE_SECONDS = float(os.getenv("ROUTE_CACHE_SECONDS", "60"))
+TRACK_CACHE_SIZE = int(os.getenv("TRACK_CACHE_SIZE", "20000"))
+MAX_BATCH_POINTS = 500
+SEGMENT_MAX_POINTS = 720  # An hour at 5 s; a chattier app just gets more segments
+# Accepted ping times, relative to the server clock (phones queue pings while offline)
+MAX_PING_AGE_SECONDS = 6 * 3600
+MAX_PING_LEAD_SECONDS = 60
+
+E5 = 100_000  # Coordinates are stored as integer 1e-5 degrees
+_DTYPES = {1: np.int8, 2: np.int16, 4: np.int32}
+_RANGES = [(width, int(np.iinfo(dtype).min), int(np.iinfo(dtype).max)) for width, dtype in _DTYPES.items()]
+
+
+class Full(Exception):
+    """Too many pings buffered; the app should retry the batch later."""
+
+
+# --- 2. SEGMENT ENCODING ---
+def _width(deltas):
+    if not len(deltas):
+        return 1
+    lo, hi = int(deltas.min()), int(deltas.max())
+    for width, low, high in _RANGES:
+        if low <= lo and hi <= high:
+            return width
+    raise ValueError("Delta does not fit in 32 bits")
+
+
+def encode(t_ms, lat, lon):
+    """Time-sorted int arrays -> bytes: first lat/lon, three column widths, then the delta columns."""
+    columns = [np.diff(t_ms), np.diff(lat), np.diff(lon)]
+    widths = [_width(c) for c in columns]
+    return b"".join([
+        struct.pack("<ii3B", int(lat[0]), int(lon[0]), *widths),
+        *(c.astype(_DTYPES[w]).tobytes() for c, w in zip(columns, widths)),
+    ])
+
+
+def decode(data, points, started_at):
+    """Inverse of encode. Returns (epoch seconds, lat, lon) float arrays."""
+    lat0, lon0, *widths = struct.unpack_from("<ii3B", data)
+    offset, columns = struct.calcsize("<ii3B"), []
+    for width in widths:
+        deltas = np.frombuffer(data, dtype=_DTYPES[width], count=points - 1, offset=offset)
+        offset += width * (points - 1)
+        columns.append(np.concatenate([[0], np.cumsum(deltas, dtype=np.int64)]))
+    t, lat, lon = columns
+    return _epoch(started_at) + t / 1000, (lat0 + lat) / E5, (lon0 + lon) / E5
+
+
+def _epoch(value):
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)  # SQLite stores UTC without a zone
+    return value.timestamp()
+
+
+def _quantize(points, now):
+    """[(epoch seconds, lat, lon), ...] -> [(ms, lat e5, lon e5), ...], dropping anything implausible."""
+    clean = []
+    for t, lat, lon in points:
+        if not (math.isfinite(t) and math.isfinite(lat) and math.isfinite(lon)):
+            continue
+        if -90 <= lat <= 90 and -180 <= lon <= 180 and now - MAX_PING_AGE_SECONDS <= t <= now + MAX_PING_LEAD_SECONDS:
+            clean.append((int(t * 1000), round(lat * E5), round(lon * E5)))
+    return clean
+
+
+# --- 3. BUFFER ---
+class _Run:
+    """One driver's pings on one route, not yet written."""
+    __slots__ = ("route_id", "opened", "t", "lat", "lon")
+
+    def __init__(self, route_id):
+        self.route_id = route_id
+        self.opened = time.monotonic()
+        self.t, self.lat, self.lon = array("q"), array("i"), array("i")
+
+
+class TripRecorder:
+    def __init__(self):
+        self._runs = {}       # driver id -> _Run
+        self._closed = []     # (driver id, _Run) whose route changed, waiting for the flush
+        self._unwritten = []  # (segment row, points) from a failed flush
+        self._last = {}       # driver id -> (ms, lat e5, lon e5)
+        self._buffered = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def ingest(self, driver_id, route_id, points, now=None):
+        """Buffers a batch of (epoch seconds, lat, lon). Returns how many were accepted. Raises Full."""
+        clean = _quantize(points, now if now is not None else time.time())
+        if not clean:
+            return 0
+        latest = max(clean)
+        with self._lock:
+            previous = self._last.get(driver_id)
+            if previous is None or latest[0] >= previous[0]:
+                self._last[driver_id] = latest
+            if route_id is None:
+                return len(clean)
+            if self._buffered + len(clean) > TELEMETRY_MAX_POINTS:
+                raise Full()
+            run = self._runs.get(driver_id)
+            if run is None or run.route_id != route_id or len(run.t) + len(clean) > SEGMENT_MAX_POINTS:
+                if run is not None:
+                    self._closed.append((driver_id, run))
+                run = self._runs[driver_id] = _Run(route_id)
+            for t, lat, lon in clean:
+                run.t.append(t)
+                run.lat.append(lat)
+                run.lon.append(lon)
+            self._buffered += len(clean)
+        return len(clean)
+
+    def position(self, driver_id, now=None):
+        """(epoch seconds, lat, lon) of the driver's latest ping on this worker, or None."""
+        last = self._last.get(driver_id)
+        if last is None or last[0] / 1000 < (now if now is not None else time.time()) - POSITION_TTL_SECONDS:
+            return None
+        return last[0] / 1000, last[1] / E5, last[2] / E5
+
+    def pending(self, route_id):
+        """Buffered (epoch seconds, lat, lon) for a route, oldest first, duplicates dropped."""
+        with self._lock:
+            runs = [r for r in self._runs.values() if r.route_id == route_id]
+            runs += [r for _, r in self._closed if r.route_id == route_id]
+            points = [(t / 1000, lat / E5, lon / E5) for r in runs for t, lat, lon in zip(r.t, r.lat, r.lon)]
+        return sorted(set(points))
+
+    @property
+    def buffered(self):
+        return self._buffered
+
+    def flush(self, force=False):
+        """Writes finished runs (all runs with force=True) as segments. Returns the number of segments written."""
+        with self._flush_lock:
+            cutoff = time.monotonic() - TELEMETRY_SEGMENT_SECONDS
+            with self._lock:
+                due, self._closed = self._closed, []
+                for driver_id, run in list(self._runs.items()):
+                    if force or run.opened <= cutoff:
+                        due.append((driver_id, self._runs.pop(driver_id)))
+                stale = time.time() * 1000 - POSITION_TTL_SECONDS * 1000
+                for driver_id in [d for d, last in self._last.items() if last[0] < stale]:
+                    del self._last[driver_id]
+                retry, self._unwritten = self._unwritten, []
+
+            segments = retry + [_segment(driver_id, run) for driver_id, run in due]
+            if not segments:
+                return 0
+            try:
+                with engine.begin() as conn:
+                    conn.execute(insert(TelemetrySegment), [row for row, _ in segments])
+            except Exception as e:
+                with self._lock:
+                    self._unwritten = segments + self._unwritten  # still counted in _buffered
+                log_event(logger, "telemetry.flush_failed", logging.ERROR, error=str(e), segments=len(segments))
+                return 0
+            points = sum(n for _, n in segments)
+            with self._lock:
+                self._buffered -= points
+        log_event(logger, "telemetry.flushed", segments=len(segments), points=points)
+        return len(segments)
+
+    # --- lifecycle ---
+    def _run(self):
+        while not self._stop.wait(TELEMETRY_FLUSH_SECONDS):
+            self.flush()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="telemetry-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self.flush(force=True)
+
+
+def _segment(driver_id, run):
+    t = np.frombuffer(run.t, dtype=np.int64)
+    # Time order, and a batch the app re-sent after a timeout counts once
+    t, first = np.unique(t, return_index=True)
+    lat = np.frombuffer(run.lat, dtype=np.int32)[first].astype(np.int64)
+    lon = np.frombuffer(run.lon, dtype=np.int32)[first].astype(np.int64)
+    return {
+        "driver_id": driver_id,
+        "route_id": run.route_id,
+        "started_at": datetime.fromtimestamp(t[0] / 1000, timezone.utc),
+        "ended_at": datetime.fromtimestamp(t[-1] / 1000, timezone.utc),
+        "points": len(t),
+        "last_lat": lat[-1] / E5,
+        "last_lon": lon[-1] / E5,
+        "data": encode(t - t[0], lat, lon),
+    }, len(run.t)
+
+
+recorder = TripRecorder()
+
+
+# --- 4. LOOKUPS (cached; pings and buyer reads mostly never touch the database) ---
+_routes = {}  # driver id -> (active route id or None, expires)
+_deliveries = OrderedDict()  # reference -> (status, driver id or None, expires), LRU
+_deliveries_lock = threading.Lock()
+
+
+def _on_route_assigned(payload):
+    _routes[payload.get("driver_id")] = (payload.get("route_id"), time.monotonic() + ROUTE_CACHE_SECONDS)
+
+
+def _invalidate_routes(driver_id):
+    if driver_id is None:
+        _routes.clear()
+    else:
+        _routes.pop(driver_id, None)
+
+
+coordinator.subscribe("route.assigned", _on_route_assigned)
+coordinator.register_cache("telemetry.routes", _invalidate_routes)
+
+
+MISS = object()  # Returned by the cached_* lookups: ask the database (load_*)
+
+
+def cached_route(driver_id):
+    """The driver's ACTIVE route id (None if idle), or MISS."""
+    cached = _routes.get(driver_id)
+    if cached and cached[1] > time.monotonic():
+        return cached[0]
+    return MISS
+
+
+def load_route(db, driver_id):
+    """cached_route after a miss. Raises LookupError for an unknown driver."""
+    row = db.execute(
+        select(Driver.id, Route.id)
+        .outerjoin(Route, (Route.driver_id == Driver.id) & (Route.status == "ACTIVE"))
+        .where(Driver.id == driver_id)
+        .limit(1)
+    ).first()
+    if row is None:
+        raise LookupError(driver_id)
+    _routes[driver_id] = (row[1], time.monotonic() + ROUTE_CACHE_SECONDS)
+    return row[1]
+
+
+def cached_delivery(reference):
+    """(delivery status, driver id while ASSIGNED else None), or MISS."""
+    with _deliveries_lock:
+        cached = _deliveries.get(reference)
+        if cached and cached[2] > time.monotonic():
+            _deliveries.move_to_end(reference)
+            return cached[0], cached[1]
+    return MISS
+
+
+def load_delivery(db, reference):
+    """cached_delivery after a miss. Raises LookupError for an unknown reference."""
+    row = db.execute(
+        select(Delivery.status, Route.driver_id)
+        .outerjoin(Route, Route.id == Delivery.route_id)
+        .where(Delivery.reference == reference)
+    ).first()
+    if row is None:
+        raise LookupError(reference)
+    status, driver_id = row[0], row[1] if row[0] == DeliveryStatus.ASSIGNED else None
+    # Not on a route yet: look again soon, the dispatcher runs every few seconds
+    waiting = status in (DeliveryStatus.AWAITING_PAYMENT, DeliveryStatus.QUEUED)
+    expires = time.monotonic() + (TELEMETRY_FLUSH_SECONDS if waiting else ROUTE_CACHE_SECONDS)
+    with _deliveries_lock:
+        _deliveries[reference] = (status, driver_id, expires)
+        _deliveries.move_to_end(reference)
+        while len(_deliveries) > TRACK_CACHE_SIZE:
+            _deliveries.popitem(last=False)
+    return status, driver_id
+
+
+def stored_position(db, driver_id):
+    """(epoch seconds, lat, lon) from the driver's newest segment, for pings another worker received. None if stale."""
+    row = db.execute(
+        select(TelemetrySegment.ended_at, TelemetrySegment.last_lat, TelemetrySegment.last_lon)
+        .where(TelemetrySegment.driver_id == driver_id)
+        .order_by(TelemetrySegment.ended_at.desc())
+        .limit(1)
+    ).first()
+    if row is None or _epoch(row.ended_at) < time.time() - POSITION_TTL_SECONDS:
+        return None
+    return _epoch(row.ended_at), row.last_lat, row.last_lon
+
+
+def trail(db, route_id):
+    """Every ping of a route (stored and still buffered here): {"t": [...], "lat": [...], "lon": [...]}."""
+    segments = db.execute(
+        select(TelemetrySegment.started_at, TelemetrySegment.points, TelemetrySegment.data)
+        .where(TelemetrySegment.route_id == route_id)
+        .order_by(TelemetrySegment.started_at)
+    ).all()
+    parts = [decode(s.data, s.points, s.started_at) for s in segments]
+    pending = recorder.pending(route_id)
+    if pending:
+        parts.append(tuple(np.array(column) for column in zip(*pending)))
+    if not parts:
+        return {"t": [], "lat": [], "lon": []}
+    t, lat, lon = (np.concatenate(column) for column in zip(*parts))
+    order = np.argsort(t, kind="stable")
+    return {"t": np.round(t[order], 3).tolist(), "lat": np.round(lat[order], 5).tolist(),
+            "lon": np.round(lon[order], 5).tolist()}
+
+
+# --- 5. LIFECYCLE ---
+def start():
+    recorder.start()
+
+
+def stop():
+    recorder.stop()
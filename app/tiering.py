@@ -0,0 +1,192 @@
+"""
+Hot/cold tiering.
+
+Finished rows older than ARCHIVE_AFTER_DAYS move from the hot tables to their
+*_archive twins (app/models.py), so the tables every request touches stay small:
+
+- orders:      CONFIRMED / CANCELLED_BY_SELLER / COMPLETED
+- withdrawals: PROCESSED / FAILED
+- items:       sold, with no hot order and no change-feed entry still pointing at them
+
+Each batch copies rows, bumps archive_rollups and deletes the originals in one
+transaction, then pauses, so archiving never hogs the primary. Dashboards add the
+rollups to their hot aggregates; unified() reads both tiers as one table.
+"""
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, exists, func, insert, literal, select, update
+
+from app.coordination import coordinator
+from app.database import SessionLocal
+from app.logs import get_logger, log_event
+from app.models import (
+    ArchiveRollup, Item, ItemArchive, ItemChange, Order, OrderArchive, OrderStatus,
+    Withdrawal, WithdrawalArchive, WithdrawalStatus,
+)
+
+logger = get_logger(__name__)
+
+# --- 1. SETTINGS ---
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+TIERING_BATCH = int(os.getenv("TIERING_BATCH", "1000"))
+# Pause between batches: lets normal traffic through and replicas keep up
+TIERING_PAUSE_SECONDS = float(os.getenv("TIERING_PAUSE_SECONDS", "0.2"))
+TIERING_INTERVAL_SECONDS = float(os.getenv("TIERING_INTERVAL_SECONDS", "3600"))
+
+TIERS = {
+    "orders": (Order.__table__, OrderArchive),
+    "withdrawals": (Withdrawal.__table__, WithdrawalArchive),
+    "items": (Item.__table__, ItemArchive),
+}
+FINAL_ORDER_STATUSES = [OrderStatus.CONFIRMED, OrderStatus.CANCELLED_BY_SELLER, OrderStatus.COMPLETED]
+FINAL_WITHDRAWAL_STATUSES = [WithdrawalStatus.PROCESSED, WithdrawalStatus.FAILED]
+
+_stop = threading.Event()
+
+
+# --- 2. UNIFIED READ PATH ---
+def unified(name):
+    """Hot + archive rows of `name` as one subquery (same column names, plus `tier`)."""
+    hot, cold = TIERS[name]
+    return select(*hot.c, literal("hot").label("tier")).union_all(
+        select(*[cold.c[c.name] for c in hot.c], literal("archive").label("tier"))
+    ).subquery(f"{name}_all")
+
+
+def rollup(db, metric, subject_id=0):
+    """(total, count) already moved to the archive for this metric."""
+    row = db.query(ArchiveRollup.total, ArchiveRollup.count).filter(
+        ArchiveRollup.metric == metric, ArchiveRollup.subject_id == subject_id
+    ).first()
+    return (row.total or 0.0, row.count or 0) if row else (0.0, 0)
+
+
+# --- 3. MOVING ROWS ---
+def _bump(db, rows):
+    """rows: (metric, subject_id, total, count). Only the archiver writes rollups, so update-then-insert is safe."""
+    for metric, subject_id, total, count in rows:
+        done = db.execute(
+            update(ArchiveRollup)
+            .where(ArchiveRollup.metric == metric, ArchiveRollup.subject_id == subject_id)
+            .values(total=ArchiveRollup.total + total, count=ArchiveRollup.count + count)
+        ).rowcount
+        if not done:
+            db.add(ArchiveRollup(metric=metric, subject_id=subject_id, total=total, count=count))
+
+
+def _rollups(db, name, ids):
+    if name == "orders":
+        rows = db.query(Order.status, func.sum(Order.amount_paid), func.count()).filter(
+            Order.id.in_(ids)).group_by(Order.status).all()
+        return [(f"orders.{status.value}", 0, total or 0.0, count) for status, total, count in rows]
+    if name == "withdrawals":
+        rows = db.query(Withdrawal.agent_id, Withdrawal.status, func.sum(Withdrawal.amount_net), func.count()).filter(
+            Withdrawal.id.in_(ids)).group_by(Withdrawal.agent_id, Withdrawal.status).all()
+        return [(f"withdrawals.{status.value}", agent_id, total or 0.0, count) for agent_id, status, total, count in rows]
+    rows = db.query(Item.lister_id, func.sum(Item.commission_agent), func.count()).filter(
+        Item.id.in_(ids)).group_by(Item.lister_id).all()
+    return [("items.sold", lister_id, total or 0.0, count) for lister_id, total, count in rows]
+
+
+def _candidates(name, cutoff):
+    if name == "orders":
+        stmt = select(Order.id).where(Order.status.in_(FINAL_ORDER_STATUSES), Order.created_at < cutoff)
+    elif name == "withdrawals":
+        stmt = select(Withdrawal.id).where(
+            Withdrawal.status.in_(FINAL_WITHDRAWAL_STATUSES),
+            func.coalesce(Withdrawal.processed_at, Withdrawal.created_at) < cutoff,
+        )
+    else:
+        stmt = select(Item.id).where(
+            Item.is_sold == True,
+            Item.created_at < cutoff,
+            ~exists().where(Order.item_id == Item.id),
+            ~exists().where(ItemChange.item_id == Item.id),
+        )
+    # SKIP LOCKED: rows a request is busy with are simply left for the next run
+    return stmt.order_by(TIERS[name][0].c.id).limit(TIERING_BATCH).with_for_update(skip_locked=True)
+
+
+def _archive_batch(db, name, cutoff):
+    ids = db.execute(_candidates(name, cutoff)).scalars().all()
+    if not ids:
+        return 0
+    hot, cold = TIERS[name]
+    columns = [c.name for c in hot.c]
+    _bump(db, _rollups(db, name, ids))
+    db.execute(insert(cold).from_select(columns, select(*hot.c).where(hot.c.id.in_(ids))))
+    db.execute(delete(hot).where(hot.c.id.in_(ids)))
+    db.commit()
+    return len(ids)
+
+
+def _prune_changes(db, cutoff):
+    """Drops the change-feed prefix older than the cutoff; clients behind it get a full snapshot instead."""
+    through = db.query(func.max(ItemChange.id)).filter(ItemChange.created_at < cutoff).scalar()
+    if not through:
+        return 0
+    pruned = 0
+    while not _stop.is_set():
+        ids = db.execute(
+            select(ItemChange.id).where(ItemChange.id <= through).order_by(ItemChange.id).limit(TIERING_BATCH)
+        ).scalars().all()
+        if not ids:
+            break
+        db.execute(delete(ItemChange).where(ItemChange.id.in_(ids)))
+        db.commit()
+        pruned += len(ids)
+        time.sleep(TIERING_PAUSE_SECONDS)
+    return pruned
+
+
+def run_archival(days=None, wait=True):
+    """
+    One full pass. Returns how many rows moved per table, or None if wait=False and a pass
+    is already running somewhere. The "archiver" leader schedules these; an admin may start one
+    from any worker, and the "archive-pass" lock (released afterwards) keeps the two from overlapping.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=ARCHIVE_AFTER_DAYS if days is None else days)
+    started = time.perf_counter()
+    summary = {}
+    with coordinator.exclusive("archive-pass", wait=wait) as held:
+        if not held:
+            return None
+        _archive_all(cutoff, summary)
+    summary["seconds"] = round(time.perf_counter() - started, 3)
+    if any(summary[k] for k in ("item_changes", "orders", "withdrawals", "items")):
+        log_event(logger, "tiering.archived", **summary)
+    return summary
+
+
+def _archive_all(cutoff, summary):
+    db = SessionLocal()
+    try:
+        summary["item_changes"] = _prune_changes(db, cutoff)
+        # Orders before items: an item can only leave once no hot order points at it.
+        for name in ("orders", "withdrawals", "items"):
+            moved = 0
+            while not _stop.is_set():
+                n = _archive_batch(db, name, cutoff)
+                if not n:
+                    break
+                moved += n
+                time.sleep(TIERING_PAUSE_SECONDS)
+            summary[name] = moved
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+# --- 4. LIFECYCLE ---
+def start():
+    _stop.clear()
+    coordinator.run_as_leader("archiver", run_archival, TIERING_INTERVAL_SECONDS)
+
+
+def stop():
+    _stop.set()
@@ -0,0 +1,303 @@
+"""
+Paystack webhook ingestion.
+
+The endpoint (POST /api/payment/webhook) only verifies the signature and stores
+the event; everything else happens here, off the request path:
+
+1. INGEST:  events from all in-flight requests are written in one multi-row
+            INSERT ... ON CONFLICT DO NOTHING (group commit), so a retry storm
+            costs one round trip per batch and redeliveries vanish on the unique
+            (event, reference) index. The request is acknowledged once its batch commits.
+2. PROCESS: a worker thread claims RECEIVED events (SKIP LOCKED, like payouts) and
+            applies them in bulk; every transition is conditional, so replays are no-ops.
+            - charge.success:                   delivery AWAITING_PAYMENT -> QUEUED (dispatcher assigns a driver)
+            - transfer.success/failed/reversed: PROCESSING withdrawal settled through payouts.reconcile
+"""
+import hashlib
+import hmac
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app.database import SessionLocal, engine
+from app.logs import get_logger, log_event
+from app.models import (
+    Delivery, DeliveryStatus, PaymentEvent, PaymentEventStatus, Withdrawal, WithdrawalStatus,
+)
+
+logger = get_logger(__name__)
+
+# --- 1. SETTINGS ---
+WEBHOOK_BATCH = int(os.getenv("WEBHOOK_BATCH", "500"))
+# How long the ingester waits for more events before writing a batch
+WEBHOOK_FLUSH_MS = float(os.getenv("WEBHOOK_FLUSH_MS", "5"))
+# Beyond this backlog the endpoint answers 503 and Paystack retries later
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "20000"))
+WEBHOOK_POLL_SECONDS = float(os.getenv("WEBHOOK_POLL_SECONDS", "1"))
+# A claim older than this (worker died mid-batch) is picked up again
+WEBHOOK_CLAIM_TIMEOUT_SECONDS = float(os.getenv("WEBHOOK_CLAIM_TIMEOUT_SECONDS", "300"))
+
+TRANSFER_EVENTS = {"transfer.success": "success", "transfer.failed": "failed", "transfer.reversed": "failed"}
+
+
+def verify_signature(body: bytes, signature, secret_key: str) -> bool:
+    """x-paystack-signature is HMAC-SHA512 of the raw body, keyed with the secret key."""
+    expected = hmac.new(secret_key.encode(), body, hashlib.sha512).hexdigest()
+    # compare_digest: comparison time doesn't leak how many leading characters matched.
+    # Bytes, because it raises TypeError on non-ASCII str and the header is attacker-controlled.
+    return hmac.compare_digest(expected.encode(), (signature or "").encode("utf-8", "replace"))
+
+
+# --- 2. INGEST (group commit) ---
+class Ingester:
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=WEBHOOK_QUEUE_SIZE)
+        self._insert = pg_insert if engine.dialect.name == "postgresql" else sqlite_insert
+        self._thread = None
+        self._stop = threading.Event()
+
+    def submit(self, event: str, reference: str, payload: str) -> Future:
+        """Future resolves once the event is durably stored. Raises queue.Full under overload."""
+        future = Future()
+        self._queue.put_nowait(({"event": event, "reference": reference, "payload": payload}, future))
+        return future
+
+    def _next_batch(self):
+        try:
+            batch = [self._queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.perf_counter() + WEBHOOK_FLUSH_MS / 1000
+        while len(batch) < WEBHOOK_BATCH:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        stmt = self._insert(PaymentEvent).on_conflict_do_nothing(index_elements=["event", "reference"])
+        try:
+            with engine.begin() as conn:
+                conn.execute(stmt, [row for row, _ in batch])
+        except Exception as e:
+            log_event(logger, "webhook.ingest_failed", logging.ERROR, error=str(e), events=len(batch))
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for _, future in batch:
+            future.set_result(True)
+        worker.wake()
+
+    def _run(self):
+        while not self._stop.is_set() or not self._queue.empty():
+            batch = self._next_batch()
+            if batch:
+                self._write(batch)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="webhook-ingest", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+
+# --- 3. PROCESS ---
+def claim_events(db, size=WEBHOOK_BATCH):
+    """RECEIVED (or long-abandoned PROCESSING) -> PROCESSING for up to `size` events. Returns them."""
+    batch_id = uuid.uuid4().hex
+    now = datetime.now(timezone.utc)
+    claimable = select(PaymentEvent.id).where(or_(
+        PaymentEvent.status == PaymentEventStatus.RECEIVED,
+        (PaymentEvent.status == PaymentEventStatus.PROCESSING)
+        & (PaymentEvent.claimed_at < now - timedelta(seconds=WEBHOOK_CLAIM_TIMEOUT_SECONDS)),
+    )).order_by(PaymentEvent.id).limit(size).with_for_update(skip_locked=True).scalar_subquery()
+    db.execute(
+        update(PaymentEvent)
+        .where(PaymentEvent.id.in_(claimable))
+        .values(status=PaymentEventStatus.PROCESSING, claimed_at=now, batch_id=batch_id)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return db.execute(
+        select(PaymentEvent.id, PaymentEvent.event, PaymentEvent.reference, PaymentEvent.payload)
+        .where(PaymentEvent.batch_id == batch_id)
+        .order_by(PaymentEvent.id)
+    ).all()
+
+
+def _data(event):
+    try:
+        data = json.loads(event.payload).get("data")
+    except (AttributeError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _apply_charges(db, events, outcome):
+    by_reference = {e.reference: e for e in events}
+    deliveries = db.execute(
+        select(Delivery.id, Delivery.reference, Delivery.amount_ngn, Delivery.status)
+        .where(Delivery.reference.in_(list(by_reference)))
+    ).all()
+    found = {d.reference: d for d in deliveries}
+    paid = []
+    for reference, event in by_reference.items():
+        delivery = found.get(reference)
+        data = _data(event)
+        try:
+            amount = int(data.get("amount") or 0)
+        except (TypeError, ValueError):
+            # One bad event must not fail (and keep re-failing) the whole claimed batch
+            amount = None
+        if delivery is None:
+            outcome[event.id] = (PaymentEventStatus.IGNORED, "Unknown reference")
+        elif delivery.status != DeliveryStatus.AWAITING_PAYMENT:
+            outcome[event.id] = (PaymentEventStatus.IGNORED, f"Delivery already {delivery.status.value}")
+        elif amount is None:
+            outcome[event.id] = (PaymentEventStatus.FAILED, f"Malformed amount {data.get('amount')!r}"[:200])
+        elif data.get("currency", "NGN") != "NGN" or amount < delivery.amount_ngn * 100:
+            outcome[event.id] = (PaymentEventStatus.FAILED, f"Paid {data.get('amount')} {data.get('currency')}, "
+                                                           f"expected {delivery.amount_ngn * 100} NGN kobo")
+        else:
+            paid.append(delivery.id)
+            outcome[event.id] = (PaymentEventStatus.PROCESSED, None)
+    if paid:
+        # Conditional: a delivery another worker already moved stays where it is
+        db.execute(
+            update(Delivery)
+            .where(Delivery.id.in_(paid), Delivery.status == DeliveryStatus.AWAITING_PAYMENT)
+            .values(status=DeliveryStatus.QUEUED)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+    return len(paid)
+
+
+def _apply_transfers(db, events, outcome):
+    # payouts imports app.routers.payment, which imports this module
+    from app import payouts
+
+    by_reference = {}
+    for e in events:
+        if e.reference in by_reference:  # e.g. transfer.failed + transfer.reversed: settle once
+            outcome[e.id] = (PaymentEventStatus.IGNORED, "Superseded in the same batch")
+        else:
+            by_reference[e.reference] = e
+    prefix = payouts.transfer_reference("")
+    ids = {int(r[len(prefix):]): r for r in by_reference if r.startswith(prefix) and r[len(prefix):].isdigit()}
+    # Row locks: a concurrent batch settling the same withdrawal waits, then sees it's no longer PROCESSING
+    rows = db.execute(
+        select(Withdrawal.id, Withdrawal.agent_id, Withdrawal.amount_requested)
+        .where(Withdrawal.id.in_(list(ids)), Withdrawal.status == WithdrawalStatus.PROCESSING)
+        .with_for_update()
+    ).all()
+    claimed = {ids[row.id]: row for row in rows}
+    results = []
+    for reference, event in by_reference.items():
+        if reference not in claimed:
+            outcome[event.id] = (PaymentEventStatus.IGNORED, "No PROCESSING withdrawal for this reference")
+            continue
+        data = _data(event)
+        results.append({
+            "reference": reference,
+            "status": TRANSFER_EVENTS[event.event],
+            "transfer_code": data.get("transfer_code"),
+            "message": data.get("reason") or data.get("gateway_response"),
+        })
+        outcome[event.id] = (PaymentEventStatus.PROCESSED, None)
+    if results:
+        payouts.reconcile(db, results, claimed)
+    else:
+        db.rollback()  # release the row locks
+    return len(results)
+
+
+def process_batch(db):
+    """Applies one claimed batch. Returns the number of events handled (0 = nothing pending)."""
+    events = claim_events(db)
+    if not events:
+        return 0
+    outcome = {}
+    charges = [e for e in events if e.event == "charge.success"]
+    transfers = [e for e in events if e.event in TRANSFER_EVENTS]
+    for e in events:
+        if e.event != "charge.success" and e.event not in TRANSFER_EVENTS:
+            outcome[e.id] = (PaymentEventStatus.IGNORED, "Event not handled")
+
+    queued = _apply_charges(db, charges, outcome) if charges else 0
+    settled = _apply_transfers(db, transfers, outcome) if transfers else 0
+
+    now = datetime.now(timezone.utc)
+    db.execute(update(PaymentEvent), [
+        {"id": event_id, "status": status, "note": note, "processed_at": now}
+        for event_id, (status, note) in outcome.items()
+    ])
+    db.commit()
+    log_event(logger, "webhook.processed", events=len(events), deliveries_queued=queued, withdrawals_settled=settled)
+    return len(events)
+
+
+class Worker:
+    def __init__(self):
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            db = SessionLocal()
+            try:
+                while not self._stop.is_set() and process_batch(db):
+                    pass
+            except Exception as e:
+                db.rollback()
+                log_event(logger, "webhook.worker_failed", logging.ERROR, error=str(e))
+            finally:
+                db.close()
+            self._wake.wait(WEBHOOK_POLL_SECONDS)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="webhook-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+
+ingester = Ingester()
+worker = Worker()
+
+
+# --- 4. LIFECYCLE ---
+def start():
+    ingester.start()
+    worker.start()
+
+
+def stop():
+    ingester.stop()
+    worker.stop()
@@ -0,0 +1,132 @@
+"""
+Dispatcher benchmark: multi-drop routes vs one driver per delivery.
+
+    python -m bench.dispatch --orders 1000
+    DATABASE_URL=sqlite:////tmp/bench_dispatch.db python -m bench.dispatch --orders 1000   # + end-to-end
+
+Without DATABASE_URL only the solver is measured (the end-to-end run wipes the database).
+"""
+import argparse
+import json
+import os
+import random
+import time
+
+from app import dispatch, quotes, routing
+from app.database import Base, SessionLocal, engine
+from app.dispatch import VEHICLE_CAPACITY
+from app.models import Delivery, DeliveryStatus, Driver, Route
+
+# Time at each stop (parking, handover), on top of driving
+STOP_MINUTES = 5
+# Sellers cluster around a few markets; buyers are everywhere.
+HUBS = ["Ikeja", "Yaba", "Lekki", "Surulere", "Ikorodu", "Oshodi-Isolo", "Alimosho", "Lagos Island"]
+
+
+def synthetic_orders(count, bike_share, seed):
+    rng = random.Random(seed)
+    lagos = [i for i, state in enumerate(quotes.PLACE_STATES) if state == "Lagos"]
+    hubs = [quotes.place_index(name) for name in HUBS if quotes.place_index(name) >= 0] or lagos[:5]
+    orders = []
+    for delivery_id in range(1, count + 1):
+        vehicle = "Bike" if rng.random() < bike_share else "Van"
+        orders.append((delivery_id, vehicle, rng.choice(hubs), rng.choice(lagos)))
+    return orders
+
+
+def driver_hours(vehicle, distance_km, stops):
+    return distance_km / quotes.CITY_SPEED_KMH[vehicle] + stops * STOP_MINUTES / 60
+
+
+def solve_all(orders):
+    routes = []
+    for vehicle, capacity in VEHICLE_CAPACITY.items():
+        batch = [(i, o, d) for i, v, o, d in orders if v == vehicle]
+        routes += [(vehicle, r) for r in routing.solve(batch, quotes.DISTANCE_KM, capacity)]
+    return routes
+
+
+def end_to_end(orders, drivers):
+    """Seeds QUEUED deliveries + AVAILABLE drivers, then times one real dispatch_once() (pool already warm)."""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        db.bulk_save_objects([
+            Driver(name=f"Driver {n}", phone=f"0809{n:07d}", vehicle_type=v, status="AVAILABLE")
+            for n, v in enumerate(["Bike"] * drivers["Bike"] + ["Van"] * drivers["Van"])
+        ])
+        db.bulk_save_objects([
+            Delivery(
+                reference=f"bench-{i}", buyer_email=f"buyer{i}@example.com", vehicle_type=v,
+                origin=quotes.PLACES[o], destination=quotes.PLACES[d], status=DeliveryStatus.QUEUED,
+            )
+            for i, v, o, d in orders
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+    dispatch._solver().submit(routing.solve, [], quotes.DISTANCE_KM, 1).result()
+    start = time.perf_counter()
+    routes = dispatch.dispatch_once()
+    elapsed = time.perf_counter() - start
+    dispatch.stop()
+
+    db = SessionLocal()
+    try:
+        assigned = db.query(Delivery).filter(Delivery.status == DeliveryStatus.ASSIGNED).count()
+        assert db.query(Route).count() == routes
+    finally:
+        db.close()
+    return {"dispatch_once_ms": round(elapsed * 1000, 1), "routes": routes, "deliveries_assigned": assigned}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-drop dispatcher benchmark.")
+    parser.add_argument("--orders", type=int, default=1000)
+    parser.add_argument("--bike-share", type=float, default=0.7)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    orders = synthetic_orders(args.orders, args.bike_share, args.seed)
+
+    samples = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        routes = solve_all(orders)
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+
+    batched_hours = sum(
+        driver_hours(v, r["distance_km"], len(r["pickups"]) + len(r["drops"])) for v, r in routes
+    )
+    # Baseline: the old flow, one driver locked per delivery (pickup -> drop)
+    baseline_hours = sum(driver_hours(v, float(quotes.DISTANCE_KM[o, d]), 2) for _, v, o, d in orders)
+
+    report = {
+        "orders": args.orders,
+        "solver_ms": {"p50": round(samples[len(samples) // 2] * 1000, 1), "max": round(samples[-1] * 1000, 1)},
+        "routes": len(routes),
+        "drivers_needed": {"batched": len(routes), "one_per_delivery": args.orders},
+        "deliveries_per_driver_hour": {
+            "batched": round(args.orders / batched_hours, 2),
+            "one_per_delivery": round(args.orders / baseline_hours, 2),
+        },
+        "avg_drops_per_route": {
+            v: round(sum(len(r["drops"]) for rv, r in routes if rv == v) / max(1, sum(rv == v for rv, _ in routes)), 2)
+            for v in VEHICLE_CAPACITY
+        },
+    }
+
+    if os.getenv("DATABASE_URL"):
+        # Enough drivers for every route, so the whole queue is assigned in one window.
+        drivers = {v: sum(rv == v for rv, _ in routes) for v in VEHICLE_CAPACITY}
+        report["end_to_end"] = end_to_end(orders, drivers)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Finance export throughput and memory (no server; the same generator the endpoint streams).
+
+    DATABASE_URL=sqlite:////tmp/bench_exports.db python -m bench.exports --scale large
+
+Seeds first (wipes the database) unless --no-seed.
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from app import exports
+from bench.seed import SCALES, seed
+
+
+def measure(dataset, fmt):
+    start = time.perf_counter()
+    size = sum(len(block) for block in exports.stream_export(dataset, fmt))
+    elapsed = time.perf_counter() - start
+
+    # Second pass for memory: tracemalloc slows every allocation, so it can't share the timed run.
+    tracemalloc.start()
+    for _ in exports.stream_export(dataset, fmt):
+        pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, size, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Finance export benchmark.")
+    parser.add_argument("--scale", choices=SCALES, default="large")
+    parser.add_argument("--no-seed", action="store_true")
+    parser.add_argument("--formats", nargs="+", default=list(exports.FORMATS), choices=list(exports.FORMATS))
+    args = parser.parse_args()
+
+    sizes = SCALES[args.scale]
+    if not args.no_seed:
+        seed(**sizes)
+    rows = {"orders": min(sizes["orders"], sizes["items"]), "withdrawals": 0, "listings": sizes["items"]}
+
+    report = {}
+    for dataset in ("orders", "listings"):
+        for fmt in args.formats:
+            elapsed, size, peak = measure(dataset, fmt)
+            report[f"{dataset}.{fmt}"] = {
+                "rows": rows[dataset],
+                "seconds": round(elapsed, 3),
+                "rows_per_second": int(rows[dataset] / elapsed),
+                "megabytes": round(size / 1e6, 2),
+                "peak_python_mb": round(peak / 1e6, 2),
+            }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
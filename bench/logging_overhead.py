@@ -0,0 +1,99 @@
+"""
+Logging overhead under load: old print() receipts vs the queued JSON logger.
+
+Fires handler-sized calls at a fixed rate from a thread pool the size of
+Starlette's default threadpool and reports per-call latency for each mode.
+Results go to stderr so stdout can be pointed at a slow sink. A stalled log
+collector (the pipe fills up) is where print() hurts:
+
+    python -m bench.logging_overhead --rps 500 --seconds 4 | (sleep 6; cat)
+
+With that sink the print() p99 jumps to seconds while the queued logger stays
+in microseconds; with a fast sink (> /dev/null) both are tens of microseconds.
+"""
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.logs import get_logger, log_event, shutdown_logging
+
+logger = get_logger("bench")
+
+
+def print_receipt(n):
+    # The exact shape of the old MANUAL-mode receipt in initiate_payment.
+    print("🚀 NEW ORDER RECEIVED: Bike for 4.2km")
+    print(f"✅ MANUAL MODE: Skipping Gateway. Collect ₦{420:,.2f}")
+    print("🎯 MATCHED DRIVER: Musa (Bike)")
+    print("\n" + "=" * 50)
+    print(f"📧 EMAIL RECEIPT TO: buyer{n}@example.com")
+    print("SUBJECT: Your FlipTrybe Receipt")
+    print("-" * 50)
+    print("Vehicle: Bike")
+    print("Distance: 4.2km")
+    print("Driver: Musa (Bike) (08011111111)")
+    print(f"TOTAL DUE: ₦{420:,.2f}")
+    print("=" * 50 + "\n")
+
+
+def queued_receipt(n):
+    log_event(logger, "order.received", vehicle_type="Bike", distance_km=4.2)
+    log_event(
+        logger, "receipt.issued",
+        mode="MANUAL", buyer_email=f"buyer{n}@example.com", vehicle_type="Bike",
+        distance_km=4.2, driver_id=1, driver_name="Musa (Bike)", amount_ngn=420,
+    )
+
+
+def run(fn, rps, seconds, workers):
+    latencies = []
+
+    def call(n):
+        start = time.perf_counter()
+        fn(n)
+        latencies.append(time.perf_counter() - start)
+
+    total = int(rps * seconds)
+    gap = 1.0 / rps
+    begin = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for n in range(total):
+            # Open-loop pacing: calls are scheduled on the clock, not when the last one finished.
+            delay = begin + n * gap - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(call, n)
+    elapsed = time.perf_counter() - begin
+
+    latencies.sort()
+    pick = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1e6
+    return {
+        "calls": len(latencies),
+        "achieved_rps": round(len(latencies) / elapsed, 1),
+        "p50_us": round(pick(0.50), 1),
+        "p95_us": round(pick(0.95), 1),
+        "p99_us": round(pick(0.99), 1),
+        "max_us": round(latencies[-1] * 1e6, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rps", type=float, default=500)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--workers", type=int, default=40)
+    args = parser.parse_args()
+
+    results = {
+        "print": run(print_receipt, args.rps, args.seconds, args.workers),
+        "queued": run(queued_receipt, args.rps, args.seconds, args.workers),
+    }
+    sys.stdout.flush()
+    shutdown_logging()
+    print(json.dumps(results, indent=2), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
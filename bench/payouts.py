@@ -0,0 +1,82 @@
+"""
+Payout engine benchmark: thousands of pending withdrawals settled in one run.
+
+    DATABASE_URL=sqlite:////tmp/bench_payouts.db python -m bench.payouts --withdrawals 5000
+
+Wipes the database. Providers:
+- stub:           in-process StubProvider (no network)
+- paystack:       PaystackProvider against the local HTTP stub from bench/run.py (100 per bulk call)
+- paystack_single: same, one transfer per call (what paying withdrawals one at a time costs)
+"""
+import argparse
+import json
+import random
+
+from app import payouts
+from app.database import Base, SessionLocal, engine
+from app.models import User, UserRole, Withdrawal, WithdrawalStatus
+from bench.run import STUB_BANKS, start_gateway_stub
+
+
+def seed_withdrawals(count, agents, bad_share, seed):
+    rng = random.Random(seed)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        db.bulk_save_objects([
+            User(id=n, full_name=f"Agent {n}", phone=f"0809{n:07d}", role=UserRole.AGENT, wallet_balance=0.0)
+            for n in range(1, agents + 1)
+        ])
+        rows = []
+        for n in range(count):
+            amount = round(rng.uniform(1_000, 200_000), -2)
+            account = "12345" if rng.random() < bad_share else f"{rng.randint(0, 9_999_999_999):010d}"
+            rows.append(Withdrawal(
+                agent_id=rng.randint(1, agents),
+                amount_requested=amount,
+                fee_platform=amount * 0.05,
+                amount_net=amount * 0.95,
+                bank_name=rng.choice(STUB_BANKS)["name"],
+                account_number=account,
+                status=WithdrawalStatus.PENDING,
+            ))
+        db.bulk_save_objects(rows)
+        db.commit()
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batched payout benchmark.")
+    parser.add_argument("--withdrawals", type=int, default=5000)
+    parser.add_argument("--agents", type=int, default=500)
+    parser.add_argument("--bad-share", type=float, default=0.02, help="Share of invalid account numbers")
+    parser.add_argument("--parallel", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--providers", nargs="+", default=["stub", "paystack", "paystack_single"])
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    stub, stub_url = start_gateway_stub()
+    report = {}
+    try:
+        for name in args.providers:
+            for parallel in args.parallel:
+                seed_withdrawals(args.withdrawals, args.agents, args.bad_share, args.seed)
+                if name == "stub":
+                    provider = payouts.StubProvider()
+                else:
+                    provider = payouts.PaystackProvider(base_url=stub_url)
+                    if name == "paystack_single":
+                        provider.max_batch = 1
+                summary = payouts.process_payouts(parallel=parallel, provider=provider)
+                summary["withdrawals_per_second"] = int(args.withdrawals / summary["seconds"])
+                report[f"{name}.parallel_{parallel}"] = summary
+    finally:
+        stub.shutdown()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
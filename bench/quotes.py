@@ -0,0 +1,54 @@
+"""
+Quote engine micro-benchmark (no server, no network).
+
+    python -m bench.quotes --pairs 10000
+"""
+import argparse
+import json
+import random
+import time
+
+from app import quotes
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quote engine micro-benchmark.")
+    parser.add_argument("--pairs", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    # Warm the settings cache so we measure pricing, not the first DB read.
+    quotes._settings.update(loaded_at=time.monotonic() + 3600)
+
+    names = quotes.PLACES
+    origins = [random.choice(names) for _ in range(args.pairs)]
+    destinations = [random.choice(names) for _ in range(args.pairs)]
+
+    single_p50, single_p99 = timed(lambda: quotes.quote("Ikeja", "Lekki", "Bike"), args.repeat * 10)
+
+    def batch():
+        o = [quotes.place_index(n) for n in origins]
+        d = [quotes.place_index(n) for n in destinations]
+        quotes.price_batch(o, d, [0] * args.pairs)
+
+    batch_p50, batch_p99 = timed(batch, args.repeat)
+
+    print(json.dumps({
+        "places": len(names),
+        "single_quote_us": {"p50": round(single_p50 * 1e6, 1), "p99": round(single_p99 * 1e6, 1)},
+        f"batch_{args.pairs}_ms": {"p50": round(batch_p50 * 1e3, 2), "p99": round(batch_p99 * 1e3, 2)},
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+"""
+Load benchmark for every API router.
+
+Seeds a synthetic dataset (bench/seed.py) into a throwaway database, starts
+uvicorn against it with a local Paystack stub, hammers each endpoint for a
+fixed duration and writes throughput and latency percentiles to JSON.
+
+    python -m bench.run --scale small --out bench_base.json
+    python -m bench.run --scale small --out bench_head.json
+    python -m bench.run --compare bench_base.json bench_head.json
+    python -m bench.run --sweep-workers 1 2 4 --concurrency 64 --out bench_scaling.json
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CITIES = ["Ikeja", "Ikorodu", "Lekki", "Yaba", "Surulere", "Ajah", "Epe", "Garki", "Ibadan", "Abeokuta"]
+
+
+# --- 1. LOCAL PAYSTACK STUB ---
+STUB_BANKS = [{"name": "GTBank", "code": "058"}, {"name": "Access Bank", "code": "044"}, {"name": "Zenith Bank", "code": "057"}]
+
+
+class _GatewayStub(BaseHTTPRequestHandler):
+    """Answers the Paystack calls the app makes: transaction init, bank list, bulk recipients, bulk transfers."""
+
+    def _reply(self, data, message="OK"):
+        reply = json.dumps({"status": True, "message": message, "data": data}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def do_GET(self):
+        if self.path.startswith("/bank"):
+            return self._reply(STUB_BANKS)
+        self.send_error(404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+
+        if self.path == "/transferrecipient/bulk":
+            success, errors = [], []
+            for r in body.get("batch", []):
+                if len(r["account_number"]) == 10 and r["account_number"].isdigit():
+                    success.append({"recipient_code": f"RCP_{r['bank_code']}_{r['account_number']}", "details": r})
+                else:
+                    errors.append({"error": "Invalid account number", "payload": r})
+            return self._reply({"success": success, "errors": errors})
+
+        if self.path == "/transfer/bulk":
+            return self._reply([
+                {"recipient": t["recipient"], "amount": t["amount"], "currency": "NGN", "reference": t["reference"],
+                 "transfer_code": f"TRF_{t['reference']}", "status": "success"}
+                for t in body.get("transfers", [])
+            ], message=f"{len(body.get('transfers', []))} transfers queued.")
+
+        self._reply({
+            "authorization_url": f"https://checkout.paystack.test/{body.get('reference', 'ref')}",
+            "reference": body.get("reference"),
+        }, message="Authorization URL created")
+
+    def log_message(self, *args):
+        pass
+
+
+def start_gateway_stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _GatewayStub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+# --- 2. SCENARIOS (One per endpoint) ---
+def build_scenarios(ranges):
+    """Each scenario returns (method, path, json_body) for one request."""
+    orders = itertools.count(ranges["orders"][0])
+    last_order = ranges["orders"][1]
+    pick = lambda key: random.randint(*ranges[key])
+
+    def verify():
+        # Each seeded PENDING order can be confirmed once; past that we hit the "already processed" path.
+        order_id = next(orders)
+        if order_id > last_order:
+            order_id = random.randint(*ranges["orders"])
+        return "GET", f"/api/market/verify/{order_id}/confirm", None
+
+    return {
+        "market_feed": lambda: ("GET", "/api/market/feed?user_state=Lagos&user_city=Ikeja", None),
+        # Returning buyer whose cache is 50 listings behind (vs. market_feed's full download)
+        "market_changes": lambda: ("GET", f"/api/market/changes?since={max(1, ranges['items'][1] - 50)}&user_state=Lagos", None),
+        "market_buy_item": lambda: ("POST", "/api/market/buy-item", {
+            "buyer_id": pick("users"), "item_id": pick("items"), "refund_account": "0123456789 GTBank",
+        }),
+        "market_verify": verify,
+        "agent_dashboard": lambda: ("GET", f"/api/agent/dashboard/{pick('agents')}", None),
+        "admin_dashboard_stats": lambda: ("GET", "/api/admin/dashboard-stats", None),
+        "driver_status": lambda: ("GET", f"/api/driver/status/{pick('drivers')}", None),
+        "payment_initiate": lambda: ("POST", "/api/payment/initiate", {
+            "buyer_email": "bench@fliptrybe.com",
+            "vehicle_type": random.choice(["Bike", "Van"]),
+            "origin": random.choice(CITIES),
+            "destination": random.choice(CITIES),
+        }),
+        "payment_quotes_1k": lambda: ("POST", "/api/payment/quotes", {
+            "vehicle_type": "Bike",
+            "pairs": [{"origin": random.choice(CITIES), "destination": random.choice(CITIES)} for _ in range(1000)],
+        }),
+    }
+
+
+# --- 3. LOAD GENERATOR ---
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def drive(base_url, make_request, duration, concurrency, warmup):
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+
+    def worker(deadline, record):
+        session = requests.Session()
+        local = []
+        failed = 0
+        while time.perf_counter() < deadline:
+            method, path, body = make_request()
+            start = time.perf_counter()
+            try:
+                res = session.request(method, base_url + path, json=body, timeout=30)
+                ok = res.status_code < 400
+            except requests.RequestException:
+                ok = False
+            local.append(time.perf_counter() - start)
+            failed += not ok
+        if record:
+            with lock:
+                latencies.extend(local)
+                errors[0] += failed
+
+    for record, seconds in ((False, warmup), (True, duration)):
+        if seconds <= 0:
+            continue
+        deadline = time.perf_counter() + seconds
+        threads = [threading.Thread(target=worker, args=(deadline, record)) for _ in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors[0],
+        "rps": round(len(latencies) / duration, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+# --- 4. SERVER LIFECYCLE ---
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(env, port, workers):
+    cmd = [
+        sys.executable, "-m", "uvicorn", "app.main:app",
+        "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning",
+    ]
+    if workers > 1:
+        cmd += ["--workers", str(workers)]
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL)
+
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(200):
+        try:
+            if requests.get(base_url + "/metrics", timeout=1).ok:
+                return proc, base_url
+        except requests.RequestException:
+            pass
+        if proc.poll() is not None:
+            raise RuntimeError("uvicorn exited during startup")
+        time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError("uvicorn did not become ready")
+
+
+def _run_once(args, sizes, workers):
+    workdir = tempfile.mkdtemp(prefix="fliptrybe-bench-")
+    env = dict(os.environ)
+    env["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    env["COORDINATION_DB"] = os.path.join(workdir, "coord.db")
+    env["RESET_DB_ON_STARTUP"] = "0"
+    env["LOG_LEVEL"] = "WARNING"
+
+    # Seed in a child process so app.database picks up the bench DATABASE_URL, not ours.
+    seed_cmd = [sys.executable, "-c", (
+        "import json, sys; from bench.seed import seed; "
+        f"print(json.dumps(seed(**{sizes!r}, payment_mode='GATEWAY')))"
+    )]
+    seeded = subprocess.run(seed_cmd, cwd=ROOT, env=env, check=True, capture_output=True, text=True)
+    ranges = json.loads(seeded.stdout.strip().splitlines()[-1])
+    print(f"🌱 Seeded {sizes}, starting {workers} worker(s)", file=sys.stderr)
+
+    stub, stub_url = start_gateway_stub()
+    env["PAYSTACK_BASE_URL"] = stub_url
+    proc, base_url = start_server(env, _free_port(), workers)
+
+    scenarios = build_scenarios(ranges)
+    selected = args.only or list(scenarios)
+    results = {}
+    try:
+        for name in selected:
+            results[name] = drive(base_url, scenarios[name], args.duration, args.concurrency, args.warmup)
+            r = results[name]
+            print(f"  {name:<24} {r['rps']:>9} rps  p50 {r['p50_ms']:>8} ms  p95 {r['p95_ms']:>8} ms  "
+                  f"p99 {r['p99_ms']:>8} ms  errors {r['errors']}", file=sys.stderr)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+        stub.shutdown()
+    return results
+
+
+def run(args):
+    from bench.seed import SCALES
+
+    sizes = dict(SCALES[args.scale])
+    for key in sizes:
+        if getattr(args, key) is not None:
+            sizes[key] = getattr(args, key)
+
+    worker_counts = args.sweep_workers or [args.workers]
+    runs = {n: _run_once(args, sizes, n) for n in worker_counts}
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "scale": sizes,
+            "duration_s": args.duration,
+            "concurrency": args.concurrency,
+            "workers": worker_counts[-1],
+        },
+        # --compare always looks here; for a sweep that's the largest worker count.
+        "endpoints": runs[worker_counts[-1]],
+    }
+
+    if args.sweep_workers:
+        # Scaling efficiency: 1.0 means N workers served exactly N x the single-worker throughput.
+        first = worker_counts[0]
+        report["scaling"] = {str(n): r for n, r in runs.items()}
+        report["efficiency"] = {
+            name: {
+                str(n): round(runs[n][name]["rps"] / (runs[first][name]["rps"] * n / first), 2)
+                for n in worker_counts if runs[first][name]["rps"]
+            }
+            for name in runs[first]
+        }
+        print("\n📈 Scaling efficiency (rps relative to linear):", file=sys.stderr)
+        for name, by_workers in report["efficiency"].items():
+            cells = "  ".join(f"{n}w={eff}" for n, eff in by_workers.items())
+            print(f"  {name:<24} {cells}", file=sys.stderr)
+
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"📄 Results written to {args.out}", file=sys.stderr)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# --- 5. COMPARISON MODE ---
+def compare(base_path, head_path, threshold):
+    """Returns the number of regressions (throughput drop or tail-latency rise beyond `threshold`)."""
+    with open(base_path) as f:
+        base = json.load(f)["endpoints"]
+    with open(head_path) as f:
+        head = json.load(f)["endpoints"]
+
+    regressions = 0
+    print(f"{'endpoint':<24} {'rps':>18} {'p95 ms':>20} {'p99 ms':>20}")
+    for name in sorted(set(base) & set(head)):
+        b, h = base[name], head[name]
+        flags = []
+        if b["rps"] and (b["rps"] - h["rps"]) / b["rps"] > threshold:
+            flags.append("rps")
+        for key in ("p95_ms", "p99_ms"):
+            if b[key] and (h[key] - b[key]) / b[key] > threshold:
+                flags.append(key)
+        if h["errors"] > b["errors"]:
+            flags.append("errors")
+        regressions += bool(flags)
+        mark = f"  ❌ REGRESSION ({', '.join(flags)})" if flags else ""
+        print(f"{name:<24} {b['rps']:>8} -> {h['rps']:<8} {b['p95_ms']:>9} -> {h['p95_ms']:<9} "
+              f"{b['p99_ms']:>9} -> {h['p99_ms']:<9}{mark}")
+    for name in sorted(set(base) ^ set(head)):
+        print(f"{name:<24} only in {'base' if name in base else 'head'}")
+    return regressions
+
+
+def main():
+    from bench.seed import SCALES
+
+    parser = argparse.ArgumentParser(description="FlipTrybe API load benchmark.")
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    for key in SCALES["small"]:
+        parser.add_argument(f"--{key}", type=int, default=None, help="Override the scale preset")
+    parser.add_argument("--duration", type=float, default=10, help="Measured seconds per endpoint")
+    parser.add_argument("--warmup", type=float, default=2, help="Unmeasured seconds per endpoint")
+    parser.add_argument("--concurrency", type=int, default=16, help="Client threads")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--sweep-workers", type=int, nargs="+", default=None,
+                        help="Repeat the run for each worker count (e.g. 1 2 4) and report scaling efficiency")
+    parser.add_argument("--database-url", default=None, help="Benchmark against this DB instead of a temp SQLite file")
+    parser.add_argument("--only", nargs="+", default=None, help="Run just these scenarios")
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "HEAD"), help="Diff two result files and exit")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative change that counts as a regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold) else 0)
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Synthetic marketplace data at a configurable scale, written through the real
+models so the benchmarks exercise the same schema the app uses.
+
+    DATABASE_URL=sqlite:////tmp/bench.db python -m bench.seed --scale medium
+"""
+import argparse
+import random
+
+from app.database import Base, SessionLocal, engine
+from app.models import Driver, Item, ItemCategory, ItemChange, ItemChangeKind, Order, OrderStatus, SystemSetting, User, UserRole
+
+# --- 1. GEOGRAPHY (State -> cities) ---
+STATES = {
+    "Lagos": ["Ikeja", "Ikorodu", "Lekki", "Yaba", "Surulere", "Ajah", "Epe", "Badagry"],
+    "Abuja": ["Garki", "Wuse", "Maitama", "Gwarinpa", "Kubwa"],
+    "Rivers": ["Port Harcourt", "Obio-Akpor", "Eleme", "Bonny"],
+    "Oyo": ["Ibadan", "Ogbomosho", "Oyo", "Iseyin"],
+    "Kano": ["Kano", "Fagge", "Nassarawa", "Gwale"],
+    "Enugu": ["Enugu", "Nsukka", "Agbani"],
+    "Ogun": ["Abeokuta", "Ijebu-Ode", "Sagamu", "Ota"],
+    "Kaduna": ["Kaduna", "Zaria", "Kafanchan"],
+}
+# Lagos dominates real traffic, so weight it that way.
+STATE_WEIGHTS = [40, 15, 10, 10, 8, 6, 6, 5]
+
+PRODUCTS = [
+    "iPhone 12", "Samsung TV", "Office Chair", "Gas Cooker", "Deep Freezer", "Generator",
+    "Sofa Set", "Dining Table", "Ceiling Fan", "Laptop", "Standing Mirror", "Wardrobe",
+    "2 Bedroom Flat", "Studio Apartment", "Self-contain", "Mini Flat",
+]
+ADJECTIVES = ["Clean", "Fairly Used", "Neat", "UK Used", "Brand New", "Slightly Used", "Serviced"]
+
+SCALES = {
+    "small": {"users": 200, "agents": 20, "items": 2_000, "orders": 500, "drivers": 20},
+    "medium": {"users": 2_000, "agents": 200, "items": 20_000, "orders": 5_000, "drivers": 100},
+    "large": {"users": 20_000, "agents": 1_000, "items": 100_000, "orders": 50_000, "drivers": 500},
+}
+
+CHUNK = 5_000
+
+
+def _place(rng):
+    state = rng.choices(list(STATES), weights=STATE_WEIGHTS)[0]
+    return state, rng.choice(STATES[state])
+
+
+def _flush(db, rows):
+    db.bulk_save_objects(rows, return_defaults=False)
+    db.commit()
+    rows.clear()
+
+
+# --- 2. SEEDER ---
+def seed(users, agents, items, orders, drivers, payment_mode="GATEWAY", seed_value=42, reset=True):
+    """
+    Fills the database and returns the ID ranges the benchmark needs.
+    IDs are assigned sequentially, so callers can sample from the ranges directly.
+    """
+    rng = random.Random(seed_value)
+    if reset:
+        Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    db = SessionLocal()
+    try:
+        rows = []
+
+        # 1. Agents first, then regular users (IDs 1..agents are agents)
+        for n in range(agents + users):
+            is_agent = n < agents
+            state, city = _place(rng)
+            rows.append(User(
+                id=n + 1,
+                full_name=f"{'Agent' if is_agent else 'User'} {n + 1}",
+                phone=f"0809{n + 1:07d}",
+                email=f"user{n + 1}@bench.fliptrybe.com",
+                role=UserRole.AGENT if is_agent else UserRole.USER,
+                state=state,
+                city=city,
+                rating=round(rng.uniform(2.5, 5.0), 1),
+                wallet_balance=round(rng.uniform(0, 200_000), 2) if is_agent else 0.0,
+            ))
+            if len(rows) >= CHUNK:
+                _flush(db, rows)
+        _flush(db, rows)
+
+        # 2. Items (mostly agent listings, a few direct sellers)
+        prices = []
+        for n in range(items):
+            lister_id = rng.randint(1, agents) if rng.random() < 0.8 else rng.randint(agents + 1, agents + users)
+            state, city = _place(rng)
+            category = ItemCategory.SHORTLET if rng.random() < 0.15 else ItemCategory.DECLUTTER
+            price = round(rng.uniform(5_000, 2_500_000), -2)
+            prices.append(price)
+            is_agent = lister_id <= agents
+            rows.append(Item(
+                id=n + 1,
+                type=category,
+                title=f"{rng.choice(ADJECTIVES)} {rng.choice(PRODUCTS)}",
+                price=price,
+                region=state,
+                city=city,
+                pickup_address=f"{rng.randint(1, 200)} Market Road, {city}",
+                client_name=f"Client {n + 1}",
+                client_phone=f"0701{n + 1:07d}",
+                client_pickup_time="9am - 5pm",
+                commission_agent=price * 0.10 if is_agent else 0.0,
+                commission_platform=price * 0.05,
+                payout_amount=price * (0.85 if is_agent else 0.95),
+                is_sold=False,
+                lister_id=lister_id,
+            ))
+            if len(rows) >= CHUNK:
+                _flush(db, rows)
+        _flush(db, rows)
+
+        # 2b. Change log, as if every item had been listed through the API (change id == item id)
+        for n in range(items):
+            rows.append(ItemChange(id=n + 1, item_id=n + 1, kind=ItemChangeKind.CREATED))
+            if len(rows) >= CHUNK:
+                _flush(db, rows)
+        _flush(db, rows)
+
+        # 3. Orders. All PENDING so /verify has real work to do.
+        for n in range(min(orders, items)):
+            rows.append(Order(
+                id=n + 1,
+                buyer_id=rng.randint(agents + 1, agents + users),
+                item_id=n + 1,
+                amount_paid=prices[n],
+                refund_account_details="0123456789 GTBank",
+                status=OrderStatus.PENDING_CONFIRMATION,
+            ))
+            if len(rows) >= CHUNK:
+                _flush(db, rows)
+        _flush(db, rows)
+
+        # 4. Drivers
+        for n in range(drivers):
+            rows.append(Driver(
+                id=n + 1,
+                name=f"Driver {n + 1}",
+                phone=f"0802{n + 1:07d}",
+                vehicle_type="Van" if n % 3 == 0 else "Bike",
+                status="AVAILABLE",
+            ))
+        _flush(db, rows)
+
+        db.merge(SystemSetting(key="payment_mode", value=payment_mode))
+        db.commit()
+    finally:
+        db.close()
+
+    return {
+        "agents": [1, agents],
+        "users": [agents + 1, agents + users],
+        "items": [1, items],
+        "orders": [1, min(orders, items)],
+        "drivers": [1, drivers],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed a synthetic FlipTrybe dataset.")
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    for key in SCALES["small"]:
+        parser.add_argument(f"--{key}", type=int, default=None)
+    parser.add_argument("--payment-mode", default="GATEWAY", choices=["GATEWAY", "MANUAL"])
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    sizes = dict(SCALES[args.scale])
+    for key in sizes:
+        if getattr(args, key) is not None:
+            sizes[key] = getattr(args, key)
+
+    ranges = seed(**sizes, payment_mode=args.payment_mode, seed_value=args.seed)
+    print(f"✅ Seeded {sizes} -> {ranges}")
+
+
+if __name__ == "__main__":
+    main()
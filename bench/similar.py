@@ -0,0 +1,144 @@
+"""
+"Similar items" index benchmark: build time, memory, query latency and
+incremental refresh at marketplace scale.
+
+    DATABASE_URL=sqlite:////tmp/bench_similar.db python -m bench.similar --scale large
+
+Seeds first (wipes the database) unless --no-seed, then gives every listing a
+generated description so titles alone don't decide the ranking.
+"""
+import argparse
+import json
+import random
+import time
+
+from sqlalchemy import bindparam, update
+
+from app import changes, recommendations
+from app.database import SessionLocal
+from app.models import Item, ItemChange, ItemChangeKind
+from app.routers.market import get_similar_items
+from bench.seed import PRODUCTS, SCALES, STATES, seed
+
+COLOURS = ["black", "white", "grey", "silver", "brown", "blue", "red", "cream"]
+DETAILS = [
+    "no scratches", "comes with charger", "original box", "barely used", "minor dent on the side",
+    "works perfectly", "relocating sale", "negotiable", "tested and trusted", "new battery",
+    "solid wood", "inverter compatible", "energy saving", "pay on delivery", "all accessories included",
+]
+
+
+def describe(rng, title):
+    words = [rng.choice(COLOURS), title.split()[-1].lower()] + rng.sample(DETAILS, 3)
+    return ", ".join(words)
+
+
+def add_descriptions(seed_value):
+    rng = random.Random(seed_value)
+    db = SessionLocal()
+    try:
+        rows = db.query(Item.id, Item.title).all()
+        stmt = update(Item.__table__).where(Item.__table__.c.id == bindparam("b_id")).values(description=bindparam("b_desc"))
+        db.connection().execute(stmt, [{"b_id": r.id, "b_desc": describe(rng, r.title)} for r in rows])
+        db.commit()
+    finally:
+        db.close()
+
+
+def timings(samples):
+    samples = sorted(samples)
+    return {
+        "p50_ms": round(samples[len(samples) // 2] * 1000, 3),
+        "p99_ms": round(samples[int(len(samples) * 0.99)] * 1000, 3),
+    }
+
+
+def measure_queries(item_ids, queries, rng):
+    index_only, endpoint = [], []
+    db = SessionLocal()
+    try:
+        for _ in range(queries):
+            item_id = rng.choice(item_ids)
+            row = db.query(Item.title, Item.description, Item.region).filter(Item.id == item_id).one()
+            start = time.perf_counter()
+            recommendations.index.similar(row.title, row.description, region=row.region, exclude=item_id)
+            index_only.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            get_similar_items(item_id, db=db)
+            endpoint.append(time.perf_counter() - start)
+    finally:
+        db.close()
+    return {"index": timings(index_only), "endpoint": timings(endpoint)}
+
+
+def add_listings(count, rng):
+    """New listings the way the app writes them: item + CREATED change in one transaction."""
+    db = SessionLocal()
+    try:
+        for _ in range(count):
+            title = f"{rng.choice(['Neat', 'Clean', 'Brand New'])} {rng.choice(PRODUCTS)}"
+            item = Item(title=title, description=describe(rng, title), price=50_000.0, region=rng.choice(list(STATES)),
+                        city="Ikeja", lister_id=1, is_sold=False)
+            db.add(item)
+            db.flush()
+            db.add(ItemChange(item_id=item.id, kind=ItemChangeKind.CREATED))
+        db.commit()
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Similar-items index benchmark.")
+    parser.add_argument("--scale", choices=SCALES, default="large")
+    parser.add_argument("--no-seed", action="store_true")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--new-listings", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if not args.no_seed:
+        seed(**SCALES[args.scale])
+        add_descriptions(args.seed)
+    rng = random.Random(args.seed)
+
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        recommendations.index.refresh(db)
+        build = time.perf_counter() - start
+        item_ids = [i for (i,) in db.query(Item.id).filter(Item.is_sold == False).all()]
+    finally:
+        db.close()
+    snap = recommendations.index._snapshot
+    megabytes = sum(a.nbytes for a in (snap.idf, snap.term_ptr, snap.term_rows, snap.term_data,
+                                       snap.row_item, snap.alive, snap.region)) / 1e6
+
+    report = {"items": len(item_ids), "build_seconds": round(build, 2), "index_mb": round(megabytes, 1)}
+    report["cold"] = measure_queries(item_ids, args.queries, rng)
+
+    add_listings(args.new_listings, rng)
+    time.sleep(changes.CHANGES_SETTLE_SECONDS)  # let the new changes settle, as the refresher would
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        recommendations.index.refresh(db)
+        report["refresh_seconds"] = round(time.perf_counter() - start, 3)
+    finally:
+        db.close()
+    report["delta_rows"] = recommendations.index._snapshot.delta_size
+    report["after_refresh"] = measure_queries(item_ids, args.queries, rng)
+
+    sample = rng.choice(item_ids)
+    db = SessionLocal()
+    try:
+        title = db.query(Item.title).filter(Item.id == sample).scalar()
+        matches = get_similar_items(sample, limit=5, db=db)["items"]
+    finally:
+        db.close()
+    report["example"] = {"title": title, "similar": [[row[2], row[-1]] for row in matches]}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+GPS telemetry load: N drivers pinging every 5 s, posting a batch every 15 s.
+
+    DATABASE_URL=sqlite:////tmp/bench_telemetry.db python -m bench.telemetry --drivers 10000
+    DATABASE_URL=sqlite:////tmp/bench_telemetry.db python -m bench.telemetry --drivers 10000 --direct --minutes 10
+
+Wipes the database. Over HTTP it reports the sustained batch rate against the
+rate the fleet needs (drivers / post interval) and the buyer's track read.
+--direct replays --minutes of fleet traffic through the buffer in-process and
+reports ingest cost, flush cost, bytes stored per ping and buffer memory, and
+checks a decoded trail against what was sent.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from sqlalchemy import func
+
+from app import telemetry
+from app.database import Base, SessionLocal, engine
+from app.models import Delivery, DeliveryStatus, Driver, Route, TelemetrySegment
+from bench.run import _free_port, drive, start_server
+
+PING_SECONDS = 5
+POST_SECONDS = 15
+LAGOS = (6.52, 3.37)
+
+
+def seed_fleet(drivers, on_trip_share):
+    """Drivers 1..N; the first on_trip_share of them on an ACTIVE route with one ASSIGNED delivery."""
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    on_trip = int(drivers * on_trip_share)
+    db = SessionLocal()
+    try:
+        db.bulk_save_objects([
+            Driver(id=n, name=f"Driver {n}", phone=f"090{n:08d}", vehicle_type="Bike", status="BUSY" if n <= on_trip else "AVAILABLE")
+            for n in range(1, drivers + 1)
+        ])
+        db.bulk_save_objects([
+            Route(id=n, driver_id=n, vehicle_type="Bike", stops="[]", distance_km=8.0, status="ACTIVE")
+            for n in range(1, on_trip + 1)
+        ])
+        db.bulk_save_objects([
+            Delivery(reference=f"trip-{n}", buyer_email=f"buyer{n}@example.com", vehicle_type="Bike",
+                     distance_km=8.0, amount_ngn=2500, status=DeliveryStatus.ASSIGNED, route_id=n, stop_seq=1)
+            for n in range(1, on_trip + 1)
+        ])
+        db.commit()
+    finally:
+        db.close()
+    return on_trip
+
+
+class Fleet:
+    """Each driver drifts around Lagos at ~30 km/h; batch(d, until) returns its pings since the last batch."""
+
+    def __init__(self, drivers, seed, start):
+        rng = np.random.default_rng(seed)
+        self.lat = LAGOS[0] + rng.uniform(-0.1, 0.1, drivers + 1)
+        self.lon = LAGOS[1] + rng.uniform(-0.1, 0.1, drivers + 1)
+        self.heading = rng.uniform(0, 2 * np.pi, drivers + 1)
+        self.at = np.full(drivers + 1, start)
+        self.rng = random.Random(seed)
+
+    def batch(self, driver_id, until):
+        points = []
+        while self.at[driver_id] + PING_SECONDS <= until:
+            self.at[driver_id] += PING_SECONDS
+            self.heading[driver_id] += self.rng.uniform(-0.3, 0.3)
+            step = 30 / 3.6 * PING_SECONDS / 111_000  # degrees per ping at 30 km/h
+            self.lat[driver_id] += step * np.cos(self.heading[driver_id])
+            self.lon[driver_id] += step * np.sin(self.heading[driver_id])
+            points.append([round(float(self.at[driver_id]), 3), round(float(self.lat[driver_id]), 6),
+                           round(float(self.lon[driver_id]), 6)])
+        return points
+
+
+def run_http(args, on_trip):
+    env = dict(os.environ)
+    env["COORDINATION_DB"] = os.path.join(tempfile.mkdtemp(prefix="fliptrybe-telemetry-"), "coord.db")
+    env["RESET_DB_ON_STARTUP"] = "0"
+    env["LOG_LEVEL"] = "WARNING"
+    proc, base_url = start_server(env, _free_port(), args.workers)
+    fleet = Fleet(args.drivers, args.seed, time.time() - POST_SECONDS)
+
+    def post():
+        driver_id = random.randint(1, args.drivers)
+        # Real time moves on slower than the benchmark posts; keep each batch at 3 pings
+        fleet.at[driver_id] = min(fleet.at[driver_id], time.time() - POST_SECONDS)
+        return "POST", f"/api/driver/{driver_id}/telemetry", {"points": fleet.batch(driver_id, time.time())}
+
+    track = lambda: ("GET", f"/api/driver/track/trip-{random.randint(1, on_trip)}", None)
+    report = {"needed_batches_per_second": round(args.drivers / POST_SECONDS, 1)}
+    try:
+        for name, make_request in (("telemetry_post", post), ("track_read", track)):
+            cpu = _cpu_seconds(proc.pid)
+            report[name] = drive(base_url, make_request, args.duration, args.concurrency, args.warmup)
+            if cpu is not None:
+                # The client shares the machine; server CPU per request is what sizes a node
+                used = _cpu_seconds(proc.pid) - cpu
+                report[name]["server_cpu_ms"] = round(used / (report[name]["requests"] * (1 + args.warmup / args.duration)) * 1000, 3)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+    report["headroom"] = round(report["telemetry_post"]["rps"] / report["needed_batches_per_second"], 2)
+    if "server_cpu_ms" in report["telemetry_post"]:
+        report["fleet_cpu_share"] = round(report["needed_batches_per_second"] * report["telemetry_post"]["server_cpu_ms"] / 1000, 2)
+    report["stored"] = _stored()
+    return report
+
+
+def _cpu_seconds(pid):
+    """User + system CPU of a process (Linux /proc; None elsewhere)."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def run_direct(args, on_trip):
+    """--minutes of the whole fleet, as fast as the buffer takes it; segments close every simulated minute."""
+    start = time.time() - args.minutes * 60 - POST_SECONDS
+    fleet = Fleet(args.drivers, args.seed, start)
+    sent = {1: []}
+    ingest_seconds = flush_seconds = 0.0
+    batches = segments = 0
+    peak_buffered = peak_bytes = 0
+    # Buffer memory is at its peak just before the first flush (a full segment per driver)
+    tracemalloc.start()
+    for tick in range(1, args.minutes * 60 // POST_SECONDS + 1):
+        until = start + tick * POST_SECONDS
+        for driver_id in range(1, args.drivers + 1):
+            points = fleet.batch(driver_id, until)
+            t0 = time.perf_counter()
+            telemetry.recorder.ingest(driver_id, driver_id if driver_id <= on_trip else None, points)
+            ingest_seconds += time.perf_counter() - t0
+            batches += 1
+            if driver_id == 1:
+                sent[1] += points
+        peak_buffered = max(peak_buffered, telemetry.recorder.buffered)
+        if tick % (60 // POST_SECONDS) == 0:
+            if tracemalloc.is_tracing():
+                peak_bytes = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            t0 = time.perf_counter()
+            segments += telemetry.recorder.flush(force=True)
+            flush_seconds += time.perf_counter() - t0
+    t0 = time.perf_counter()
+    segments += telemetry.recorder.flush(force=True)
+    flush_seconds += time.perf_counter() - t0
+
+    db = SessionLocal()
+    try:
+        trail = telemetry.trail(db, 1)
+    finally:
+        db.close()
+    expected = np.array(sent[1])
+    report = {
+        "batches": batches,
+        "batches_per_second": int(batches / ingest_seconds),
+        "needed_batches_per_second": round(args.drivers / POST_SECONDS, 1),
+        "ingest_us_per_batch": round(ingest_seconds / batches * 1e6, 1),
+        "segments": segments,
+        "flush_ms_per_minute": round(flush_seconds / max(1, args.minutes) * 1000, 1),
+        "peak_buffered_pings": peak_buffered,
+        "peak_traced_mb": round(peak_bytes / 2**20, 1),
+        "trail_matches": len(trail["t"]) == len(expected) and bool(
+            np.allclose(trail["lat"], expected[:, 1], atol=1e-5) and np.allclose(trail["lon"], expected[:, 2], atol=1e-5)
+            and np.allclose(trail["t"], expected[:, 0], atol=1e-3)),
+    }
+    report["stored"] = _stored()
+    return report
+
+
+def _stored():
+    """Bytes per stored ping: packed payload only, and with the fixed columns of each segment row."""
+    db = SessionLocal()
+    try:
+        rows, points, payload = db.query(
+            func.count(TelemetrySegment.id), func.sum(TelemetrySegment.points), func.sum(func.length(TelemetrySegment.data))
+        ).one()
+    finally:
+        db.close()
+    if not points:
+        return {"segments": 0, "points": 0}
+    row_overhead = 8 * 8  # id, driver, route, 2 timestamps, count, 2 floats
+    return {"segments": rows, "points": int(points), "payload_bytes_per_ping": round(payload / points, 2),
+            "row_bytes_per_ping": round((payload + rows * row_overhead) / points, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GPS telemetry ingest benchmark.")
+    parser.add_argument("--drivers", type=int, default=10000)
+    parser.add_argument("--on-trip-share", type=float, default=0.8, help="Drivers with an ACTIVE route")
+    parser.add_argument("--duration", type=float, default=10, help="Measured seconds per HTTP scenario")
+    parser.add_argument("--warmup", type=float, default=2)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--minutes", type=int, default=10, help="--direct: simulated fleet minutes")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--direct", action="store_true", help="Skip HTTP: replay fleet traffic through the buffer in-process")
+    args = parser.parse_args()
+    if not os.getenv("DATABASE_URL"):
+        sys.exit("Set DATABASE_URL (the database is wiped)")
+
+    on_trip = seed_fleet(args.drivers, args.on_trip_share)
+    report = run_direct(args, on_trip) if args.direct else run_http(args, on_trip)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Hot/cold tiering benchmark: dashboard and feed latency before and after archiving.
+
+    DATABASE_URL=sqlite:////tmp/bench_tiering.db python -m bench.tiering --scale large --old-share 0.8
+
+Wipes the database. Seeds, then ages `--old-share` of the items (sold) and orders
+(CONFIRMED) past ARCHIVE_AFTER_DAYS, so they qualify for the cold tier.
+"""
+import argparse
+import json
+import time
+
+from sqlalchemy import text
+
+from app import tiering
+from app.database import SessionLocal
+from app.routers.admin import get_dashboard_stats
+from app.routers.agent_office import get_agent_dashboard
+from app.routers.market import get_smart_feed
+from bench.seed import SCALES, seed
+
+OLD = "2000-01-01 00:00:00"
+
+
+def age_rows(old_share):
+    db = SessionLocal()
+    try:
+        buckets = int(old_share * 100)
+        db.execute(text(f"UPDATE items SET is_sold = :yes, created_at = :old WHERE id % 100 < {buckets}"),
+                   {"yes": True, "old": OLD})
+        db.execute(text(f"UPDATE orders SET status = 'CONFIRMED', created_at = :old WHERE id % 100 < {buckets}"),
+                   {"old": OLD})
+        db.execute(text("UPDATE item_changes SET created_at = :old"), {"old": OLD})
+        db.commit()
+    finally:
+        db.close()
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        db = SessionLocal()
+        try:
+            start = time.perf_counter()
+            result = fn(db)
+            samples.append(time.perf_counter() - start)
+        finally:
+            db.close()
+    samples.sort()
+    return round(samples[len(samples) // 2] * 1000, 2), result
+
+
+def measure(agent_id, repeat):
+    report, results = {}, {}
+    for name, fn in {
+        "admin_dashboard": lambda db: get_dashboard_stats(db=db),
+        "agent_dashboard": lambda db: get_agent_dashboard(agent_id, db=db)["stats"],
+        "smart_feed": lambda db: len(get_smart_feed(view_mode="NATIONWIDE", db=db)),
+    }.items():
+        report[f"{name}_ms"], results[name] = timed(fn, repeat)
+    db = SessionLocal()
+    try:
+        for table in ("orders", "items", "withdrawals"):
+            report[f"{table}_hot_rows"] = db.execute(text(f"SELECT count(*) FROM {table}")).scalar()
+    finally:
+        db.close()
+    return report, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hot/cold tiering benchmark.")
+    parser.add_argument("--scale", choices=SCALES, default="large")
+    parser.add_argument("--old-share", type=float, default=0.8)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    ranges = seed(**SCALES[args.scale])
+    age_rows(args.old_share)
+    agent_id = ranges["agents"][0]
+
+    before, before_results = measure(agent_id, args.repeat)
+    archived = tiering.run_archival()
+    after, after_results = measure(agent_id, args.repeat)
+
+    print(json.dumps({
+        "before": before,
+        "archived": archived,
+        "after": after,
+        # Rollups must keep the dashboards' numbers identical
+        "totals_preserved": before_results["agent_dashboard"] == after_results["agent_dashboard"]
+        and before_results["admin_dashboard"]["financials"] == after_results["admin_dashboard"]["financials"],
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Paystack webhook replay: signed charge.success events fired at a real server,
+with every event redelivered (retry storm) and a share of forged signatures.
+
+    DATABASE_URL=sqlite:////tmp/bench_webhooks.db python -m bench.webhooks --events 5000 --retries 3
+
+Wipes the database. Reports ingest throughput / latency, how long the background
+worker takes to apply everything, and checks nothing was applied twice.
+--direct skips HTTP and measures the ingest pipeline on its own.
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import requests
+from sqlalchemy import func
+
+from app import webhooks
+from app.database import Base, SessionLocal, engine
+from app.models import Delivery, DeliveryStatus, PaymentEvent, PaymentEventStatus
+from app.routers.payment import PAYSTACK_SECRET_KEY
+from bench.run import _free_port, percentile, start_server
+
+
+def seed_deliveries(count):
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        db.bulk_save_objects([
+            Delivery(reference=str(uuid.uuid4()), buyer_email=f"buyer{n}@example.com", vehicle_type="Bike",
+                     distance_km=5.0, amount_ngn=2500, status=DeliveryStatus.AWAITING_PAYMENT)
+            for n in range(count)
+        ])
+        db.commit()
+        return [r for (r,) in db.query(Delivery.reference).all()]
+    finally:
+        db.close()
+
+
+def signed_events(references, retries, forged_share, seed):
+    rng = random.Random(seed)
+    events = []
+    for reference in references:
+        body = json.dumps({"event": "charge.success", "data": {
+            "reference": reference, "amount": 250_000, "currency": "NGN", "status": "success",
+        }}).encode()
+        signature = hmac.new(PAYSTACK_SECRET_KEY.encode(), body, hashlib.sha512).hexdigest()
+        events += [(body, signature)] * retries
+        if rng.random() < forged_share:
+            events.append((body, "0" * len(signature)))
+    rng.shuffle(events)
+    return events
+
+
+def replay(base_url, events, concurrency):
+    cursor, latencies, statuses = [0], [], {}
+    lock = threading.Lock()
+
+    def worker():
+        session = requests.Session()
+        local, codes = [], {}
+        while True:
+            with lock:
+                if cursor[0] >= len(events):
+                    break
+                body, signature = events[cursor[0]]
+                cursor[0] += 1
+            start = time.perf_counter()
+            res = session.post(f"{base_url}/api/payment/webhook", data=body, timeout=30,
+                               headers={"x-paystack-signature": signature, "Content-Type": "application/json"})
+            local.append(time.perf_counter() - start)
+            codes[res.status_code] = codes.get(res.status_code, 0) + 1
+        with lock:
+            latencies.extend(local)
+            for code, n in codes.items():
+                statuses[code] = statuses.get(code, 0) + n
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "seconds": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "status_codes": statuses,
+    }
+
+
+def ingest_direct(events):
+    """The same pipeline without HTTP: verify + enqueue + group commit + worker, in-process."""
+    webhooks.start()
+    try:
+        start = time.perf_counter()
+        futures = []
+        for body, signature in events:
+            if webhooks.verify_signature(body, signature, PAYSTACK_SECRET_KEY):
+                data = json.loads(body)["data"]
+                futures.append(webhooks.ingester.submit("charge.success", data["reference"], body.decode()))
+        for future in futures:
+            future.result()
+        stored = time.perf_counter() - start
+        applied = wait_applied(timeout=120)
+    finally:
+        webhooks.stop()
+    return {"events_per_second": int(len(events) / stored), "stored_seconds": round(stored, 3),
+            "applied_after_seconds": applied}
+
+
+def wait_applied(timeout):
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        db = SessionLocal()
+        try:
+            pending = db.query(PaymentEvent).filter(
+                PaymentEvent.status.in_([PaymentEventStatus.RECEIVED, PaymentEventStatus.PROCESSING])
+            ).count()
+        finally:
+            db.close()
+        if not pending:
+            return round(time.perf_counter() - start, 3)
+        time.sleep(0.05)
+    return None
+
+
+def _check(expected):
+    """Every distinct event stored once and applied once."""
+    db = SessionLocal()
+    try:
+        stored = db.query(func.count(PaymentEvent.id)).scalar()
+        queued = db.query(Delivery).filter(Delivery.status == DeliveryStatus.QUEUED).count()
+        return stored == queued == expected
+    finally:
+        db.close()
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Paystack webhook replay benchmark.")
+    parser.add_argument("--events", type=int, default=5000, help="Distinct charge.success events")
+    parser.add_argument("--retries", type=int, default=3, help="Deliveries of each event")
+    parser.add_argument("--forged-share", type=float, default=0.05)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--direct", action="store_true", help="Skip HTTP: measure the ingest pipeline in-process")
+    args = parser.parse_args()
+    if not os.getenv("DATABASE_URL"):
+        sys.exit("Set DATABASE_URL (the database is wiped)")
+
+    references = seed_deliveries(args.events)
+    events = signed_events(references, args.retries, args.forged_share, args.seed)
+    if args.direct:
+        report = ingest_direct(events)
+        report["exactly_once"] = _check(args.events)
+        print(json.dumps(report, indent=2))
+        return
+
+    env = dict(os.environ)
+    env["COORDINATION_DB"] = os.path.join(tempfile.mkdtemp(prefix="fliptrybe-webhooks-"), "coord.db")
+    env["RESET_DB_ON_STARTUP"] = "0"
+    env["LOG_LEVEL"] = "WARNING"
+    proc, base_url = start_server(env, _free_port(), args.workers)
+    try:
+        report = {"ingest": replay(base_url, events, args.concurrency)}
+        report["applied_after_seconds"] = wait_applied(timeout=120)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+    report["exactly_once"] = _check(args.events)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+import os
+import tempfile
+
+# Before anything imports app.database: every test run gets its own SQLite files.
+_tmp = tempfile.mkdtemp(prefix="fliptrybe-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_tmp}/test.db")
+os.environ.setdefault("COORDINATION_DB", f"{_tmp}/coord.db")
@@ -0,0 +1,71 @@
+import pytest
+
+from app import payouts
+from app.database import Base, SessionLocal, engine
+from app.models import User, UserRole, Withdrawal, WithdrawalStatus
+
+
+@pytest.fixture
+def withdrawal_id():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        db.add(User(id=1, full_name="Agent", phone="0809", role=UserRole.AGENT, wallet_balance=0.0))
+        row = Withdrawal(agent_id=1, amount_requested=10_000.0, fee_platform=500.0, amount_net=9_500.0,
+                         bank_name="Test Bank", account_number="0123456789")
+        db.add(row)
+        db.commit()
+        return row.id
+    finally:
+        db.close()
+
+
+class WebhookFirstProvider:
+    """Settles the transfer through the webhook path while the bulk call is in flight, then answers."""
+
+    max_batch = 100
+
+    def __init__(self, webhook_status, answer):
+        self.webhook_status, self.answer = webhook_status, answer
+
+    def bulk_transfer(self, transfers):
+        db = SessionLocal()
+        try:
+            for t in transfers:
+                row = db.get(Withdrawal, int(t["reference"].rsplit("-", 1)[1]))
+                payouts.reconcile(db, [{"reference": t["reference"], "status": self.webhook_status}],
+                                  {t["reference"]: row})
+        finally:
+            db.close()
+        return [{"reference": t["reference"], "status": self.answer} for t in transfers]
+
+    def verify(self, reference):
+        return None
+
+
+def _state(withdrawal_id):
+    db = SessionLocal()
+    try:
+        row = db.get(Withdrawal, withdrawal_id)
+        return row.status, row.processed_at, db.get(User, 1).wallet_balance
+    finally:
+        db.close()
+
+
+def test_failed_webhook_before_reconcile_refunds_once(withdrawal_id):
+    summary = payouts.process_payouts(provider=WebhookFirstProvider("failed", "failed"))
+
+    status, processed_at, balance = _state(withdrawal_id)
+    assert status == WithdrawalStatus.FAILED
+    assert balance == 10_000.0
+    assert summary["failed"] == 0  # the run found it already settled
+
+
+def test_pending_answer_does_not_reopen_settled_withdrawal(withdrawal_id):
+    payouts.process_payouts(provider=WebhookFirstProvider("success", "pending"))
+
+    status, processed_at, balance = _state(withdrawal_id)
+    assert status == WithdrawalStatus.PROCESSED
+    assert processed_at is not None
+    assert balance == 0.0
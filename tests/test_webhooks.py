@@ -0,0 +1,38 @@
+import hashlib
+import hmac
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.routers.payment import PAYSTACK_SECRET_KEY
+
+client = TestClient(app)  # no lifespan: these requests never reach the ingester
+
+
+def _post(body: bytes, signature=None):
+    if signature is None:
+        signature = hmac.new(PAYSTACK_SECRET_KEY.encode(), body, hashlib.sha512).hexdigest()
+    return client.post("/api/payment/webhook", content=body, headers={"x-paystack-signature": signature})
+
+
+def test_non_ascii_signature_is_rejected():
+    # Raw header bytes: the server sees them latin-1 decoded, as it would from any client
+    assert _post(b"{}", signature=("é" * 128).encode("latin-1")).status_code == 401
+
+
+@pytest.mark.parametrize("body", [b"\xff\xfe", b"not json", b"[1, 2]", b'"charge.success"'])
+def test_signed_body_that_is_not_a_json_object_is_400(body):
+    assert _post(body).status_code == 400
+
+
+@pytest.mark.parametrize("body", [
+    b'{"event": "charge.success", "data": ["ref"]}',
+    b'{"event": "charge.success", "data": "ref"}',
+    b'{"event": ["charge.success"], "data": {"reference": "ref"}}',
+    b'{"data": {"reference": "ref"}}',
+])
+def test_signed_object_without_event_and_reference_is_ignored(body):
+    res = _post(body)
+    assert res.status_code == 200
+    assert res.json() == {"status": "ignored"}